@@ -0,0 +1,340 @@
+"""
+Detección de canales de Havers por lotes, sin interfaz gráfica.
+
+Procesa todas las láminas de uno o varios directorios (o patrones glob) con la
+misma cadena que la aplicación: ImageProcessor → YOLOModelManager →
+DataManager. Cada lámina obtiene su propia carpeta de salida y al final se
+muestra un resumen de tiempos.
+
+Ejemplos:
+    python batch_detection.py D:/laminas -o D:/resultados
+    python batch_detection.py "D:/laminas/*.tif" --model weights.pt --format csv --excel
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from detection_core import (
+    config, setup_logging, DirectoryManager, ImageProcessor, SlideReader,
+    YOLOModelManager, DetectionCheckpoint, RunMetrics, DataAnalyzer, DataManager, RESULTS_WRITERS
+)
+
+logger = None
+
+# ============================================================================
+# SELECCIÓN DE LÁMINAS
+# ============================================================================
+
+def collect_slides(inputs: List[str], recursive: bool = False) -> List[str]:
+    """Expande directorios, patrones glob y archivos sueltos en una lista ordenada de láminas."""
+    extensions = tuple(ImageProcessor.VALID_EXTENSIONS)
+    slides = []
+    
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.glob(item, recursive=recursive)
+        
+        slides.extend(path for path in candidates
+                      if os.path.isfile(path) and path.lower().endswith(extensions))
+    
+    # Sin duplicados y en orden estable
+    return sorted(set(os.path.abspath(path) for path in slides))
+
+def slide_output_dirs(output_root: str, slides: List[str]) -> Dict[str, str]:
+    """
+    Carpeta de salida propia de cada lámina dentro de la carpeta raíz.
+    
+    La carpeta lleva el nombre de la lámina sin extensión. Si varias láminas
+    comparten nombre (p. ej. a/lamina1.tif y b/lamina1.tif con --recursive),
+    se añade un hash corto de su ruta para que no se sobrescriban entre sí.
+    """
+    stems = {slide: os.path.splitext(os.path.basename(slide))[0] for slide in slides}
+    counts = Counter(stem.lower() for stem in stems.values())
+    
+    output_dirs = {}
+    for slide, stem in stems.items():
+        if counts[stem.lower()] > 1:
+            digest = hashlib.blake2b(os.path.abspath(slide).encode('utf-8'), digest_size=4).hexdigest()
+            stem = f"{stem}_{digest}"
+        output_dirs[slide] = os.path.join(output_root, stem)
+    return output_dirs
+
+# ============================================================================
+# PROCESAMIENTO DE UNA LÁMINA
+# ============================================================================
+
+def process_slide(slide_path: str, output_dir: str, model_manager: YOLOModelManager,
+                  args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Ejecuta la cadena completa sobre una lámina y devuelve sus tiempos por etapa.
+    
+    Las métricas detalladas (etapas, latencia por segmento y pico de memoria)
+    se guardan además en data/run_metrics.json dentro de la carpeta de la lámina.
+    """
+    config.set_base_dir(output_dir)
+    config.TECHNICAL_DIR = os.path.join(output_dir, "technical")
+    DirectoryManager.initialize_output_directories()
+    
+    metrics = RunMetrics(slide_path)
+    slide = None
+    excel_export = None
+    
+    try:
+        with metrics.stage('lectura'):
+            slide, processed_path = ImageProcessor.open_slide(slide_path, metrics)
+            width, height = ImageProcessor.slide_size(slide)
+        with metrics.stage('segmentacion'):
+            segment_positions, _, _ = ImageProcessor.divide_image_optimized(slide, tile_size=model_manager.input_size())
+        
+        with metrics.stage('deteccion'):
+            checkpoint = DetectionCheckpoint.for_run(slide_path, segment_positions, model_manager)
+            detections = model_manager.process_all_segments(segment_positions, slide=slide,
+                                                            checkpoint=checkpoint, metrics=metrics)
+        
+        with metrics.stage('guardado'):
+            metadata = DataManager.build_run_metadata(slide_path, width, height, model_manager,
+                                                      segment_count=len(segment_positions))
+            data_path, df = DataManager.save_results(detections, metadata)
+            if len(model_manager.raw_detections) > len(detections):
+                DataManager.save_raw_predictions(model_manager.raw_detections, metadata)
+        if checkpoint is not None:
+            checkpoint.discard()
+        if args.excel and len(detections) > 0:
+            excel_export = DataManager.export_excel_in_background(detections, metrics)
+        
+        if not args.no_maps and len(df) > 0:
+            with metrics.stage('mapas'):
+                DataAnalyzer.generate_visualization_optimized(df, processed_path, slide)
+        
+        metrics.finish()
+        metrics.log_summary()
+        if config.SAVE_RUN_METRICS:
+            metrics.save()
+        segments = metrics.segment_summary()
+        peak_rss = metrics.summary()['memory']['peak_rss_mb']
+        roi_stats = model_manager.last_roi_stats or {}
+        roi_recall = model_manager.last_roi_recall or {}
+        
+        return {
+            'slide': slide_path,
+            'status': 'ok',
+            'detections': int(len(detections)),
+            'width': int(width),
+            'height': int(height),
+            'data_path': data_path,
+            'output_dir': output_dir,
+            'excel_export': excel_export,
+            'lectura_s': metrics.stage_seconds('lectura') + metrics.stage_seconds('segmentacion'),
+            'deteccion_s': metrics.stage_seconds('deteccion'),
+            'guardado_s': metrics.stage_seconds('guardado'),
+            'mapas_s': metrics.stage_seconds('mapas'),
+            'segment_p50_ms': segments.get('p50_ms'),
+            'segment_p95_ms': segments.get('p95_ms'),
+            'peak_rss_mb': peak_rss,
+            'roi_skipped_segments': len(roi_stats['skipped_segments']) if roi_stats else None,
+            'roi_recall': roi_recall.get('recall'),
+            'total_s': metrics.wall_seconds()
+        }
+    
+    finally:
+        metrics.finish()
+        if isinstance(slide, SlideReader):
+            slide.close()
+
+def run_parity_check(slide_path: str, model_manager: YOLOModelManager, num_tiles: int) -> bool:
+    """Compara el backend cargado con torch sobre segmentos repartidos por la primera lámina."""
+    slide, _ = ImageProcessor.open_slide(slide_path)
+    try:
+        segment_positions, _, _ = ImageProcessor.divide_image_optimized(slide, tile_size=model_manager.input_size())
+        step = max(1, len(segment_positions) // max(1, num_tiles))
+        sources = [ImageProcessor.materialize_segment(tile.source)
+                   for tile in segment_positions[::step][:num_tiles]]
+        return model_manager.check_backend_parity(sources)['passed']
+    finally:
+        if isinstance(slide, SlideReader):
+            slide.close()
+
+# ============================================================================
+# RESUMEN
+# ============================================================================
+
+def log_summary(results: List[Dict[str, Any]], wall_seconds: float, output_root: str):
+    """Muestra el resumen del lote y lo guarda como batch_summary.csv."""
+    succeeded = [r for r in results if r['status'] == 'ok']
+    failed = [r for r in results if r['status'] != 'ok']
+    
+    logger.info("=" * 60)
+    logger.info(f"📊 RESUMEN DEL LOTE: {len(succeeded)} correctas, {len(failed)} con error, "
+                f"{wall_seconds:.1f} s en total")
+    
+    if succeeded:
+        total_detections = sum(r['detections'] for r in succeeded)
+        mean_seconds = sum(r['total_s'] for r in succeeded) / len(succeeded)
+        logger.info(f"   Detecciones totales: {total_detections:,}")
+        logger.info(f"   Tiempo medio por lámina: {mean_seconds:.1f} s")
+        recalls = [r['roi_recall'] for r in succeeded if r.get('roi_recall') is not None]
+        if recalls:
+            logger.info(f"   Exhaustividad de la detección en dos pasadas: media {sum(recalls) / len(recalls):.1%}, "
+                        f"mínima {min(recalls):.1%}")
+    
+    for result in failed:
+        logger.error(f"   ❌ {os.path.basename(result['slide'])}: {result['error']}")
+    
+    summary = pd.DataFrame([{k: v for k, v in r.items() if k != 'excel_export'} for r in results])
+    summary_path = os.path.join(output_root, 'batch_summary.csv')
+    summary.to_csv(summary_path, index=False)
+    logger.info(f"   Resumen guardado en: {summary_path}")
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Detección de canales de Havers por lotes (sin interfaz gráfica)."
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help="Directorios, patrones glob o archivos de láminas")
+    parser.add_argument('-o', '--output-dir', default=os.path.join(config.BASE_DIR, "batch"),
+                        help="Carpeta raíz de resultados; cada lámina tiene su subcarpeta")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="Buscar láminas también en subdirectorios")
+    parser.add_argument('--model', help="Ruta del modelo YOLO (por defecto, config.MODEL_PATHS)")
+    parser.add_argument('--conf', type=float, default=config.CONFIDENCE_THRESHOLD,
+                        help="Umbral de confianza")
+    parser.add_argument('--floor', type=float, default=config.PREDICTION_FLOOR_THRESHOLD,
+                        help="Umbral con el que se ejecuta el modelo; las predicciones desde él se guardan "
+                             "en raw_predictions para aplicar otros umbrales sin reinferir")
+    parser.add_argument('--batch-size', type=int, default=config.INFERENCE_BATCH_SIZE,
+                        help="Segmentos por llamada al modelo")
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino', 'openvino-int8'],
+                        default=config.INFERENCE_BACKEND,
+                        help="Backend de inferencia (ONNX/OpenVINO se exportan una vez junto a los pesos)")
+    parser.add_argument('--check-parity', type=int, metavar='N', default=0,
+                        help="Antes del lote, comparar el backend con torch en N segmentos de la primera lámina")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Empezar cada lámina de cero aunque tenga un punto de control de una pasada interrumpida")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="No usar la caché de predicciones por segmento")
+    parser.add_argument('--cache-dir', default=config.PREDICTION_CACHE_DIR,
+                        help="Carpeta de la caché de predicciones (compartida entre lotes)")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="No usar el servidor de inferencia local aunque esté en marcha")
+    parser.add_argument('--workers', type=int,
+                        help="Inferencia en N procesos de CPU (0 = según núcleos y RAM)")
+    parser.add_argument('--torch-threads', type=int, default=config.WORKER_TORCH_THREADS,
+                        help="Hilos de torch por proceso de inferencia")
+    parser.add_argument('--no-tissue-mask', action='store_true',
+                        help="Inferir también los segmentos sin tejido (fondo del portaobjetos)")
+    parser.add_argument('--coarse-to-fine', action='store_true',
+                        help="Inferir a resolución completa solo los segmentos con candidatos en una vista general reducida")
+    parser.add_argument('--coarse-scale', type=float, default=config.COARSE_SCALE,
+                        help="Escala de la vista general respecto a la resolución con que el modelo ve los segmentos")
+    parser.add_argument('--roi-recall', action='store_true',
+                        help="Con --coarse-to-fine, inferir también los segmentos omitidos y medir la exhaustividad")
+    parser.add_argument('--tiling', choices=['grid', 'model'], default=config.TILING_MODE,
+                        help="Rejilla fija de NUM_SEGMENTS o segmentos del tamaño de entrada del modelo")
+    parser.add_argument('--mpp', type=float, default=config.SLIDE_MPP,
+                        help="Micras por píxel de las láminas (0 = leer de la cabecera TIFF)")
+    parser.add_argument('--target-mpp', type=float, default=config.TARGET_MPP,
+                        help="Micras por píxel de entrenamiento del modelo (modo model; 0 = nativa)")
+    parser.add_argument('--overlap', type=int, default=config.SEGMENT_OVERLAP_PX,
+                        help="Solape entre segmentos en píxeles")
+    parser.add_argument('--format', choices=sorted(RESULTS_WRITERS), default=config.RESULTS_FORMAT,
+                        help="Formato de la tabla de detecciones")
+    parser.add_argument('--excel', action='store_true',
+                        help="Generar también el Excel (en segundo plano)")
+    parser.add_argument('--no-maps', action='store_true',
+                        help="No generar los mapas de coordenadas y densidad")
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    """Punto de entrada de la línea de comandos; devuelve el código de salida."""
+    global logger
+    args = build_parser().parse_args(argv)
+    
+    output_root = os.path.abspath(args.output_dir)
+    logger = setup_logging(os.path.join(output_root, "batch_detection.log"))
+    
+    config.CONFIDENCE_THRESHOLD = args.conf
+    config.PREDICTION_FLOOR_THRESHOLD = args.floor
+    config.INFERENCE_BATCH_SIZE = args.batch_size
+    config.SEGMENT_OVERLAP_PX = args.overlap
+    config.TILING_MODE = args.tiling
+    config.SLIDE_MPP = args.mpp
+    config.TARGET_MPP = args.target_mpp
+    config.SKIP_BACKGROUND_TILES = not args.no_tissue_mask
+    config.COARSE_TO_FINE = args.coarse_to_fine
+    config.COARSE_SCALE = args.coarse_scale
+    config.ROI_RECALL_REPORT = args.roi_recall
+    config.RESULTS_FORMAT = args.format
+    if args.model:
+        config.MODEL_PATHS = [args.model]
+    if args.workers is not None:
+        config.USE_WORKER_POOL = True
+        config.INFERENCE_WORKERS = args.workers
+    config.WORKER_TORCH_THREADS = args.torch_threads
+    config.INFERENCE_BACKEND = args.backend
+    config.USE_PREDICTION_CACHE = not args.no_cache
+    config.RESUME_RUNS = not args.no_resume
+    config.USE_INFERENCE_DAEMON = not args.no_daemon
+    config.PREDICTION_CACHE_DIR = args.cache_dir
+    
+    slides = collect_slides(args.inputs, args.recursive)
+    if not slides:
+        logger.error("No se encontraron láminas en las rutas indicadas")
+        return 1
+    logger.info(f"🔬 {len(slides)} láminas para procesar → {output_root}")
+    output_dirs = slide_output_dirs(output_root, slides)
+    
+    model_manager = YOLOModelManager()
+    if not model_manager.load_model():
+        logger.error("No se pudo cargar el modelo YOLO")
+        return 1
+    
+    if args.check_parity > 0 and not run_parity_check(slides[0], model_manager, args.check_parity):
+        logger.error("El backend no reproduce las detecciones de torch; lote cancelado")
+        return 3
+    
+    results = []
+    batch_start = time.perf_counter()
+    
+    try:
+        for index, slide_path in enumerate(slides, 1):
+            logger.info(f"▶️ [{index}/{len(slides)}] {os.path.basename(slide_path)}")
+            try:
+                result = process_slide(slide_path, output_dirs[slide_path], model_manager, args)
+                logger.info(f"✅ [{index}/{len(slides)}] {result['detections']:,} detecciones en "
+                            f"{result['total_s']:.1f} s (lectura {result['lectura_s']:.1f} s, "
+                            f"detección {result['deteccion_s']:.1f} s, guardado {result['guardado_s']:.1f} s, "
+                            f"mapas {result['mapas_s']:.1f} s)")
+            except Exception as e:
+                logger.error(f"❌ [{index}/{len(slides)}] Error procesando {slide_path}: {e}")
+                result = {'slide': slide_path, 'status': 'error', 'error': str(e)}
+            results.append(result)
+    finally:
+        model_manager.close_worker_pool()
+    
+    # Esperar a las exportaciones a Excel pendientes antes de cerrar
+    for result in results:
+        if result.get('excel_export') is not None:
+            result['excel_export'].join()
+    
+    log_summary(results, time.perf_counter() - batch_start, output_root)
+    return 0 if all(r['status'] == 'ok' for r in results) else 2
+
+if __name__ == '__main__':
+    sys.exit(main())
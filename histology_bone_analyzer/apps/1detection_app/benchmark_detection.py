@@ -0,0 +1,516 @@
+"""
+Banco de pruebas de rendimiento de la detección con láminas sintéticas.
+
+Genera láminas TIFF del tamaño indicado (de 10 MP a 500 MP) con tejido y
+canales de Havers dibujados como elipses, y mide por separado cada etapa de
+la cadena: decodificación, segmentación, inferencia (con un modelo sustituto
+yolo11n de pesos aleatorios, o el modelo real con --model), post-proceso de
+cajas y escritura. De cada etapa se guarda el tiempo y el pico de memoria
+residente. También se mide el arranque: lo que tarda en importarse cada
+punto de entrada en un intérprete nuevo, frente a STARTUP_BUDGET_S.
+
+Las láminas, el modelo sustituto y la muestra de segmentos inferidos son
+deterministas (semilla fija), así que los informes de distintos commits son
+comparables; `--compare` muestra la relación con un informe anterior.
+
+Ejemplos:
+    python benchmark_detection.py --sizes 10 50 100 -o D:/benchmark
+    python benchmark_detection.py --sizes 10 500 --repeats 5 --compare D:/benchmark/benchmark_ab12cd3.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from detection_core import (
+    config, setup_logging, DirectoryManager, ImageProcessor, SlideReader,
+    YOLOModelManager, RunMetrics, DataManager, DETECTION_DTYPE
+)
+
+logger = None
+
+# Relación de tiempos a partir de la cual una etapa se marca como más lenta en --compare
+REGRESSION_TOLERANCE = 0.10
+# Etapas más rápidas que esto en la referencia: su relación es ruido y no se marcan
+MIN_COMPARABLE_SECONDS = 0.01
+
+# ============================================================================
+# LÁMINAS SINTÉTICAS
+# ============================================================================
+
+SYNTHETIC_TILE = 512
+SYNTHETIC_BACKGROUND = (242, 240, 244)  # RGB del portaobjetos
+SYNTHETIC_TISSUE = (214, 168, 196)      # RGB de la matriz ósea teñida
+SYNTHETIC_RING = (122, 62, 112)         # RGB del borde de cada canal
+SYNTHETIC_LUMEN = (246, 244, 246)       # RGB del interior del canal
+
+def slide_shape(megapixels: float) -> Tuple[int, int]:
+    """(alto, ancho) de una lámina 4:3 de unos `megapixels`, múltiplos del tamaño de tesela del TIFF."""
+    width = np.sqrt(megapixels * 1e6 * 4 / 3)
+    height = width * 3 / 4
+    return (max(1, int(round(height / SYNTHETIC_TILE))) * SYNTHETIC_TILE,
+            max(1, int(round(width / SYNTHETIC_TILE))) * SYNTHETIC_TILE)
+
+def synthetic_slide_path(output_dir: str, megapixels: float, seed: int) -> str:
+    return os.path.join(output_dir, f"synthetic_{megapixels:g}mp_seed{seed}.tif")
+
+def _synthetic_tile(seed: int, tile_y: int, tile_x: int, height: int, width: int,
+                    canal_density: float) -> np.ndarray:
+    """
+    Tesela RGB en (tile_y, tile_x): fondo, tejido dentro de una elipse que
+    ocupa la mayor parte de la lámina y canales (anillo oscuro, luz clara y
+    laminillas concéntricas) repartidos por el tejido.
+    """
+    size = SYNTHETIC_TILE
+    rng = np.random.default_rng([seed, tile_y, tile_x])
+    
+    rows = (np.arange(tile_y, tile_y + size, dtype=np.float32) - height / 2) / (height * 0.45)
+    cols = (np.arange(tile_x, tile_x + size, dtype=np.float32) - width / 2) / (width * 0.45)
+    inside = rows[:, None] ** 2 + cols[None, :] ** 2 <= 1.0
+    
+    tile = np.empty((size, size, 3), dtype=np.uint8)
+    tile[...] = SYNTHETIC_BACKGROUND
+    tile[inside] = SYNTHETIC_TISSUE
+    noise = rng.integers(-6, 7, size=(size, size, 1), dtype=np.int16)
+    tile = np.clip(tile.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    
+    tissue_fraction = inside.mean()
+    canal_count = rng.poisson(canal_density * tissue_fraction)
+    margin = 48
+    for _ in range(canal_count):
+        center = (int(rng.integers(margin, size - margin)), int(rng.integers(margin, size - margin)))
+        if not inside[center[1], center[0]]:
+            continue
+        axes = (int(rng.integers(10, 30)), int(rng.integers(8, 24)))
+        angle = float(rng.uniform(0, 180))
+        for ring in (12, 6):
+            cv2.ellipse(tile, center, (axes[0] + ring, axes[1] + ring), angle, 0, 360, SYNTHETIC_RING, 1)
+        cv2.ellipse(tile, center, axes, angle, 0, 360, SYNTHETIC_RING, -1)
+        cv2.ellipse(tile, center, (max(2, axes[0] - 5), max(2, axes[1] - 5)), angle, 0, 360, SYNTHETIC_LUMEN, -1)
+    return tile
+
+def generate_synthetic_slide(path: str, megapixels: float, seed: int = 0,
+                             canal_density: float = 6.0, mpp: float = 0.5) -> str:
+    """
+    Escribe (si no existe ya) una lámina TIFF por teselas de ~`megapixels` MP.
+    
+    Se genera tesela a tesela, sin tener la lámina entera en memoria; la
+    misma semilla produce siempre la misma lámina. `canal_density` es el
+    número medio de canales por tesela de tejido y `mpp` se guarda en la
+    cabecera (XResolution) para el modo de segmentación 'model'.
+    """
+    import tifffile
+    
+    if os.path.exists(path):
+        return path
+    
+    height, width = slide_shape(megapixels)
+    logger.info(f"🧪 Generando lámina sintética de {width}x{height} ({width * height / 1e6:.0f} MP): {path}")
+    
+    def tiles():
+        for tile_y in range(0, height, SYNTHETIC_TILE):
+            for tile_x in range(0, width, SYNTHETIC_TILE):
+                yield _synthetic_tile(seed, tile_y, tile_x, height, width, canal_density)
+    
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial_path = path + '.tmp'
+    tifffile.imwrite(partial_path, tiles(), shape=(height, width, 3), dtype=np.uint8,
+                     tile=(SYNTHETIC_TILE, SYNTHETIC_TILE), photometric='rgb', bigtiff=True,
+                     resolution=(1e4 / mpp, 1e4 / mpp), resolutionunit='CENTIMETER')
+    os.replace(partial_path, path)
+    return path
+
+# ============================================================================
+# MODELO SUSTITUTO
+# ============================================================================
+
+def build_standin_model(path: str, seed: int = 0) -> str:
+    """
+    Guarda (si no existe ya) un yolo11n con pesos aleatorios de semilla fija.
+    
+    No detecta canales, pero tiene el coste de inferencia de un YOLO pequeño
+    y produce cajas de confianza muy baja, suficientes para medir el
+    post-proceso y la escritura con un umbral bajo (--conf).
+    """
+    from ultralytics import YOLO
+    
+    if os.path.exists(path):
+        return path
+    
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.manual_seed(seed)
+    YOLO('yolo11n.yaml').save(path)
+    logger.info(f"🧪 Modelo sustituto yolo11n (semilla {seed}) guardado en: {path}")
+    return path
+
+# ============================================================================
+# MEDICIÓN DE LAS ETAPAS
+# ============================================================================
+
+def measure(stage: str, function: Callable[[], Any], repeats: int, items: int = None) -> Tuple[Any, Dict[str, float]]:
+    """
+    Ejecuta `function` `repeats` veces y resume su tiempo y pico de memoria.
+    
+    Devuelve el resultado de la última repetición y {seconds (mediana),
+    min_seconds, peak_rss_mb, rss_delta_mb, items, per_item_ms}; el
+    incremento de memoria es respecto a la memoria residente al empezar.
+    """
+    seconds = []
+    peak_rss = start_rss = 0.0
+    result = None
+    for _ in range(max(1, repeats)):
+        result = None
+        metrics = RunMetrics(stage, memory_interval=0.05)
+        with metrics.stage(stage):
+            result = function()
+        metrics.finish()
+        seconds.append(metrics.stage_seconds(stage))
+        start_rss = metrics.start_rss_mb if not start_rss else min(start_rss, metrics.start_rss_mb)
+        peak_rss = max(peak_rss, metrics.peak_rss_mb)
+    
+    median = float(np.median(seconds))
+    summary = {
+        'seconds': median,
+        'min_seconds': float(np.min(seconds)),
+        'peak_rss_mb': peak_rss or None,
+        'rss_delta_mb': (peak_rss - start_rss) if peak_rss else None,
+        'items': items,
+        'per_item_ms': median * 1000 / items if items else None
+    }
+    logger.info(f"   {stage}: {median:.3f} s (mín {summary['min_seconds']:.3f} s)"
+                + (f", {summary['per_item_ms']:.1f} ms/elemento" if items else "")
+                + (f", pico {peak_rss:.0f} MB (+{summary['rss_delta_mb']:.0f} MB)" if peak_rss else ""))
+    return result, summary
+
+def sample_tiles(segment_positions: list, count: int) -> list:
+    """Segmentos repartidos de forma uniforme y determinista por la lámina (todos si count <= 0)."""
+    ordered = sorted(segment_positions, key=lambda x: x[2])
+    if count <= 0 or count >= len(ordered):
+        return ordered
+    return [ordered[int(index)] for index in np.linspace(0, len(ordered) - 1, count)]
+
+def benchmark_slide(slide_path: str, model_manager: YOLOModelManager,
+                    args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Mide cada etapa de la cadena sobre una lámina, por separado.
+    
+    Cada etapa recibe la salida de la anterior ya preparada, de modo que su
+    tiempo no incluye el de las demás. La inferencia, el post-proceso y la
+    escritura trabajan sobre la misma muestra de `args.tiles` segmentos.
+    """
+    stages = {}
+    slide = None
+    try:
+        # Decodificación: imagen completa, o solo la apertura del lector por ventanas (> MAX_PIXELS)
+        def decode():
+            nonlocal slide
+            if isinstance(slide, SlideReader):
+                slide.close()
+            slide = None
+            slide, _ = ImageProcessor.open_slide(slide_path)
+            return slide
+        slide, stages['decodificacion'] = measure('decodificacion', decode, args.repeats)
+        width, height = ImageProcessor.slide_size(slide)
+        
+        # Segmentación: posiciones de los segmentos y lectura de todos ellos (ventanas TIFF incluidas)
+        tile_size = model_manager.input_size()
+        segment_positions, _, _ = ImageProcessor.divide_image_optimized(slide, tile_size=tile_size)
+        
+        def tile():
+            positions, _, _ = ImageProcessor.divide_image_optimized(slide, tile_size=tile_size)
+            for segment in positions:
+                ImageProcessor.materialize_segment(segment.source)
+            return positions
+        _, stages['segmentacion'] = measure('segmentacion', tile, args.repeats, len(segment_positions))
+        
+        if config.SKIP_BACKGROUND_TILES:
+            _, stages['mascara_tejido'] = measure(
+                'mascara_tejido', lambda: ImageProcessor.find_background_segments(slide, segment_positions),
+                args.repeats, len(segment_positions))
+        
+        # Inferencia por lotes sobre la muestra, tras un lote de calentamiento
+        sample = sample_tiles(segment_positions, args.tiles)
+        sources = [ImageProcessor.materialize_segment(segment.source) for segment in sample]
+        batch_size = max(1, config.INFERENCE_BATCH_SIZE)
+        model_manager._predict(sources[:batch_size], args.conf)
+        
+        def infer():
+            results = []
+            for start in range(0, len(sources), batch_size):
+                results.extend(model_manager._predict(sources[start:start + batch_size], args.conf))
+            return results
+        results, stages['inferencia'] = measure('inferencia', infer, args.repeats, len(sample))
+        
+        # Post-proceso: cajas a coordenadas globales y NMS global
+        def postprocess():
+            detections = [model_manager._calculate_centers_and_areas(result.boxes, segment.start_x, segment.start_y,
+                                                                     segment.segment_id, segment.scale)
+                          for segment, result in zip(sample, results)
+                          if result.boxes is not None and len(result.boxes) > 0]
+            detections = np.concatenate(detections) if detections else np.empty(0, dtype=DETECTION_DTYPE)
+            return YOLOModelManager.merge_overlapping_detections(detections)
+        detections, stages['postproceso'] = measure('postproceso', postprocess, args.repeats, len(sample))
+        
+        # Escritura: imágenes anotadas de la muestra y tabla de detecciones
+        def write():
+            for segment, result in zip(sample, results):
+                YOLOModelManager._write_annotated_image(result, segment.segment_id)
+            DataManager.save_results(detections, DataManager.build_run_metadata(
+                slide_path, width, height, model_manager, args.conf, len(segment_positions)))
+        _, stages['escritura'] = measure('escritura', write, args.repeats, len(sample))
+        
+        return {
+            'slide': os.path.basename(slide_path),
+            'width': int(width),
+            'height': int(height),
+            'megapixels': width * height / 1e6,
+            'windowed_reader': isinstance(slide, SlideReader),
+            'segments': len(segment_positions),
+            'sampled_segments': len(sample),
+            'detections': int(len(detections)),
+            'stages': stages
+        }
+    
+    finally:
+        if isinstance(slide, SlideReader):
+            slide.close()
+
+# ============================================================================
+# ARRANQUE
+# ============================================================================
+
+# Puntos de entrada cuyo import se mide y dependencias que no deberían cargar todavía
+STARTUP_MODULES = ('detection_core', 'batch_detection', 'improved_detection_app')
+HEAVY_MODULES = ('torch', 'ultralytics', 'matplotlib')
+
+def measure_startup(repeats: int, work_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Tiempo de import de cada punto de entrada en un intérprete nuevo.
+    
+    Se compara el mejor tiempo con STARTUP_BUDGET_S y se anota qué
+    dependencias pesadas quedaron importadas (ninguna, mientras no se cargue
+    el modelo ni se dibujen mapas). La creación de la ventana Tk no se mide
+    aquí; la aplicación registra ese tiempo al mostrar la pantalla principal.
+    """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app_dir, os.environ.get('PYTHONPATH')])))
+    startup = {}
+    
+    for module in STARTUP_MODULES:
+        code = (f"import json, sys, time; start = time.perf_counter(); import {module}; "
+                f"print(json.dumps([time.perf_counter() - start, "
+                f"[name for name in {HEAVY_MODULES!r} if name in sys.modules]]))")
+        seconds = []
+        for _ in range(max(1, repeats)):
+            output = subprocess.run([sys.executable, '-c', code], cwd=work_dir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            elapsed, heavy_modules = json.loads(output.strip().splitlines()[-1])
+            seconds.append(elapsed)
+        
+        best = float(np.min(seconds))
+        startup[module] = {
+            'seconds': float(np.median(seconds)),
+            'min_seconds': best,
+            'heavy_modules': heavy_modules,
+            'within_budget': best <= config.STARTUP_BUDGET_S
+        }
+        status = "✅" if startup[module]['within_budget'] else "⚠️"
+        logger.info(f"   {status} import {module}: {best:.2f} s (presupuesto {config.STARTUP_BUDGET_S:.1f} s)"
+                    + (f", importa {', '.join(heavy_modules)}" if heavy_modules else ""))
+    return startup
+
+# ============================================================================
+# INFORME Y COMPARACIÓN
+# ============================================================================
+
+def git_commit() -> Dict[str, Any]:
+    """Commit del árbol medido (None fuera de un repositorio git) y si tiene cambios sin confirmar."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+def environment_info() -> Dict[str, Any]:
+    """Máquina y bibliotecas: dos informes solo son comparables si coinciden."""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.is_available(),
+        'opencv': cv2.__version__
+    }
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any],
+                    tolerance: float = REGRESSION_TOLERANCE) -> int:
+    """
+    Registra la relación de tiempos (actual / referencia) por lámina y etapa.
+    
+    Se compara el mejor tiempo de cada etapa (el menos afectado por otras
+    cargas de la máquina), y el del arranque como si fuera otra lámina.
+    Devuelve el número de etapas más lentas que la referencia en más de
+    `tolerance` (fracción).
+    """
+    baseline_slides = {slide['slide']: slide for slide in baseline.get('slides', [])}
+    current_slides = list(report['slides'])
+    if report.get('startup'):
+        current_slides.append({'slide': 'arranque', 'stages': report['startup']})
+        if baseline.get('startup'):
+            baseline_slides['arranque'] = {'slide': 'arranque', 'stages': baseline['startup']}
+    regressions = 0
+    
+    logger.info("=" * 60)
+    logger.info(f"📊 COMPARACIÓN con {baseline.get('commit') or 'referencia'}: "
+                f"actual {report.get('commit') or 'sin commit'}")
+    if baseline.get('environment', {}).get('cpu_count') != report['environment']['cpu_count']:
+        logger.warning("⚠️ Los informes son de máquinas distintas: los tiempos no son comparables")
+    
+    for slide in current_slides:
+        reference = baseline_slides.get(slide['slide'])
+        if reference is None:
+            logger.info(f"   {slide['slide']}: sin referencia")
+            continue
+        for stage, current in slide['stages'].items():
+            previous = reference['stages'].get(stage)
+            if not previous or not previous['min_seconds']:
+                continue
+            ratio = current['min_seconds'] / previous['min_seconds']
+            slower = ratio > 1 + tolerance and previous['min_seconds'] >= MIN_COMPARABLE_SECONDS
+            regressions += int(slower)
+            logger.info(f"   {'⚠️' if slower else '  '} {slide['slide']} {stage}: {previous['min_seconds']:.3f} s → "
+                        f"{current['min_seconds']:.3f} s (x{ratio:.2f})")
+    return regressions
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Mide cada etapa de la detección sobre láminas sintéticas de tamaño configurable."
+    )
+    parser.add_argument('--sizes', type=float, nargs='*', default=[10, 50],
+                        help="Tamaños de lámina en megapíxeles (p. ej. 10 100 500; sin valores, solo el arranque)")
+    parser.add_argument('-o', '--output', default=os.path.join(config.BASE_DIR, 'benchmark'),
+                        help="Carpeta de las láminas sintéticas, el modelo sustituto y los informes")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla de las láminas y del modelo sustituto")
+    parser.add_argument('--repeats', type=int, default=3, help="Repeticiones de cada etapa (se guarda la mediana)")
+    parser.add_argument('--tiles', type=int, default=24,
+                        help="Segmentos inferidos, post-procesados y escritos por lámina (0 = todos)")
+    parser.add_argument('--model', help="Pesos a medir en lugar del modelo sustituto yolo11n")
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino', 'openvino-int8'],
+                        help="Backend de inferencia (por defecto, config.INFERENCE_BACKEND)")
+    parser.add_argument('--batch-size', type=int, help="Segmentos por llamada al modelo")
+    parser.add_argument('--conf', type=float,
+                        help="Umbral de confianza de la inferencia (por defecto 1e-4 con el modelo "
+                             "sustituto, para que haya cajas; el umbral de suelo con --model)")
+    parser.add_argument('--threads', type=int, help="Hilos de torch (fíjalo para comparar entre máquinas)")
+    parser.add_argument('--compare', help="Informe JSON anterior con el que comparar")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="Termina con código 4 si alguna etapa es más lenta que en --compare "
+                             "o si el arranque supera STARTUP_BUDGET_S")
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    """Punto de entrada del banco de pruebas; devuelve el código de salida."""
+    global logger
+    
+    args = build_parser().parse_args(argv)
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    logger = setup_logging(os.path.join(output_dir, 'benchmark_detection.log'))
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    if args.backend:
+        config.INFERENCE_BACKEND = args.backend
+    if args.batch_size:
+        config.INFERENCE_BATCH_SIZE = args.batch_size
+    if args.conf is None:
+        args.conf = YOLOModelManager.prediction_floor_threshold() if args.model else 1e-4
+    
+    # La caché devolvería predicciones guardadas en lugar de medir el modelo, y el
+    # servidor de inferencia mediría otro proceso
+    config.USE_PREDICTION_CACHE = False
+    config.USE_INFERENCE_DAEMON = False
+    config.MODEL_PATHS = [args.model or build_standin_model(
+        os.path.join(output_dir, f"standin_yolo11n_seed{args.seed}.pt"), args.seed)]
+    
+    # Las salidas de la etapa de escritura van a una carpeta propia del banco de pruebas
+    config.set_base_dir(os.path.join(output_dir, 'run'))
+    config.TECHNICAL_DIR = os.path.join(output_dir, 'run', 'technical')
+    DirectoryManager.initialize_output_directories()
+    
+    logger.info("▶️ Arranque")
+    startup = measure_startup(args.repeats, output_dir)
+    over_budget = [module for module, result in startup.items() if not result['within_budget']]
+    
+    model_manager = YOLOModelManager()
+    if not model_manager.load_model():
+        logger.error("No se pudo cargar el modelo")
+        return 1
+    
+    report = {
+        **git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'settings': {
+            'seed': args.seed,
+            'repeats': args.repeats,
+            'tiles': args.tiles,
+            'model': 'standin-yolo11n' if not args.model else os.path.basename(args.model),
+            'backend': model_manager.backend,
+            'batch_size': config.INFERENCE_BATCH_SIZE,
+            'conf': args.conf,
+            'tiling_mode': config.TILING_MODE,
+            'num_segments': config.NUM_SEGMENTS,
+            'max_pixels': config.MAX_PIXELS,
+            'startup_budget_s': config.STARTUP_BUDGET_S
+        },
+        'startup': startup,
+        'slides': []
+    }
+    
+    for megapixels in args.sizes:
+        slide_path = generate_synthetic_slide(synthetic_slide_path(output_dir, megapixels, args.seed),
+                                              megapixels, args.seed)
+        logger.info(f"▶️ {os.path.basename(slide_path)}")
+        report['slides'].append(benchmark_slide(slide_path, model_manager, args))
+    
+    report_path = os.path.join(output_dir, f"benchmark_{report['commit'] or 'local'}"
+                                           f"{'-dirty' if report['dirty'] else ''}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"📝 Informe guardado en: {report_path}")
+    
+    regressions = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_reports(report, json.load(f))
+        if regressions:
+            logger.warning(f"⚠️ {regressions} etapas más lentas que la referencia (> {REGRESSION_TOLERANCE:.0%})")
+    if over_budget:
+        logger.warning(f"⚠️ Arranque por encima del presupuesto de {config.STARTUP_BUDGET_S:.1f} s: "
+                       f"{', '.join(over_budget)}")
+    if args.fail_on_regression and (regressions or over_budget):
+        return 4
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
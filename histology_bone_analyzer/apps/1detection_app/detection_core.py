@@ -0,0 +1,4404 @@
+"""
+Núcleo de detección de canales de Havers sin interfaz gráfica.
+
+Contiene la configuración, la lectura y segmentación de láminas, la
+inferencia YOLO, el análisis y el guardado de resultados. Lo usan tanto la
+aplicación Tkinter (improved_detection_app.py) como el procesamiento por
+lotes desde línea de comandos (batch_detection.py); no importa tkinter.
+
+torch, ultralytics y matplotlib se importan la primera vez que se usan (al
+cargar el modelo, inferir o dibujar los mapas), no al importar el módulo: la
+ventana y las herramientas de línea de comandos arrancan sin esperar a ellas.
+"""
+
+import os
+import cv2
+import shutil
+import pandas as pd
+import numpy as np
+from math import ceil, floor, pi
+from pathlib import Path
+from typing import List, Tuple, Optional, Dict, Any, NamedTuple, Set, Union, TYPE_CHECKING
+import logging
+import sys
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from collections import deque
+import gc
+import hashlib
+import json
+import queue
+import threading
+import time
+
+if TYPE_CHECKING:
+    from ultralytics.engine.results import Results
+
+# ============================================================================
+# CONFIGURACIÓN GLOBAL Y CONSTANTES
+# ============================================================================
+
+# Raíz del proyecto (histology_bone_analyzer), a la que se reubican las rutas por defecto
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@dataclass
+class Config:
+    """Configuración centralizada de la aplicación."""
+    # Directorios base
+    BASE_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\data\sample_results\detection_app"
+    TECHNICAL_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\docs\technical"
+    RECONSTRUCTED_IMAGES_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\data\sample_images"
+    
+    # Configuración de modelo
+    MODEL_PATHS: List[str] = None
+    CONFIDENCE_THRESHOLD: float = 0.4
+    PREDICTION_FLOOR_THRESHOLD: float = 0.05  # El modelo se ejecuta con este umbral; CONFIDENCE_THRESHOLD se aplica después
+    MAX_PIXELS: int = 178956970
+    NUM_SEGMENTS: int = 150
+    SEGMENT_COLS: int = 15
+    
+    # Configuración de segmentación
+    TILING_MODE: str = 'grid'  # 'grid' (NUM_SEGMENTS en SEGMENT_COLS columnas) o 'model' (segmentos del tamaño de entrada del modelo)
+    MODEL_INPUT_SIZE: int = 0  # Lado del segmento en modo 'model', en píxeles de red (0 = imgsz del modelo)
+    SLIDE_MPP: float = 0.0  # Micras por píxel de las láminas (0 = leer de la cabecera TIFF, si existe)
+    TARGET_MPP: float = 0.0  # Micras por píxel con las que se entrenó el modelo (0 = resolución nativa)
+    SAVE_SEGMENTS_TO_DISK: bool = False  # Solo depuración: escribe segment_N.png en images_segmented
+    INFERENCE_BATCH_SIZE: int = 8  # Segmentos por llamada al modelo (1 = secuencial)
+    SAVE_RESIZED_IMAGE: bool = False  # Escribe la copia *_resized junto a la original
+    USE_WINDOWED_TIFF_READER: bool = True  # TIFF > MAX_PIXELS se leen por ventanas a resolución nativa
+    THUMBNAIL_MAX_SIDE: int = 8192  # Lado máximo de la miniatura usada como fondo de los mapas
+    ASYNC_IMAGE_WRITER: bool = True  # Renderiza y escribe result_XXX.png en segundo plano
+    IMAGE_WRITER_WORKERS: int = 2
+    IMAGE_WRITER_MAX_PENDING: int = 16  # Imágenes en cola antes de frenar la inferencia
+    USE_STREAMING_PIPELINE: bool = True  # Extracción, inferencia, post-proceso y escritura concurrentes
+    PIPELINE_QUEUE_SIZE: int = 16  # Capacidad de cada cola entre etapas
+    SEGMENT_OVERLAP_PX: int = 0  # Solape entre segmentos vecinos (0 = rejilla sin solape)
+    MERGE_IOU_THRESHOLD: float = 0.45  # IoU de la NMS global que fusiona detecciones duplicadas
+    
+    # Configuración de la máscara de tejido (segmentos de fondo)
+    SKIP_BACKGROUND_TILES: bool = True  # Los segmentos sin tejido no pasan por el modelo
+    TISSUE_THUMBNAIL_MAX_SIDE: int = 1024  # Lado máximo de la miniatura sobre la que se calcula la máscara
+    TISSUE_MIN_FRACTION: float = 0.02  # Fracción mínima de tejido para inferir un segmento
+    TISSUE_MIN_CONTRAST: float = 20.0  # Separación mínima entre las clases de Otsu (niveles 0-255)
+    TISSUE_MORPH_KERNEL: int = 5  # Núcleo (px de miniatura) de cierre/apertura y margen alrededor del tejido
+    
+    # Configuración de la detección en dos pasadas (vista general → segmentos a resolución completa)
+    COARSE_TO_FINE: bool = False  # Solo se infieren los segmentos con candidatos en la vista general reducida
+    COARSE_SCALE: float = 0.5  # Escala de la vista general respecto a la resolución con que el modelo ve los segmentos
+    COARSE_MAX_INFERENCE_RATIO: float = 0.5  # Sin pasada gruesa si necesita más de esta fracción de las inferencias del modo completo
+    COARSE_CONFIDENCE_THRESHOLD: float = 0.1  # Umbral de los candidatos (nunca por encima de CONFIDENCE_THRESHOLD)
+    COARSE_MIN_CANDIDATES: int = 1  # Candidatos mínimos en un segmento (más su margen) para inferirlo
+    COARSE_ROI_MARGIN_PX: int = 64  # Margen (px de lámina) alrededor de cada segmento al contar candidatos
+    COARSE_DENSITY_MAX_SIDE: int = 1024  # Lado máximo del mapa de densidad de candidatos
+    ROI_RECALL_REPORT: bool = False  # Infiere también los segmentos omitidos y mide la exhaustividad frente al modo completo
+    
+    # Configuración del backend de inferencia
+    INFERENCE_BACKEND: str = 'torch'  # 'torch', 'onnx', 'openvino' u 'openvino-int8' (exportado junto a los pesos)
+    EXPORT_IMGSZ: int = 640  # Tamaño de entrada de referencia de la exportación
+    PARITY_MIN_IOU: float = 0.99  # IoU mínimo por caja en la comprobación de paridad con torch
+    PARITY_MAX_CONF_DIFF: float = 1e-3  # Diferencia máxima de confianza en la paridad
+    INT8_CALIBRATION_TILES: int = 300  # Segmentos de nuestras láminas para calibrar la cuantización INT8
+    INT8_EVALUATION_TILES: int = 100  # Segmentos (distintos) del informe de precisión INT8 vs FP32
+    
+    # Configuración de los puntos de control por segmento
+    CHECKPOINT_RUNS: bool = True  # Añade cada segmento terminado a DATA_DIR/detection_checkpoint.jsonl
+    RESUME_RUNS: bool = True  # Si el punto de control corresponde a la misma pasada, continúa desde él
+    
+    # Configuración de las métricas de la ejecución
+    SAVE_RUN_METRICS: bool = True  # Escribe DATA_DIR/run_metrics.json (tiempos por etapa, latencias, memoria)
+    METRICS_MEMORY_INTERVAL_S: float = 0.25  # Periodo del muestreo de memoria residente (0 = solo al cerrar etapas)
+    STARTUP_BUDGET_S: float = 1.5  # Tiempo máximo hasta la ventana principal interactiva (y por import en el benchmark)
+    
+    # Configuración de la caché de predicciones por segmento
+    USE_PREDICTION_CACHE: bool = True  # Reutiliza las predicciones de segmentos ya vistos
+    PREDICTION_CACHE_DIR: str = None  # Por defecto BASE_DIR/prediction_cache (compartida entre láminas)
+    PREDICTION_CACHE_MAX_MB: float = 512.0  # Al superarlo se eliminan las entradas usadas hace más tiempo
+    
+    # Configuración del pool de procesos de inferencia (solo CPU)
+    USE_WORKER_POOL: bool = False  # Un modelo por proceso, segmentos por memoria compartida
+    INFERENCE_WORKERS: int = 0  # Procesos del pool (0 = según núcleos y RAM disponible)
+    WORKER_TORCH_THREADS: int = 2  # Hilos de torch por proceso
+    WORKER_MEMORY_MB: int = 1024  # RAM estimada por proceso (modelo + tensores)
+    WORKER_MEMORY_FRACTION: float = 0.6  # Fracción de la RAM disponible que puede ocupar el pool
+    
+    # Configuración del servidor de inferencia local (inference_daemon.py)
+    USE_INFERENCE_DAEMON: bool = True  # Usa el servidor si está en marcha; si no, el modelo se carga en el proceso
+    INFERENCE_DAEMON_ADDRESS: str = '127.0.0.1:47615'  # 'host:puerto', ruta de un socket Unix o tubería con nombre (\\.\pipe\...)
+    INFERENCE_DAEMON_KEY_FILE: str = None  # Clave de las conexiones (por defecto ~/.havers_inference_daemon.key)
+    INFERENCE_DAEMON_CONNECT_TIMEOUT_S: float = 2.0  # Espera máxima de la comprobación de salud al conectar
+    INFERENCE_DAEMON_TIMEOUT_S: float = 600.0  # Espera máxima de un lote, incluida la cola del servidor
+    
+    # Configuración de la distancia media entre canales
+    DISTANCE_METHOD: str = 'auto'  # 'exact', 'sampled' o 'auto'
+    DISTANCE_MEMORY_MB: float = 64.0  # Memoria máxima de los bloques del cálculo exacto
+    DISTANCE_EXACT_MAX_POINTS: int = 20000  # En modo 'auto', exacto hasta este número de centros
+    DISTANCE_SAMPLE_PAIRS: int = 200000  # Pares aleatorios del estimador por muestreo
+    DISTANCE_SAMPLE_SEED: Optional[int] = 0  # Semilla del muestreo (None = aleatoria)
+    RESCORE_DISTANCE_METHOD: str = 'sampled'  # Método al recalcular con otro umbral en la pantalla de resultados
+    
+    # Configuración de salida de datos
+    RESULTS_FORMAT: str = 'parquet'  # 'parquet', 'feather' o 'csv' (sin pyarrow se usa CSV)
+    EXPORT_EXCEL: bool = True  # Genera además el Excel en segundo plano
+    
+    # Configuración visual
+    BACKGROUND_COLOR: str = '#000000'
+    BUTTON_COLOR: str = '#BD0000'
+    BUTTON_HOVER_COLOR: str = '#333333'
+    TEXT_COLOR: str = 'white'
+    
+    # Configuración de visualización
+    MAP_MAX_SIDE: int = 4096  # Lado máximo (px) del raster de cada mapa
+    MAP_POINT_RADIUS_FRACTION: float = 0.002  # Radio de los puntos respecto al lado mayor del raster
+    DPI: int = 150  # Resolución de ejes y leyendas; el raster se guarda píxel a píxel
+    HEATMAP_BINS: int = 100
+    
+    def __post_init__(self):
+        if self.MODEL_PATHS is None:
+            self.MODEL_PATHS = [
+                r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\models\weights.pt",
+                r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\workspace\runs\detect\train\weights\weights.pt",
+                os.path.join(PROJECT_DIR, "models", "weights.pt")
+            ]
+        
+        self.BASE_DIR = self._local_path(self.BASE_DIR, "data", "sample_results", "detection_app")
+        self.TECHNICAL_DIR = self._local_path(self.TECHNICAL_DIR, "docs", "technical")
+        self.RECONSTRUCTED_IMAGES_DIR = self._local_path(self.RECONSTRUCTED_IMAGES_DIR, "data", "sample_images")
+        
+        if self.PREDICTION_CACHE_DIR is None:
+            self.PREDICTION_CACHE_DIR = os.path.join(self.BASE_DIR, "prediction_cache")
+        
+        if self.INFERENCE_DAEMON_KEY_FILE is None:
+            self.INFERENCE_DAEMON_KEY_FILE = os.path.join(os.path.expanduser("~"), ".havers_inference_daemon.key")
+        
+        # Crear rutas derivadas
+        self.set_base_dir(self.BASE_DIR)
+    
+    @staticmethod
+    def _local_path(path: str, *project_parts: str) -> str:
+        """
+        `path` si su carpeta padre existe en este equipo; si no, la misma carpeta dentro de PROJECT_DIR.
+        
+        Las rutas por defecto son de Windows: en otro equipo no existen y en
+        Linux/macOS ni siquiera son absolutas (se crearían como una carpeta
+        con ese nombre dentro del directorio de trabajo).
+        """
+        if os.path.isabs(path) and os.path.isdir(os.path.dirname(path)):
+            return path
+        return os.path.join(PROJECT_DIR, *project_parts)
+    
+    def set_base_dir(self, base_dir: str):
+        """Cambia el directorio base y recalcula las rutas derivadas (p. ej. una carpeta por lámina)."""
+        self.BASE_DIR = base_dir
+        self.IMAGES_SEGMENTED_DIR = os.path.join(self.BASE_DIR, "images_segmented")
+        self.OUTPUT_DIR = os.path.join(self.BASE_DIR, "segmented_results")
+        self.RESULTS_DIR = os.path.join(self.BASE_DIR, "results")
+        self.EXCEL_DIR = os.path.join(self.BASE_DIR, "excel")
+        self.DATA_DIR = os.path.join(self.BASE_DIR, "data")
+
+# Instancia global de configuración
+config = Config()
+
+# ============================================================================
+# CONFIGURACIÓN DE LOGGING
+# ============================================================================
+
+def setup_logging(log_file: str = None) -> logging.Logger:
+    """
+    Configura el sistema de logging para mejor seguimiento de errores.
+    
+    La llama el punto de entrada (interfaz o línea de comandos); importar este
+    módulo no añade handlers.
+    """
+    if log_file is None:
+        log_file = os.path.join(config.BASE_DIR, "detection_app.log")
+    Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+    return logging.getLogger(__name__)
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# GESTIÓN DE MEMORIA Y RECURSOS
+# ============================================================================
+
+class MemoryManager:
+    """Gestiona la memoria de forma eficiente durante el procesamiento."""
+    
+    @staticmethod
+    def clear_cache():
+        """Limpia la caché de memoria."""
+        gc.collect()
+        # Sin torch importado todavía no hay caché de CUDA que vaciar
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
+    @staticmethod
+    def get_memory_usage():
+        """Obtiene el uso actual de memoria."""
+        try:
+            import psutil
+            process = psutil.Process(os.getpid())
+            return process.memory_info().rss / 1024 / 1024  # MB
+        except ImportError:
+            return 0.0
+    
+    @staticmethod
+    def get_available_memory() -> Optional[float]:
+        """RAM disponible del sistema en MB (None si psutil no está instalado)."""
+        try:
+            import psutil
+            return psutil.virtual_memory().available / 1024 / 1024
+        except ImportError:
+            return None
+    
+    @staticmethod
+    def recommended_worker_count(threads_per_worker: int = None, worker_memory_mb: float = None) -> int:
+        """
+        Número de procesos de inferencia que caben en la máquina.
+        
+        Limitado por los núcleos (núcleos / hilos por proceso) y por la RAM
+        disponible (WORKER_MEMORY_FRACTION de la libre / WORKER_MEMORY_MB).
+        """
+        if threads_per_worker is None:
+            threads_per_worker = config.WORKER_TORCH_THREADS
+        if worker_memory_mb is None:
+            worker_memory_mb = config.WORKER_MEMORY_MB
+        
+        by_cpu = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+        available_mb = MemoryManager.get_available_memory()
+        if available_mb is None:
+            return by_cpu
+        
+        by_memory = max(1, int(available_mb * config.WORKER_MEMORY_FRACTION // worker_memory_mb))
+        workers = min(by_cpu, by_memory)
+        logger.info(f"Procesos de inferencia: {workers} (núcleos: {by_cpu}, memoria: {by_memory}, "
+                    f"{available_mb:.0f} MB libres)")
+        return workers
+
+# ============================================================================
+# GESTIÓN DE DIRECTORIOS
+# ============================================================================
+
+class DirectoryManager:
+    """Maneja la creación y gestión de directorios."""
+    
+    @staticmethod
+    def initialize_directories():
+        """Crea todas las carpetas necesarias si no existen."""
+        DirectoryManager.initialize_output_directories()
+        Path(config.RECONSTRUCTED_IMAGES_DIR).mkdir(parents=True, exist_ok=True)
+        logger.info(f"Directorio verificado/creado: {config.RECONSTRUCTED_IMAGES_DIR}")
+    
+    @staticmethod
+    def initialize_output_directories():
+        """Crea las carpetas de resultados de la ejecución (derivadas de BASE_DIR y TECHNICAL_DIR)."""
+        directories = [
+            config.BASE_DIR,
+            config.IMAGES_SEGMENTED_DIR,
+            config.OUTPUT_DIR,
+            config.RESULTS_DIR,
+            config.EXCEL_DIR,
+            config.DATA_DIR,
+            config.TECHNICAL_DIR
+        ]
+        
+        for directory in directories:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            logger.info(f"Directorio verificado/creado: {directory}")
+    
+    @staticmethod
+    def clean_segment_directory():
+        """Limpia la carpeta de segmentos."""
+        if os.path.exists(config.IMAGES_SEGMENTED_DIR):
+            for file in os.listdir(config.IMAGES_SEGMENTED_DIR):
+                if file.startswith("segment_") and file.endswith(".png"):
+                    os.remove(os.path.join(config.IMAGES_SEGMENTED_DIR, file))
+    
+    @staticmethod
+    def clean_result_directory(keep_segments: Set[int] = frozenset()):
+        """
+        Elimina las imágenes result_XXX.png de la pasada anterior (el número de
+        segmentos puede variar), salvo las de `keep_segments` (al reanudar).
+        """
+        if os.path.exists(config.OUTPUT_DIR):
+            keep = {f"result_{str(segment_id).zfill(3)}.png" for segment_id in keep_segments}
+            for file in os.listdir(config.OUTPUT_DIR):
+                if file.startswith("result_") and file.endswith(".png") and file not in keep:
+                    os.remove(os.path.join(config.OUTPUT_DIR, file))
+
+# ============================================================================
+# MÉTRICAS DE LA EJECUCIÓN
+# ============================================================================
+
+class RunMetrics:
+    """
+    Temporizadores y contadores de una pasada completa sobre una lámina.
+    
+    Cada etapa acumula su tiempo y su número de llamadas; cada segmento
+    inferido registra su latencia, de la que salen los percentiles. La memoria
+    residente (MemoryManager.get_memory_usage) se muestrea al cerrar cada
+    etapa y en segundo plano cada METRICS_MEMORY_INTERVAL_S segundos. En los
+    modos concurrentes (pipeline, escritor asíncrono) las etapas se solapan y
+    sus tiempos pueden sumar más que el total.
+    """
+    
+    FILENAME = 'run_metrics.json'
+    PERCENTILES = (50, 90, 95, 99)
+    
+    def __init__(self, label: str = None, memory_interval: float = None):
+        if memory_interval is None:
+            memory_interval = config.METRICS_MEMORY_INTERVAL_S
+        
+        self.label = label
+        self.created = pd.Timestamp.now().isoformat()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.segment_seconds: List[float] = []
+        self.extra: Dict[str, Any] = {}
+        self.path = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._end = None
+        
+        self.start_rss_mb = MemoryManager.get_memory_usage()
+        self.peak_rss_mb = self.start_rss_mb
+        self.end_rss_mb = None
+        self.memory_samples = 1
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+        if memory_interval and memory_interval > 0:
+            self._sampler = threading.Thread(target=self._sample_memory_loop, args=(memory_interval,),
+                                             name="metricas-memoria", daemon=True)
+            self._sampler.start()
+    
+    @staticmethod
+    def timed(metrics: Optional['RunMetrics'], name: str):
+        """`metrics.stage(name)`, o un contexto vacío si no se están midiendo métricas."""
+        return metrics.stage(name) if metrics is not None else nullcontext()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Mide el bloque como una llamada de la etapa `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+            self.sample_memory()
+    
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += calls
+    
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(amount)
+    
+    def record_segment(self, seconds: float, segments: int = 1):
+        """Latencia de `segments` segmentos procesados juntos (un lote reparte su tiempo entre ellos)."""
+        segments = max(1, int(segments))
+        with self._lock:
+            self.segment_seconds.extend([seconds / segments] * segments)
+    
+    def sample_memory(self) -> float:
+        """Memoria residente actual en MB; actualiza el pico."""
+        rss = MemoryManager.get_memory_usage()
+        with self._lock:
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+            self.memory_samples += 1
+        return rss
+    
+    def _sample_memory_loop(self, interval: float):
+        while not self._stop_sampling.wait(interval):
+            self.sample_memory()
+    
+    def stage_seconds(self, name: str) -> float:
+        stage = self.stages.get(name)
+        return stage['seconds'] if stage else 0.0
+    
+    def wall_seconds(self) -> float:
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+    
+    def finish(self):
+        """Detiene el reloj y el muestreo de memoria (las llamadas repetidas no hacen nada)."""
+        if self._end is not None:
+            return
+        self._end = time.perf_counter()
+        self._stop_sampling.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.end_rss_mb = self.sample_memory()
+    
+    def segment_summary(self) -> Dict[str, float]:
+        """Latencia por segmento (media, percentiles y máximo en ms) y segmentos por segundo."""
+        with self._lock:
+            seconds = np.asarray(self.segment_seconds, dtype=np.float64)
+        if len(seconds) == 0:
+            return {'count': 0}
+        
+        milliseconds = seconds * 1000
+        summary = {'count': int(len(seconds)), 'mean_ms': float(milliseconds.mean())}
+        for percentile, value in zip(self.PERCENTILES, np.percentile(milliseconds, self.PERCENTILES)):
+            summary[f'p{percentile}_ms'] = float(value)
+        summary['max_ms'] = float(milliseconds.max())
+        
+        detection_seconds = self.stage_seconds('deteccion') or self.wall_seconds()
+        summary['throughput_per_s'] = len(seconds) / detection_seconds if detection_seconds > 0 else 0.0
+        return summary
+    
+    def summary(self) -> Dict[str, Any]:
+        """Métricas completas en un diccionario serializable a JSON."""
+        wall_seconds = self.wall_seconds()
+        with self._lock:
+            stages = {name: {'seconds': stage['seconds'], 'calls': stage['calls'],
+                             'share': stage['seconds'] / wall_seconds if wall_seconds > 0 else 0.0}
+                      for name, stage in self.stages.items()}
+            counters = dict(self.counters)
+        
+        # Sin psutil, get_memory_usage devuelve 0: la memoria queda sin medir
+        measured = self.peak_rss_mb > 0
+        return {
+            'label': self.label,
+            'created': self.created,
+            'wall_seconds': wall_seconds,
+            'stages': stages,
+            'counters': counters,
+            'segments': self.segment_summary(),
+            'memory': {
+                'start_rss_mb': self.start_rss_mb if measured else None,
+                'peak_rss_mb': self.peak_rss_mb if measured else None,
+                'end_rss_mb': self.end_rss_mb if measured else None,
+                'samples': self.memory_samples
+            },
+            **self.extra
+        }
+    
+    def save(self, path: str = None) -> str:
+        """Escribe las métricas como JSON (por defecto DATA_DIR/run_metrics.json) y devuelve la ruta."""
+        with self._save_lock:
+            if path is None:
+                path = self.path or os.path.join(config.DATA_DIR, self.FILENAME)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, indent=2, ensure_ascii=False, default=str)
+            self.path = path
+        return path
+    
+    def refresh(self):
+        """Reescribe el JSON si ya se guardó (p. ej. cuando termina el Excel en segundo plano)."""
+        with self._save_lock:
+            if self.path is None:
+                return
+        self.save()
+    
+    def log_summary(self):
+        """Resume en el log el tiempo total, las etapas por coste, las latencias y el pico de memoria."""
+        summary = self.summary()
+        segments = summary['segments']
+        peak_rss = summary['memory']['peak_rss_mb']
+        
+        logger.info(f"⏱️ Métricas de la ejecución: {summary['wall_seconds']:.2f} s en total, "
+                    f"pico de memoria {f'{peak_rss:.0f} MB' if peak_rss is not None else 'no disponible (sin psutil)'}")
+        for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+            logger.info(f"   {name}: {stage['seconds']:.2f} s ({stage['share']:.0%}), {stage['calls']} llamadas")
+        if segments['count']:
+            logger.info(f"   Segmentos inferidos: {segments['count']}, {segments['throughput_per_s']:.1f}/s; "
+                        f"latencia p50 {segments['p50_ms']:.0f} ms, p95 {segments['p95_ms']:.0f} ms, "
+                        f"p99 {segments['p99_ms']:.0f} ms, máx {segments['max_ms']:.0f} ms")
+
+# ============================================================================
+# PROCESAMIENTO DE IMÁGENES OPTIMIZADO
+# ============================================================================
+
+class SlideReader:
+    """
+    Lectura de una lámina por ventanas.
+    
+    Abstrae el origen de los píxeles para `ImageProcessor`: una imagen ya
+    decodificada en memoria o un TIFF grande que se lee ventana a ventana.
+    Todas las ventanas se devuelven en BGR uint8, como `cv2.imread`.
+    """
+    
+    width: int = 0
+    height: int = 0
+    mpp: Optional[float] = None  # Micras por píxel, si el archivo las declara
+    
+    def read_region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """Devuelve la ventana [y:y+height, x:x+width] en BGR."""
+        raise NotImplementedError
+    
+    def segment_source(self, x: int, y: int, width: int, height: int):
+        """Origen de un segmento para `SegmentTile`: vista inmediata o ventana diferida."""
+        return TileWindow(self, x, y, width, height)
+    
+    def read_thumbnail(self, max_side: int = None) -> np.ndarray:
+        """Miniatura BGR de la lámina completa con el lado mayor <= max_side."""
+        raise NotImplementedError
+    
+    def close(self):
+        """Libera los recursos del lector."""
+        pass
+
+class ArraySlideReader(SlideReader):
+    """Lector sobre una imagen BGR ya decodificada; los segmentos son vistas sin copia."""
+    
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+    
+    def read_region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        return self.image[y:y + height, x:x + width]
+    
+    def segment_source(self, x: int, y: int, width: int, height: int):
+        return self.read_region(x, y, width, height)
+    
+    def read_thumbnail(self, max_side: int = None) -> np.ndarray:
+        if max_side is None:
+            max_side = config.THUMBNAIL_MAX_SIDE
+        scale = min(1.0, max_side / max(self.width, self.height))
+        if scale >= 1.0:
+            return self.image
+        size = (max(1, int(self.width * scale)), max(1, int(self.height * scale)))
+        return cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+
+class TiffSlideReader(SlideReader):
+    """
+    Lector por ventanas de TIFF en mosaico o por bandas (tifffile).
+    
+    Si el archivo no está comprimido se mapea en memoria; si lo está, se
+    accede como almacén zarr y solo se decodifican los mosaicos/bandas que
+    cubren cada ventana. La memoria máxima queda acotada por el tamaño de los
+    segmentos en vuelo, no por el de la lámina.
+    """
+    
+    def __init__(self, image_path: str):
+        import tifffile
+        
+        self.image_path = image_path
+        self._tif = tifffile.TiffFile(image_path)
+        self._store = None
+        try:
+            series = self._tif.series[0]
+            if series.axes not in ('YX', 'YXS'):
+                raise ValueError(f"Ejes TIFF no soportados para lectura por ventanas: {series.axes}")
+            self.height, self.width = series.shape[:2]
+            self._levels = series.levels
+            self.mpp = self._read_mpp(self._tif.pages[0])
+            
+            try:
+                self._data = tifffile.memmap(image_path, mode='r')
+                self.mode = 'memmap'
+            except Exception:
+                import zarr
+                self._store = self._tif.aszarr(series=0, level=0)
+                self._data = zarr.open(self._store, mode='r')
+                self.mode = 'zarr'
+        except Exception:
+            self.close()
+            raise
+        
+        logger.info(f"TIFF abierto por ventanas ({self.mode}): {self.width}x{self.height}")
+    
+    @staticmethod
+    def _read_mpp(page) -> Optional[float]:
+        """Micras por píxel a partir de XResolution y ResolutionUnit (pulgadas o centímetros)."""
+        try:
+            resolution = page.tags.get('XResolution')
+            unit = page.tags.get('ResolutionUnit')
+            if resolution is None or unit is None:
+                return None
+            numerator, denominator = resolution.value
+            microns_per_unit = {2: 25400.0, 3: 10000.0}.get(int(unit.value))
+            if not microns_per_unit or numerator <= 0 or denominator <= 0:
+                return None
+            return microns_per_unit * denominator / numerator
+        except Exception:
+            return None
+    
+    @staticmethod
+    def _to_bgr(window: np.ndarray) -> np.ndarray:
+        """Convierte una ventana RGB/RGBA/gris de cualquier profundidad a BGR uint8."""
+        window = np.asarray(window)
+        if window.dtype != np.uint8:
+            max_value = np.iinfo(window.dtype).max if np.issubdtype(window.dtype, np.integer) else 1.0
+            window = np.clip(window.astype(np.float32) * (255.0 / max_value), 0, 255).astype(np.uint8)
+        if window.ndim == 2:
+            return cv2.cvtColor(window, cv2.COLOR_GRAY2BGR)
+        if window.shape[2] == 4:
+            return cv2.cvtColor(window, cv2.COLOR_RGBA2BGR)
+        return cv2.cvtColor(window[:, :, :3], cv2.COLOR_RGB2BGR)
+    
+    def read_region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        return self._to_bgr(self._data[y:y + height, x:x + width])
+    
+    def read_thumbnail(self, max_side: int = None) -> np.ndarray:
+        if max_side is None:
+            max_side = config.THUMBNAIL_MAX_SIDE
+        
+        # Usar el nivel piramidal más pequeño que aún cubre max_side, si existe
+        source = self._data
+        for level_index in range(len(self._levels) - 1, 0, -1):
+            level_shape = self._levels[level_index].shape
+            if max(level_shape[0], level_shape[1]) >= max_side:
+                source = self._levels[level_index].asarray()
+                break
+        
+        step = max(1, int(max(source.shape[0], source.shape[1]) // max_side))
+        thumbnail = self._to_bgr(source[::step, ::step])
+        
+        scale = min(1.0, max_side / max(thumbnail.shape[:2]))
+        if scale < 1.0:
+            size = (max(1, int(thumbnail.shape[1] * scale)), max(1, int(thumbnail.shape[0] * scale)))
+            thumbnail = cv2.resize(thumbnail, size, interpolation=cv2.INTER_AREA)
+        return thumbnail
+    
+    def close(self):
+        try:
+            if self._store is not None:
+                self._store.close()
+            self._tif.close()
+        except Exception as e:
+            logger.warning(f"Error cerrando TIFF {self.image_path}: {e}")
+
+class TileWindow(NamedTuple):
+    """Ventana de un segmento que se decodifica bajo demanda (y se reescala a `output_size`, si se indica)."""
+    reader: SlideReader
+    x: int
+    y: int
+    width: int
+    height: int
+    output_size: Optional[Tuple[int, int]] = None
+    
+    def read(self) -> np.ndarray:
+        region = self.reader.read_region(self.x, self.y, self.width, self.height)
+        if self.output_size is not None and (region.shape[1], region.shape[0]) != tuple(self.output_size):
+            region = cv2.resize(region, tuple(self.output_size), interpolation=cv2.INTER_AREA)
+        return region
+
+class SegmentTile(NamedTuple):
+    """Segmento de la imagen listo para inferencia.
+    
+    `source` es una vista NumPy (BGR) de la imagen decodificada, una
+    `TileWindow` que se lee bajo demanda (TIFF grandes) o, en modo
+    depuración, la ruta del PNG escrito en disco.
+    """
+    start_x: int
+    start_y: int
+    segment_id: int
+    source: Union[np.ndarray, str, TileWindow]
+    scale: float = 1.0  # Píxeles de red por píxel de lámina (1 = resolución nativa)
+
+class RoiMap(NamedTuple):
+    """Candidatos de la vista general (pasada gruesa) y su mapa de densidad sobre la lámina."""
+    density: np.ndarray  # Candidatos por celda
+    scale: float  # Celdas del mapa por píxel de lámina
+    candidates: np.ndarray  # Candidatos (DETECTION_DTYPE) en coordenadas de la lámina
+    overview_scale: float  # Píxeles de la vista general por píxel de lámina
+    inferences: int = 0  # Segmentos de la vista general que han pasado por el modelo
+
+class ImageProcessor:
+    """Maneja todo el procesamiento de imágenes de forma optimizada."""
+    
+    VALID_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
+    # Protege el cambio temporal de PIL.Image.MAX_IMAGE_PIXELS entre hilos
+    _pil_limit_lock = threading.Lock()
+    
+    @staticmethod
+    def read_image_header(image_path: str) -> Optional[Tuple[int, int]]:
+        """
+        Lee (ancho, alto) de la cabecera sin decodificar los píxeles.
+        
+        Las láminas superan el límite anti "decompression bomb" de PIL; se
+        desactiva solo durante esta lectura y se restaura después, para no
+        cambiar el comportamiento de PIL en el resto del proceso.
+        """
+        try:
+            from PIL import Image
+            with ImageProcessor._pil_limit_lock:
+                previous_limit = Image.MAX_IMAGE_PIXELS
+                Image.MAX_IMAGE_PIXELS = None
+                try:
+                    with Image.open(image_path) as img:
+                        return img.size
+                finally:
+                    Image.MAX_IMAGE_PIXELS = previous_limit
+        except ImportError:
+            return None
+        except Exception as e:
+            logger.warning(f"No se pudo leer la cabecera de {image_path}: {e}")
+            return None
+    
+    @staticmethod
+    def validate_image(image_path: str) -> bool:
+        """Valida que la imagen sea legible y tenga formato correcto (solo cabecera)."""
+        try:
+            # Verificar existencia
+            if not os.path.exists(image_path):
+                logger.error(f"Archivo no encontrado: {image_path}")
+                return False
+            
+            # Verificar formato
+            if Path(image_path).suffix.lower() not in ImageProcessor.VALID_EXTENSIONS:
+                logger.error(f"Formato de imagen no soportado: {image_path}")
+                return False
+            
+            # Leer la cabecera; si no es posible, intentar decodificar la imagen
+            size = ImageProcessor.read_image_header(image_path)
+            if size is None:
+                img = cv2.imread(image_path)
+                if img is None:
+                    logger.error(f"No se pudo cargar la imagen: {image_path}")
+                    return False
+                size = (img.shape[1], img.shape[0])
+                del img
+            
+            logger.info(f"Imagen validada correctamente: {image_path} ({size[0]}x{size[1]})")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error validando imagen: {e}")
+            return False
+    
+    @staticmethod
+    def decode_image(image_path: str) -> np.ndarray:
+        """Decodifica la imagen completa (BGR) con carga alternativa por bytes."""
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            # Método alternativo de carga
+            with open(image_path, 'rb') as f:
+                img_bytes = f.read()
+            image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+            
+            if image is None:
+                raise ValueError(f"No se pudo cargar la imagen: {image_path}")
+        return image
+    
+    @staticmethod
+    def resize_array_if_needed(image: np.ndarray, max_pixels: int = None) -> np.ndarray:
+        """Redimensiona en memoria una imagen que excede el límite de píxeles."""
+        if max_pixels is None:
+            max_pixels = config.MAX_PIXELS
+        
+        height, width = image.shape[:2]
+        pixels = height * width
+        logger.info(f"Tamaño original: {width}x{height} = {pixels:,} píxeles")
+        
+        if pixels <= max_pixels:
+            return image
+        
+        # Calcular nuevo tamaño
+        scale = (max_pixels / pixels) ** 0.5
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        logger.info(f"Redimensionando a: {new_width}x{new_height}")
+        
+        # Redimensionar con interpolación de alta calidad
+        return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+    
+    @staticmethod
+    def _resized_image_path(image_path: str) -> str:
+        """Ruta de la copia redimensionada junto a la imagen original."""
+        path_obj = Path(image_path)
+        return str(path_obj.parent / f"{path_obj.stem}_resized{path_obj.suffix}")
+    
+    @staticmethod
+    def load_image_once(image_path: str, max_pixels: int = None,
+                        metrics: 'RunMetrics' = None) -> Tuple[np.ndarray, str]:
+        """
+        Etapa de ingesta: valida por cabecera, decodifica UNA sola vez y
+        redimensiona en memoria si hace falta.
+        
+        Devuelve la imagen BGR, que se pasa a la segmentación y a las
+        visualizaciones, y la ruta que la representa: la original o, si
+        SAVE_RESIZED_IMAGE está activo y hubo redimensionado, la copia escrita.
+        """
+        if not ImageProcessor.validate_image(image_path):
+            raise ValueError(f"Imagen no válida: {image_path}")
+        
+        logger.info(f"Decodificando imagen: {image_path}")
+        with RunMetrics.timed(metrics, 'decodificacion'):
+            image = ImageProcessor.decode_image(image_path)
+        with RunMetrics.timed(metrics, 'redimensionado'):
+            resized = ImageProcessor.resize_array_if_needed(image, max_pixels)
+        
+        if resized is image:
+            return image, image_path
+        
+        del image
+        MemoryManager.clear_cache()
+        
+        if config.SAVE_RESIZED_IMAGE:
+            resized_path = ImageProcessor._resized_image_path(image_path)
+            cv2.imwrite(resized_path, resized)
+            logger.info(f"Imagen redimensionada guardada en: {resized_path}")
+            return resized, resized_path
+        
+        logger.info("Imagen redimensionada en memoria (sin copia en disco)")
+        return resized, image_path
+    
+    @staticmethod
+    def open_slide(image_path: str, metrics: 'RunMetrics' = None) -> Tuple[Union[np.ndarray, SlideReader], str]:
+        """
+        Abre la lámina para la segmentación.
+        
+        Los TIFF que superan MAX_PIXELS se abren con `TiffSlideReader` y se
+        procesan a resolución nativa leyendo cada segmento bajo demanda; el
+        resto de imágenes pasa por `load_image_once`. Con `metrics` se miden
+        la decodificación y el redimensionado.
+        """
+        if config.USE_WINDOWED_TIFF_READER and Path(image_path).suffix.lower() in ('.tif', '.tiff'):
+            size = ImageProcessor.read_image_header(image_path)
+            if size is None or size[0] * size[1] > config.MAX_PIXELS:
+                try:
+                    return TiffSlideReader(image_path), image_path
+                except ImportError:
+                    logger.warning("tifffile/zarr no disponibles: se decodificará la imagen completa")
+                except Exception as e:
+                    logger.warning(f"No se pudo leer el TIFF por ventanas ({e}): se decodificará completa")
+        
+        return ImageProcessor.load_image_once(image_path, metrics=metrics)
+    
+    @staticmethod
+    def slide_size(slide: Union[np.ndarray, SlideReader]) -> Tuple[int, int]:
+        """(ancho, alto) de la lámina abierta, en el sistema de coordenadas de las detecciones."""
+        if isinstance(slide, SlideReader):
+            return slide.width, slide.height
+        return slide.shape[1], slide.shape[0]
+    
+    @staticmethod
+    def materialize_segment(source: Union[np.ndarray, str, TileWindow]) -> Union[np.ndarray, str]:
+        """Devuelve el origen que acepta el modelo, leyendo las ventanas diferidas."""
+        if isinstance(source, TileWindow):
+            return source.read()
+        return source
+    
+    @staticmethod
+    def segment_source_size(source: Union[np.ndarray, str, TileWindow]) -> Optional[Tuple[int, int]]:
+        """(ancho, alto) con que el segmento llega al modelo, sin leer sus píxeles."""
+        if isinstance(source, TileWindow):
+            return tuple(source.output_size) if source.output_size is not None else (source.width, source.height)
+        if isinstance(source, np.ndarray):
+            return source.shape[1], source.shape[0]
+        return ImageProcessor.read_image_header(source)
+    
+    @staticmethod
+    def resize_image_if_needed(image_path: str, max_pixels: int = None) -> str:
+        """Redimensiona una imagen si excede el límite de píxeles."""
+        if max_pixels is None:
+            max_pixels = config.MAX_PIXELS
+        
+        logger.info(f"Verificando tamaño de imagen: {image_path}")
+        
+        try:
+            # La cabecera basta para saber si hay que redimensionar
+            size = ImageProcessor.read_image_header(image_path)
+            if size is not None and size[0] * size[1] <= max_pixels:
+                return image_path
+            
+            img = ImageProcessor.decode_image(image_path)
+            resized = ImageProcessor.resize_array_if_needed(img, max_pixels)
+            if resized is img:
+                return image_path
+            
+            # Guardar versión redimensionada
+            resized_path = ImageProcessor._resized_image_path(image_path)
+            cv2.imwrite(resized_path, resized)
+            
+            logger.info(f"Imagen redimensionada guardada en: {resized_path}")
+            
+            # Limpiar memoria
+            del img, resized
+            MemoryManager.clear_cache()
+            
+            return resized_path
+            
+        except Exception as e:
+            logger.error(f"Error redimensionando imagen: {e}")
+            raise
+    
+    @staticmethod
+    def segment_size(tile: SegmentTile) -> Optional[Tuple[int, int]]:
+        """(ancho, alto) de un segmento en píxeles de la lámina, sin materializarlo."""
+        source = tile.source
+        if isinstance(source, TileWindow):
+            return source.width, source.height
+        if isinstance(source, np.ndarray):
+            size = (source.shape[1], source.shape[0])
+        else:
+            size = ImageProcessor.read_image_header(source)
+            if size is None:
+                return None
+        return int(round(size[0] / tile.scale)), int(round(size[1] / tile.scale))
+    
+    @staticmethod
+    def compute_tissue_mask(slide: Union[np.ndarray, SlideReader], max_side: int = None) -> Tuple[np.ndarray, float]:
+        """
+        Máscara de tejido (uint8 0/1) sobre una miniatura de la lámina y su escala respecto a la lámina.
+        
+        El portaobjetos y el medio de montaje son claros y poco saturados: Otsu
+        sobre el gris (invertido) y sobre la saturación separa el tejido, y la
+        morfología rellena los canales, elimina motas y deja un margen alrededor
+        del tejido. Un canal solo cuenta si Otsu separa dos clases con al menos
+        TISSUE_MIN_CONTRAST niveles; si ninguno lo hace (lámina uniforme) toda
+        la lámina se considera tejido.
+        """
+        if max_side is None:
+            max_side = config.TISSUE_THUMBNAIL_MAX_SIDE
+        
+        reader = ArraySlideReader(slide) if isinstance(slide, np.ndarray) else slide
+        thumbnail = reader.read_thumbnail(max_side)
+        scale = thumbnail.shape[1] / reader.width
+        
+        hsv = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2HSV)
+        channels = [255 - cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY), hsv[:, :, 1]]
+        
+        mask = np.zeros(thumbnail.shape[:2], dtype=np.uint8)
+        for channel in channels:
+            channel = cv2.medianBlur(channel, 5)
+            _, channel_mask = cv2.threshold(channel, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            foreground = channel_mask.astype(bool)
+            if foreground.all() or not foreground.any():
+                continue
+            if channel[foreground].mean() - channel[~foreground].mean() >= config.TISSUE_MIN_CONTRAST:
+                mask |= channel_mask
+        
+        if not mask.any():
+            return np.ones(thumbnail.shape[:2], dtype=np.uint8), scale
+        
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (config.TISSUE_MORPH_KERNEL,) * 2)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        mask = cv2.dilate(mask, kernel)
+        return mask, scale
+    
+    @staticmethod
+    def find_background_segments(slide: Union[np.ndarray, SlideReader], segment_positions: List[SegmentTile],
+                                 min_fraction: float = None) -> Set[int]:
+        """
+        Identificadores de los segmentos con menos de `min_fraction` de tejido.
+        
+        La fracción de cada segmento se obtiene de la imagen integral de la
+        máscara, en tiempo constante por segmento. Si todos los segmentos
+        resultan ser fondo se asume que la máscara ha fallado y no se omite
+        ninguno.
+        """
+        if min_fraction is None:
+            min_fraction = config.TISSUE_MIN_FRACTION
+        
+        start_time = time.perf_counter()
+        mask, scale = ImageProcessor.compute_tissue_mask(slide)
+        integral = cv2.integral(mask)
+        mask_height, mask_width = mask.shape
+        
+        background = set()
+        for tile in segment_positions:
+            size = ImageProcessor.segment_size(tile)
+            if size is None:
+                continue
+            x0 = min(mask_width - 1, int(floor(tile.start_x * scale)))
+            y0 = min(mask_height - 1, int(floor(tile.start_y * scale)))
+            x1 = min(mask_width, max(x0 + 1, int(ceil((tile.start_x + size[0]) * scale))))
+            y1 = min(mask_height, max(y0 + 1, int(ceil((tile.start_y + size[1]) * scale))))
+            
+            tissue = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            if tissue < min_fraction * (x1 - x0) * (y1 - y0):
+                background.add(tile.segment_id)
+        
+        if background and len(background) == len(segment_positions):
+            logger.warning("⚠️ La máscara de tejido no encontró tejido en ningún segmento: se procesan todos")
+            return set()
+        
+        logger.info(f"🧫 Máscara de tejido: {len(background)} de {len(segment_positions)} segmentos sin tejido "
+                    f"({mask.mean():.0%} de la lámina es tejido) en {(time.perf_counter() - start_time) * 1000:.0f} ms")
+        return background
+    
+    @staticmethod
+    def roi_density_map(candidates: np.ndarray, width: int, height: int, overview_scale: float,
+                        max_side: int = None) -> RoiMap:
+        """Cuenta los candidatos (centros en píxeles de lámina) por celda de un mapa de lado <= `max_side`."""
+        if max_side is None:
+            max_side = config.COARSE_DENSITY_MAX_SIDE
+        
+        scale = min(1.0, max_side / max(width, height))
+        density = np.zeros((max(1, ceil(height * scale)), max(1, ceil(width * scale))), dtype=np.int32)
+        if len(candidates):
+            rows = np.clip((candidates['center_y'] * scale).astype(np.int64), 0, density.shape[0] - 1)
+            cols = np.clip((candidates['center_x'] * scale).astype(np.int64), 0, density.shape[1] - 1)
+            np.add.at(density, (rows, cols), 1)
+        return RoiMap(density, scale, candidates, overview_scale)
+    
+    @staticmethod
+    def find_segments_outside_roi(roi: RoiMap, segment_positions: List[SegmentTile],
+                                  min_candidates: int = None, margin: int = None) -> Set[int]:
+        """
+        Identificadores de los segmentos con menos de `min_candidates` candidatos de la vista general.
+        
+        Los candidatos se cuentan en el segmento ampliado `margin` píxeles por
+        cada lado (el centro de un canal cortado por el borde puede caer en el
+        vecino), con la imagen integral del mapa de densidad, en tiempo
+        constante por segmento. Si la vista general no encontró ningún
+        candidato se asume que ha fallado y no se omite ningún segmento.
+        """
+        if min_candidates is None:
+            min_candidates = config.COARSE_MIN_CANDIDATES
+        if margin is None:
+            margin = config.COARSE_ROI_MARGIN_PX
+        
+        if len(roi.candidates) == 0:
+            logger.warning("⚠️ La vista general no encontró candidatos: se procesan todos los segmentos")
+            return set()
+        
+        integral = np.zeros((roi.density.shape[0] + 1, roi.density.shape[1] + 1), dtype=np.int64)
+        integral[1:, 1:] = roi.density.cumsum(axis=0).cumsum(axis=1)
+        map_height, map_width = roi.density.shape
+        
+        outside = set()
+        for tile in segment_positions:
+            size = ImageProcessor.segment_size(tile)
+            if size is None:
+                continue
+            x0 = min(map_width - 1, max(0, int(floor((tile.start_x - margin) * roi.scale))))
+            y0 = min(map_height - 1, max(0, int(floor((tile.start_y - margin) * roi.scale))))
+            x1 = min(map_width, max(x0 + 1, int(ceil((tile.start_x + size[0] + margin) * roi.scale))))
+            y1 = min(map_height, max(y0 + 1, int(ceil((tile.start_y + size[1] + margin) * roi.scale))))
+            
+            candidates = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            if candidates < min_candidates:
+                outside.add(tile.segment_id)
+        return outside
+    
+    @staticmethod
+    def divide_image_optimized(image: Union[str, np.ndarray, SlideReader], num_segments: int = None,
+                               save_to_disk: bool = None,
+                               overlap: int = None,
+                               tile_size: int = None) -> Tuple[List[SegmentTile], int, int]:
+        """
+        Divide una imagen en segmentos optimizando el uso de memoria.
+        
+        `image` puede ser la imagen ya decodificada por `load_image_once` (lo
+        habitual), un `SlideReader` por ventanas o una ruta, que entonces se
+        decodifica aquí. Por defecto cada segmento es una vista sin copia de la
+        imagen (o una ventana que se lee bajo demanda), que se pasa directamente
+        al modelo. Con `save_to_disk` (depuración) los segmentos se escriben como
+        PNG en images_segmented y se referencian por ruta.
+        Con `overlap` > 0 cada celda de la rejilla se amplía ese número de píxeles
+        por cada lado, para que los canales cortados por un borde aparezcan completos
+        en el segmento vecino (los duplicados se fusionan después con NMS global).
+        Con TILING_MODE = 'model' los segmentos se dimensionan según la entrada
+        del modelo (`tile_size`) en lugar de la rejilla fija; ver
+        `divide_image_by_model_input`.
+        """
+        if num_segments is None:
+            num_segments = config.NUM_SEGMENTS
+        if save_to_disk is None:
+            save_to_disk = config.SAVE_SEGMENTS_TO_DISK
+        if overlap is None:
+            overlap = config.SEGMENT_OVERLAP_PX
+        overlap = max(0, int(overlap))
+        
+        # Limpiar directorio de segmentos
+        DirectoryManager.clean_segment_directory()
+        
+        try:
+            if isinstance(image, str):
+                logger.info(f"Dividiendo imagen: {image}")
+                image = ImageProcessor.decode_image(image)
+            reader = ArraySlideReader(image) if isinstance(image, np.ndarray) else image
+            logger.info(f"Dividiendo imagen ({type(reader).__name__}): {reader.width}x{reader.height}")
+            
+            if config.TILING_MODE == 'model':
+                return ImageProcessor.divide_image_by_model_input(reader, tile_size, overlap, save_to_disk)
+            
+            # Configurar división
+            cols = config.SEGMENT_COLS
+            rows = ceil(num_segments / cols)
+            segment_height = reader.height // rows
+            segment_width = reader.width // cols
+            
+            logger.info(f"Dividiendo en {rows}x{cols} segmentos ({segment_width}x{segment_height} cada uno, "
+                        f"solape {overlap} px)")
+            
+            # Dividir con progreso
+            segment_positions = []
+            total_segments = min(rows * cols, num_segments)
+            
+            for i in range(rows):
+                for j in range(cols):
+                    if len(segment_positions) >= total_segments:
+                        break
+                    
+                    # Calcular límites del segmento (ampliados por el solape)
+                    start_y = max(0, i * segment_height - overlap)
+                    end_y = min((i + 1) * segment_height + overlap, reader.height)
+                    start_x = max(0, j * segment_width - overlap)
+                    end_x = min((j + 1) * segment_width + overlap, reader.width)
+                    segment_id = len(segment_positions) + 1
+                    
+                    if save_to_disk:
+                        segment = reader.read_region(start_x, start_y, end_x - start_x, end_y - start_y)
+                        segment_filename = f"segment_{segment_id}.png"
+                        segment_path = os.path.join(config.IMAGES_SEGMENTED_DIR, segment_filename)
+                        cv2.imwrite(segment_path, segment, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                        segment_positions.append(SegmentTile(start_x, start_y, segment_id, segment_path))
+                        del segment
+                    else:
+                        # Vista sin copia o ventana diferida, según el lector
+                        source = reader.segment_source(start_x, start_y, end_x - start_x, end_y - start_y)
+                        segment_positions.append(SegmentTile(start_x, start_y, segment_id, source))
+                
+                if len(segment_positions) >= total_segments:
+                    break
+            
+            # Las vistas mantienen viva la imagen; solo se libera si los segmentos están en disco
+            del image, reader
+            if save_to_disk:
+                MemoryManager.clear_cache()
+                logger.info(f"Segmentación completada: {len(segment_positions)} segmentos guardados en disco")
+            else:
+                logger.info(f"Segmentación completada: {len(segment_positions)} segmentos en memoria")
+            return segment_positions, segment_width, segment_height
+            
+        except Exception as e:
+            logger.error(f"Error dividiendo imagen: {e}")
+            raise
+    
+    @staticmethod
+    def slide_mpp(slide: Union[np.ndarray, SlideReader]) -> Optional[float]:
+        """Micras por píxel de la lámina: SLIDE_MPP o, si es 0, las declaradas en el archivo."""
+        if config.SLIDE_MPP > 0:
+            return config.SLIDE_MPP
+        return getattr(slide, 'mpp', None)
+    
+    @staticmethod
+    def _tile_starts(length: int, region: int, stride: int) -> List[int]:
+        """Inicios de los segmentos a lo largo de un eje; el último queda pegado al borde."""
+        if length <= region:
+            return [0]
+        return list(range(0, length - region, stride)) + [length - region]
+    
+    @staticmethod
+    def divide_image_by_model_input(reader: SlideReader, tile_size: int = None, overlap: int = 0,
+                                    save_to_disk: bool = False) -> Tuple[List[SegmentTile], int, int]:
+        """
+        Segmentos cuadrados que entran en la red a su tamaño de entrada (`tile_size`).
+        
+        Cada segmento cubre `tile_size` píxeles de red. A resolución nativa es
+        una vista de `tile_size` x `tile_size` píxeles y ultralytics no la
+        reescala; si se conocen las micras por píxel de la lámina y TARGET_MPP,
+        cada segmento cubre la región equivalente y se reescala una sola vez al
+        leerlo. El número de segmentos sigue al área de la lámina, y los de la
+        última fila y columna se pegan al borde para ser también completos (el
+        solape resultante lo resuelve la NMS global).
+        """
+        if tile_size is None:
+            tile_size = config.MODEL_INPUT_SIZE or config.EXPORT_IMGSZ
+        
+        mpp = ImageProcessor.slide_mpp(reader)
+        region = tile_size
+        if config.TARGET_MPP > 0 and mpp:
+            region = max(1, int(round(tile_size * config.TARGET_MPP / mpp)))
+        scale = tile_size / region
+        
+        stride = max(1, region - min(max(0, int(overlap)), region // 2))
+        xs = ImageProcessor._tile_starts(reader.width, region, stride)
+        ys = ImageProcessor._tile_starts(reader.height, region, stride)
+        
+        logger.info(f"Segmentación según la entrada del modelo: {len(ys)}x{len(xs)} segmentos de {region} px "
+                    f"(entrada {tile_size} px, escala {scale:.3f}, paso {stride} px"
+                    f"{f', {mpp:.3f} µm/px' if mpp else ''})")
+        
+        segment_positions = []
+        for start_y in ys:
+            for start_x in xs:
+                width = min(region, reader.width - start_x)
+                height = min(region, reader.height - start_y)
+                output_size = None
+                if scale != 1.0:
+                    output_size = (tile_size if width == region else max(1, int(round(width * scale))),
+                                   tile_size if height == region else max(1, int(round(height * scale))))
+                segment_id = len(segment_positions) + 1
+                
+                if save_to_disk:
+                    segment = TileWindow(reader, start_x, start_y, width, height, output_size).read()
+                    segment_path = os.path.join(config.IMAGES_SEGMENTED_DIR, f"segment_{segment_id}.png")
+                    cv2.imwrite(segment_path, segment, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                    source = segment_path
+                elif output_size is None:
+                    source = reader.segment_source(start_x, start_y, width, height)
+                else:
+                    source = TileWindow(reader, start_x, start_y, width, height, output_size)
+                segment_positions.append(SegmentTile(start_x, start_y, segment_id, source, scale))
+        
+        logger.info(f"Segmentación completada: {len(segment_positions)} segmentos"
+                    f"{' guardados en disco' if save_to_disk else ' en memoria'}")
+        return segment_positions, region, region
+
+# ============================================================================
+# MODELO YOLO OPTIMIZADO
+# ============================================================================
+
+class AnnotatedImageWriter:
+    """
+    Pool acotado de hilos que renderiza y escribe las imágenes anotadas.
+    
+    La inferencia encola el trabajo y sigue; `submit` solo bloquea cuando hay
+    `max_pending` imágenes en vuelo, lo que limita la memoria retenida por los
+    resultados pendientes. `flush` espera a que todo esté en disco.
+    """
+    
+    def __init__(self, max_workers: int = None, max_pending: int = None):
+        if max_workers is None:
+            max_workers = config.IMAGE_WRITER_WORKERS
+        if max_pending is None:
+            max_pending = config.IMAGE_WRITER_MAX_PENDING
+        
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix="annotated-writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._futures = []
+        self._lock = threading.Lock()
+    
+    def submit(self, func, *args):
+        """Encola `func(*args)`; la función devuelve False si la escritura falla."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self._futures.append(future)
+    
+    def flush(self) -> int:
+        """Espera a todas las escrituras pendientes y devuelve cuántas fallaron."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        
+        failures = 0
+        for future in futures:
+            try:
+                if future.result() is False:
+                    failures += 1
+            except Exception as e:
+                logger.error(f"Error en escritura en segundo plano: {e}")
+                failures += 1
+        return failures
+    
+    def shutdown(self) -> int:
+        """Vacía la cola y cierra el pool."""
+        failures = self.flush()
+        self._executor.shutdown(wait=True)
+        return failures
+
+class PipelineStageStats:
+    """Contadores de una etapa del pipeline: elementos, tiempo activo y profundidad de su cola."""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.queue_samples = 0
+        self.queue_depth_total = 0
+        self.max_queue_depth = 0
+    
+    def sample_queue(self, depth: int):
+        self.queue_samples += 1
+        self.queue_depth_total += depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+    
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'items': self.items,
+            'busy_seconds': self.busy_seconds,
+            'throughput_per_s': self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0,
+            'avg_queue_depth': self.queue_depth_total / self.queue_samples if self.queue_samples else 0.0,
+            'max_queue_depth': self.max_queue_depth
+        }
+
+class DetectionPipeline:
+    """
+    Pipeline de detección por etapas concurrentes unidas por colas acotadas.
+    
+    extracción de segmentos → inferencia por lotes → post-proceso de cajas →
+    escritura de imágenes. Cada etapa corre en su propio hilo; las colas
+    acotadas mantienen al modelo alimentado sin que la memoria crezca con el
+    número de segmentos. Se conserva la garantía de que cada segmento produce
+    un resultado y una imagen (anotada o vacía).
+    """
+    
+    _END = object()
+    
+    def __init__(self, model_manager: 'YOLOModelManager', confidence_threshold: float,
+                 batch_size: int, queue_size: int = None, writer_threads: int = None):
+        if queue_size is None:
+            queue_size = config.PIPELINE_QUEUE_SIZE
+        if writer_threads is None:
+            writer_threads = config.IMAGE_WRITER_WORKERS
+        
+        self.model_manager = model_manager
+        self.confidence_threshold = confidence_threshold
+        self.batch_size = max(1, int(batch_size))
+        self.writer_threads = max(1, int(writer_threads))
+        
+        self._tile_queue = queue.Queue(maxsize=max(1, queue_size))
+        self._result_queue = queue.Queue(maxsize=max(1, queue_size))
+        self._write_queue = queue.Queue(maxsize=max(1, queue_size))
+        
+        self.stats = {name: PipelineStageStats(name)
+                      for name in ('extraccion', 'inferencia', 'postproceso', 'escritura')}
+        self._stats_lock = threading.Lock()
+        self._segment_detections = []
+        self._total_segments = 0
+        self._segment_started: Dict[int, float] = {}
+        self.write_errors: Dict[int, str] = {}
+    
+    def run(self, segment_positions: List[SegmentTile]) -> List[np.ndarray]:
+        """
+        Ejecuta todas las etapas y devuelve las detecciones por segmento, en orden.
+        
+        Los segmentos cuya imagen no se pudo guardar quedan en `write_errors`
+        (segmento → error) con una imagen vacía en su lugar.
+        """
+        sorted_positions = sorted(segment_positions, key=lambda x: x[2])
+        self._total_segments = len(sorted_positions)
+        self._segment_detections = []
+        self.write_errors = {}
+        
+        threads = [
+            threading.Thread(target=self._extraction_stage, args=(sorted_positions,), name="pipeline-extraccion"),
+            threading.Thread(target=self._inference_stage, name="pipeline-inferencia"),
+            threading.Thread(target=self._postprocess_stage, name="pipeline-postproceso")
+        ]
+        threads += [threading.Thread(target=self._write_stage, name=f"pipeline-escritura-{i}")
+                    for i in range(self.writer_threads)]
+        
+        run_start = time.perf_counter()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - run_start
+        
+        self._log_stats(wall_seconds)
+        return self._segment_detections
+    
+    def stats_summary(self) -> Dict[str, Dict[str, float]]:
+        """Estadísticas por etapa (rendimiento y profundidad de cola)."""
+        return {name: stage.as_dict() for name, stage in self.stats.items()}
+    
+    def _get(self, source_queue: queue.Queue, stage: str):
+        """Lee de la cola de entrada de una etapa registrando su profundidad."""
+        self.stats[stage].sample_queue(source_queue.qsize())
+        return source_queue.get()
+    
+    def _record(self, stage: str, items: int, started: float):
+        with self._stats_lock:
+            self.stats[stage].items += items
+            self.stats[stage].busy_seconds += time.perf_counter() - started
+    
+    def _extraction_stage(self, sorted_positions: List[SegmentTile]):
+        """Etapa 1: materializa cada segmento (vista, ventana TIFF o PNG de depuración)."""
+        try:
+            completed = self.model_manager._completed_segments()
+            for tile in sorted_positions:
+                started = time.perf_counter()
+                if tile.segment_id in completed:
+                    continue
+                if tile.segment_id in self.model_manager._background_segments:
+                    self._write_queue.put(('background', tile, None))
+                    continue
+                if isinstance(tile.source, str) and not os.path.exists(tile.source):
+                    logger.warning(f"⚠️ Segmento {tile.segment_id} no encontrado: {tile.source}")
+                    self._write_queue.put(('empty', tile, None))
+                    continue
+                try:
+                    source = ImageProcessor.materialize_segment(tile.source)
+                except Exception as e:
+                    logger.error(f"❌ Error leyendo segmento {tile.segment_id}: {e}")
+                    self._write_queue.put(('empty', tile, None))
+                    continue
+                self._segment_started[tile.segment_id] = started
+                self._record('extraccion', 1, started)
+                self._tile_queue.put((tile, source))
+        finally:
+            self._tile_queue.put(self._END)
+    
+    def _inference_stage(self):
+        """Etapa 2: agrupa segmentos en lotes y ejecuta el modelo."""
+        try:
+            finished = False
+            while not finished:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = self._get(self._tile_queue, 'inferencia')
+                    if item is self._END:
+                        finished = True
+                        break
+                    batch.append(item)
+                if batch:
+                    self._infer_batch(batch)
+        finally:
+            self._result_queue.put(self._END)
+    
+    def _infer_batch(self, batch: List[Tuple[SegmentTile, Any]]):
+        started = time.perf_counter()
+        try:
+            results = self.model_manager._predict([source for _, source in batch], self.confidence_threshold)
+            if len(results) != len(batch):
+                raise RuntimeError(f"{len(results)} resultados para {len(batch)} segmentos")
+            outputs = [(tile, result) for (tile, _), result in zip(batch, results)]
+        except Exception as e:
+            logger.error(f"❌ Error en lote de {len(batch)} segmentos: {e}. Reprocesando segmento a segmento")
+            outputs = []
+            for tile, source in batch:
+                try:
+                    outputs.append((tile, self.model_manager._predict([source], self.confidence_threshold)[0]))
+                except Exception as single_error:
+                    logger.error(f"❌ Error procesando segmento {tile.segment_id}: {single_error}")
+                    outputs.append((tile, None))
+        self._record('inferencia', len(batch), started)
+        
+        for tile, result in outputs:
+            self._result_queue.put((tile, result))
+    
+    def _postprocess_stage(self):
+        """Etapa 3: convierte las cajas a detecciones globales (en orden de segmento)."""
+        try:
+            while True:
+                item = self._get(self._result_queue, 'postproceso')
+                if item is self._END:
+                    break
+                tile, result = item
+                started = time.perf_counter()
+                
+                if result is None:
+                    self._write_queue.put(('empty', tile, None))
+                    continue
+                
+                detection_count = 0
+                try:
+                    boxes = result.boxes
+                    if boxes is not None and len(boxes) > 0:
+                        with RunMetrics.timed(self.model_manager._metrics, 'cajas'):
+                            centers = self.model_manager._calculate_centers_and_areas(
+                                boxes, tile.start_x, tile.start_y, tile.segment_id, tile.scale)
+                        self._segment_detections.append(centers)
+                        detection_count = len(centers)
+                    else:
+                        centers = np.empty(0, dtype=DETECTION_DTYPE)
+                    self.model_manager._checkpoint_segment(tile.segment_id, centers)
+                except Exception as e:
+                    logger.error(f"❌ Error procesando segmento {tile.segment_id}: {e}")
+                    self._write_queue.put(('empty', tile, None))
+                    continue
+                
+                self._record('postproceso', 1, started)
+                # Latencia de extremo a extremo: desde la extracción, con las esperas en cola
+                self.model_manager._record_segment_latency(
+                    time.perf_counter() - self._segment_started.pop(tile.segment_id, started))
+                logger.info(f"✅ Segmento {tile.segment_id:03d}/{self._total_segments}: "
+                            f"{detection_count} detecciones")
+                self._write_queue.put(('result', tile, result))
+        finally:
+            for _ in range(self.writer_threads):
+                self._write_queue.put(self._END)
+    
+    def _write_stage(self):
+        """Etapa 4: renderiza y guarda la imagen de cada segmento (anotada o vacía)."""
+        while True:
+            item = self._get(self._write_queue, 'escritura')
+            if item is self._END:
+                break
+            kind, tile, result = item
+            started = time.perf_counter()
+            try:
+                if kind == 'result':
+                    self.model_manager._write_annotated_image_timed(result, tile.segment_id,
+                                                                    self.model_manager._annotation_threshold)
+                elif kind == 'background':
+                    self.model_manager._create_empty_result_image(
+                        tile.segment_id, self.model_manager._skipped_segment_reason(tile.segment_id))
+                else:
+                    self.model_manager._create_empty_result_image(tile.segment_id)
+            except Exception as e:
+                # Un fallo no debe parar la etapa: las demás seguirían bloqueadas en la cola llena
+                logger.error(f"❌ Error guardando la imagen del segmento {tile.segment_id}: {e}")
+                with self._stats_lock:
+                    self.write_errors[tile.segment_id] = str(e)
+                self.model_manager._create_empty_result_image(tile.segment_id, "Write error")
+            self._record('escritura', 1, started)
+    
+    def _log_stats(self, wall_seconds: float):
+        logger.info(f"⏱️ Pipeline completado en {wall_seconds:.2f} s")
+        for name, stage in self.stats_summary().items():
+            logger.info(f"   Etapa {name}: {stage['items']} elementos, "
+                        f"{stage['throughput_per_s']:.1f}/s, activa {stage['busy_seconds']:.2f} s, "
+                        f"cola media {stage['avg_queue_depth']:.1f} (máx {stage['max_queue_depth']})")
+        if self.write_errors:
+            logger.warning(f"⚠️ {len(self.write_errors)} segmentos sin imagen anotada: "
+                           f"{sorted(self.write_errors)}")
+
+def _inference_worker_main(config_state: Dict[str, Any], model_path: str, num_threads: int,
+                           task_queue, result_queue):
+    """
+    Proceso de inferencia del pool: carga su propia copia del modelo y procesa
+    segmentos hasta recibir None.
+    
+    Cada tarea trae el segmento en un bloque de memoria compartida (o la ruta
+    del PNG en modo depuración). El proceso calcula las detecciones, escribe
+    la imagen anotada y devuelve solo el array de detecciones.
+    """
+    from multiprocessing import shared_memory
+    import torch
+    from ultralytics import YOLO
+    
+    config.__dict__.update(config_state)
+    torch.set_num_threads(max(1, num_threads))
+    
+    manager = YOLOModelManager()
+    try:
+        manager.model = YOLO(model_path, task='detect')
+        manager.model_path = model_path
+    except Exception as e:
+        result_queue.put(('failed', os.getpid(), str(e)))
+        return
+    result_queue.put(('ready', os.getpid(), None))
+    
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        
+        segment_id, start_x, start_y, scale, payload, confidence_threshold, annotation_threshold, output_dir = task
+        config.OUTPUT_DIR = output_dir
+        try:
+            if payload[0] == 'shm':
+                _, shm_name, shape, dtype = payload
+                shm = shared_memory.SharedMemory(name=shm_name)
+                try:
+                    # Copia local: el bloque queda libre para el siguiente segmento
+                    # aunque el modelo conserve referencias a la imagen
+                    image = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+                finally:
+                    shm.close()
+            else:
+                image = payload[1]
+            
+            result = manager._predict([image], confidence_threshold)[0]
+            boxes = result.boxes
+            if boxes is not None and len(boxes) > 0:
+                detections = manager._calculate_centers_and_areas(boxes, start_x, start_y, segment_id, scale)
+            else:
+                detections = np.empty(0, dtype=DETECTION_DTYPE)
+            written = manager._write_annotated_image(result, segment_id, annotation_threshold)
+            result_queue.put(('done', segment_id, (detections, written, None)))
+            
+        except Exception as e:
+            result_queue.put(('done', segment_id, (None, False, str(e))))
+
+class InferenceWorkerPool:
+    """
+    Pool de procesos de inferencia en CPU, cada uno con su copia del modelo.
+    
+    Los segmentos se copian a bloques de memoria compartida reutilizables (dos
+    por proceso) en lugar de enviarse serializados; los resultados llegan en
+    el orden en que terminan y `run` los devuelve indexados por segmento.
+    Los procesos se mantienen vivos entre láminas hasta llamar a `close`.
+    """
+    
+    def __init__(self, model_path: str, num_workers: int = None, threads_per_worker: int = None):
+        import multiprocessing
+        
+        if threads_per_worker is None:
+            threads_per_worker = config.WORKER_TORCH_THREADS
+        if not num_workers:
+            num_workers = MemoryManager.recommended_worker_count(threads_per_worker)
+        
+        self.model_path = model_path
+        self.last_segment_seconds: Dict[int, float] = {}
+        self._failed_pids: Set[int] = set()
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        
+        context = multiprocessing.get_context('spawn')
+        self._task_queue = context.Queue()
+        self._result_queue = context.Queue()
+        self._processes = [
+            context.Process(target=_inference_worker_main,
+                            args=(dict(config.__dict__), model_path, self.threads_per_worker,
+                                  self._task_queue, self._result_queue),
+                            name=f"inferencia-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        
+        logger.info(f"🧵 Iniciando {self.num_workers} procesos de inferencia "
+                    f"({self.threads_per_worker} hilos de torch cada uno)")
+        for process in self._processes:
+            process.start()
+        self._wait_until_ready()
+    
+    def _wait_until_ready(self):
+        """
+        Espera a que cada proceso cargue el modelo. Los que fallan se retiran
+        del pool (y los bloques en vuelo se dimensionan para los que quedan);
+        solo se aborta si no carga ninguno.
+        """
+        ready = 0
+        errors = []
+        for _ in self._processes:
+            status, pid, error = self._next_message()
+            if status == 'ready':
+                ready += 1
+            else:
+                self._failed_pids.add(pid)
+                errors.append(error)
+        
+        if ready == 0:
+            self.close()
+            raise RuntimeError(f"Ningún proceso de inferencia pudo cargar el modelo: {errors[0]}")
+        if errors:
+            logger.warning(f"⚠️ {len(errors)} procesos no cargaron el modelo: {errors[0]}")
+            for process in self._processes:
+                if process.pid in self._failed_pids:
+                    process.join(timeout=10)
+            self._processes = [process for process in self._processes if process.pid not in self._failed_pids]
+            self.num_workers = len(self._processes)
+        logger.info(f"✅ {ready} procesos de inferencia listos")
+    
+    def _next_message(self):
+        """Siguiente mensaje de los procesos; falla si alguno muere sin responder."""
+        while True:
+            try:
+                return self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # Los que ya avisaron de su fallo al cargar el modelo terminan a propósito
+                if not all(process.is_alive() or process.pid in self._failed_pids for process in self._processes):
+                    raise RuntimeError("Un proceso de inferencia terminó inesperadamente")
+    
+    def run(self, segment_positions: List[SegmentTile], confidence_threshold: float,
+            annotation_threshold: float = None,
+            on_result=None) -> Dict[int, Tuple[Optional[np.ndarray], bool, Optional[str]]]:
+        """
+        Procesa los segmentos y devuelve {segment_id: (detecciones, imagen_escrita, error)}.
+        
+        Las imágenes anotadas solo dibujan las cajas con confianza >=
+        `annotation_threshold` (todas si es None). `on_result(segment_id,
+        detecciones)` se llama en cuanto termina cada segmento sin error.
+        
+        Como mucho hay dos segmentos en vuelo por proceso, que es el número de
+        bloques de memoria compartida. La latencia de cada segmento (desde que
+        se envía hasta que llega su resultado) queda en `last_segment_seconds`.
+        """
+        from multiprocessing import shared_memory
+        
+        slot_bytes = max((self._segment_nbytes(tile) for tile in segment_positions), default=0)
+        slot_count = 2 * self.num_workers
+        slots = [shared_memory.SharedMemory(create=True, size=max(1, slot_bytes)) for _ in range(slot_count)]
+        free_slots = list(range(slot_count))
+        slot_by_segment = {}
+        results = {}
+        submitted_at = {}
+        self.last_segment_seconds = {}
+        total_segments = len(segment_positions)
+        
+        def collect_one():
+            status, segment_id, payload = self._next_message()
+            if status != 'done':
+                return
+            results[segment_id] = payload
+            if segment_id in submitted_at:
+                self.last_segment_seconds[segment_id] = time.perf_counter() - submitted_at.pop(segment_id)
+            slot = slot_by_segment.pop(segment_id, None)
+            if slot is not None:
+                free_slots.append(slot)
+            detections, _, error = payload
+            if error is None:
+                logger.info(f"✅ Segmento {segment_id:03d}/{total_segments}: "
+                            f"{len(detections)} detecciones - Imagen guardada")
+                if on_result is not None:
+                    on_result(segment_id, detections)
+        
+        try:
+            submitted = 0
+            for tile in sorted(segment_positions, key=lambda x: x[2]):
+                if isinstance(tile.source, str):
+                    payload = ('path', tile.source)
+                else:
+                    while not free_slots:
+                        collect_one()
+                    image = np.ascontiguousarray(ImageProcessor.materialize_segment(tile.source))
+                    if image.nbytes > slot_bytes:
+                        payload = ('array', image)
+                    else:
+                        slot = free_slots.pop()
+                        np.ndarray(image.shape, dtype=image.dtype, buffer=slots[slot].buf)[...] = image
+                        slot_by_segment[tile.segment_id] = slot
+                        payload = ('shm', slots[slot].name, image.shape, image.dtype.str)
+                
+                submitted_at[tile.segment_id] = time.perf_counter()
+                self._task_queue.put((tile.segment_id, tile.start_x, tile.start_y, tile.scale, payload,
+                                      confidence_threshold, annotation_threshold, config.OUTPUT_DIR))
+                submitted += 1
+            
+            while len(results) < submitted:
+                collect_one()
+            
+            return results
+            
+        finally:
+            for slot in slots:
+                slot.close()
+                slot.unlink()
+    
+    @staticmethod
+    def _segment_nbytes(tile: SegmentTile) -> int:
+        """Bytes del segmento una vez materializado (0 si se lee de disco)."""
+        source = tile.source
+        if isinstance(source, np.ndarray):
+            return source.nbytes
+        if isinstance(source, TileWindow):
+            width, height = source.output_size or (source.width, source.height)
+            return width * height * 3
+        return 0
+    
+    def close(self):
+        """Detiene los procesos del pool."""
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+# Detección compacta (float32): centro global, segmento, área elíptica, confianza
+# y tamaño de la caja, que permite reconstruirla para la NMS global
+DETECTION_DTYPE = np.dtype([
+    ('center_x', np.float32),
+    ('center_y', np.float32),
+    ('segment_id', np.float32),
+    ('ellipse_area', np.float32),
+    ('confidence', np.float32),
+    ('width', np.float32),
+    ('height', np.float32)
+])
+
+# ============================================================================
+# CACHÉ DE PREDICCIONES
+# ============================================================================
+
+class PredictionCache:
+    """
+    Caché persistente en disco de las predicciones por segmento, direccionada por contenido.
+    
+    La clave es un hash BLAKE2b de los píxeles del segmento, la huella de los
+    pesos del modelo y los ajustes de inferencia: un segmento idéntico se
+    reconoce aunque cambie la lámina, su posición o la segmentación. Cada
+    entrada es un .npy con las cajas del segmento (x1, y1, x2, y2, conf, cls)
+    en coordenadas locales. Al superar `max_mb` se eliminan primero las
+    entradas usadas hace más tiempo (cada acierto renueva su fecha).
+    """
+    
+    def __init__(self, cache_dir: str = None, max_mb: float = None):
+        if cache_dir is None:
+            cache_dir = config.PREDICTION_CACHE_DIR
+        if max_mb is None:
+            max_mb = config.PREDICTION_CACHE_MAX_MB
+        
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._entry_paths())
+        self.reset_stats()
+    
+    @staticmethod
+    def make_key(image: Union[np.ndarray, str], settings: str) -> str:
+        """Hash del segmento (píxeles, o bytes del PNG en modo depuración) y de los ajustes."""
+        digest = hashlib.blake2b(settings.encode('utf-8'), digest_size=20)
+        if isinstance(image, str):
+            with open(image, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        else:
+            digest.update(f"{image.shape}{image.dtype.str}".encode('utf-8'))
+            digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def file_fingerprint(path: str) -> str:
+        """Huella del contenido de un archivo (p. ej. los pesos del modelo)."""
+        return PredictionCache.make_key(path, '')
+    
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Cajas guardadas para `key`, o None si no están en la caché."""
+        path = self._entry_path(key)
+        try:
+            boxes = np.load(path)
+            os.utime(path)  # uso reciente para la política LRU
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+        return boxes
+    
+    def put(self, key: str, boxes: np.ndarray):
+        """Guarda las cajas de un segmento; escritura atómica para no dejar entradas a medias."""
+        path = self._entry_path(key)
+        if os.path.exists(path):
+            return
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(boxes, dtype=np.float32))
+        os.replace(tmp_path, path)
+        
+        with self._lock:
+            self._size += os.path.getsize(path)
+            self.writes += 1
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+    
+    def evict(self, target_fraction: float = 0.9) -> int:
+        """Elimina las entradas menos usadas hasta quedar por debajo de `target_fraction` del tamaño máximo."""
+        with self._lock:
+            entries = []
+            for path in self._entry_paths():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort()
+            
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * target_fraction
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            
+            self._size = total
+            self.evictions += removed
+        return removed
+    
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.writes = 0
+            self.evictions = 0
+    
+    def stats_summary(self) -> Dict[str, Any]:
+        """Aciertos, fallos, escrituras y desalojos desde el último `reset_stats`."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size_mb': self._size / (1024 * 1024)
+            }
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+    
+    def _entry_paths(self):
+        for shard in os.scandir(self.cache_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.npy'):
+                        yield entry.path
+
+# ============================================================================
+# PUNTOS DE CONTROL DE LA DETECCIÓN
+# ============================================================================
+
+class DetectionCheckpoint:
+    """
+    Punto de control de una pasada de detección: un JSONL con una línea por segmento terminado.
+    
+    La primera línea guarda la clave de la pasada (lámina, modelo, umbral y
+    geometría de los segmentos); cada segmento añade sus detecciones en cuanto
+    termina, de modo que un fallo del proceso solo pierde los segmentos en
+    vuelo. Al reanudar, si la clave coincide, los segmentos guardados se
+    cargan y no vuelven a inferirse; si no coincide, se empieza de cero.
+    Una vez guardados los resultados de la pasada, `discard` borra el punto
+    de control: solo se reanudan las pasadas interrumpidas.
+    """
+    
+    FILENAME = 'detection_checkpoint.jsonl'
+    
+    def __init__(self, path: str, run_key: Dict[str, Any], resume: bool = None):
+        if resume is None:
+            resume = config.RESUME_RUNS
+        
+        self.path = path
+        self.run_key = run_key
+        self.completed: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+        
+        valid_bytes = 0
+        if resume and os.path.exists(path):
+            self.completed, valid_bytes = self._load(path, run_key)
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.completed:
+            # La línea a medias de la interrupción se corta para no pegarle los segmentos nuevos
+            os.truncate(path, valid_bytes)
+            self._file = open(path, 'a', encoding='utf-8')
+            logger.info(f"⏯️ Reanudando desde el punto de control: {len(self.completed)} segmentos ya terminados")
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._file.write(json.dumps({'run_key': run_key}) + '\n')
+            self._file.flush()
+    
+    @staticmethod
+    def for_run(image_path: str, segment_positions: List[SegmentTile], model_manager: 'YOLOModelManager',
+                confidence_threshold: float = None) -> Optional['DetectionCheckpoint']:
+        """Punto de control de la pasada en DATA_DIR, o None si CHECKPOINT_RUNS está desactivado."""
+        if not config.CHECKPOINT_RUNS:
+            return None
+        run_key = DetectionCheckpoint.run_key_for(image_path, segment_positions, model_manager, confidence_threshold)
+        return DetectionCheckpoint(os.path.join(config.DATA_DIR, DetectionCheckpoint.FILENAME), run_key)
+    
+    @staticmethod
+    def run_key_for(image_path: str, segment_positions: List[SegmentTile], model_manager: 'YOLOModelManager',
+                    confidence_threshold: float = None) -> Dict[str, Any]:
+        """Clave que identifica una pasada: misma lámina, modelo, umbral de inferencia y segmentos."""
+        geometry = hashlib.blake2b(digest_size=16)
+        for tile in sorted(segment_positions, key=lambda x: x[2]):
+            size = ImageProcessor.segment_size(tile)
+            geometry.update(f"{tile.segment_id},{tile.start_x},{tile.start_y},{size},{tile.scale:.6f};".encode('utf-8'))
+        
+        stat = os.stat(image_path)
+        model_stat = os.stat(model_manager.model_path)
+        return {
+            'slide_path': os.path.abspath(image_path),
+            'slide_size_bytes': stat.st_size,
+            'slide_mtime': stat.st_mtime,
+            'model_path': os.path.abspath(model_manager.model_path),
+            'model_mtime': model_stat.st_mtime,
+            'backend': model_manager.backend,
+            'inference_threshold': YOLOModelManager.prediction_floor_threshold(confidence_threshold),
+            'segments': len(segment_positions),
+            'segment_geometry': geometry.hexdigest()
+        }
+    
+    @staticmethod
+    def _load(path: str, run_key: Dict[str, Any]) -> Tuple[Dict[int, np.ndarray], int]:
+        """
+        Segmentos terminados de un punto de control compatible (vacío si la
+        clave no coincide) y bytes del archivo hasta el final de la última
+        línea válida. Las líneas incompletas o ilegibles se saltan.
+        """
+        completed = {}
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8') or '{}')
+                if header.get('run_key') != json.loads(json.dumps(run_key)):
+                    logger.info("Punto de control de otra pasada: se empieza de cero")
+                    return {}, 0
+                position = valid_bytes = f.tell()
+                for line in f:
+                    position += len(line)
+                    if not line.endswith(b'\n'):
+                        break  # Última línea a medias por la interrupción
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                        detections = np.array([tuple(row) for row in record['detections']], dtype=DETECTION_DTYPE)
+                        completed[int(record['segment_id'])] = detections
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("⚠️ Línea dañada en el punto de control: se omite")
+                        continue
+                    valid_bytes = position
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Punto de control ilegible ({e}): se empieza de cero")
+            return {}, 0
+        return completed, valid_bytes
+    
+    def append(self, segment_id: int, detections: np.ndarray):
+        """Añade un segmento terminado (también los que no tienen detecciones)."""
+        line = json.dumps({'segment_id': int(segment_id), 'detections': detections.tolist()})
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+    
+    def drop_segments_without_image(self, output_dir: str = None) -> int:
+        """
+        Olvida los segmentos terminados cuya imagen result_XXX.png no llegó a
+        escribirse (la interrupción los pilló en vuelo): se vuelven a inferir.
+        """
+        if output_dir is None:
+            output_dir = config.OUTPUT_DIR
+        
+        missing = [segment_id for segment_id in self.completed
+                   if not os.path.exists(os.path.join(output_dir, f"result_{str(segment_id).zfill(3)}.png"))]
+        for segment_id in missing:
+            del self.completed[segment_id]
+        if missing:
+            logger.info(f"⏯️ {len(missing)} segmentos del punto de control sin imagen: se vuelven a procesar")
+        return len(missing)
+    
+    def completed_detections(self) -> List[np.ndarray]:
+        """Detecciones de los segmentos cargados al reanudar, en orden de segmento."""
+        return [self.completed[segment_id] for segment_id in sorted(self.completed)]
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def discard(self):
+        """Borra el punto de control de una pasada terminada y guardada."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo borrar el punto de control {self.path}: {e}")
+
+# ============================================================================
+# SERVIDOR DE INFERENCIA LOCAL
+# ============================================================================
+
+class InferenceDaemon:
+    """
+    Servidor de inferencia local: mantiene el modelo cargado y caliente entre ejecuciones.
+    
+    Escucha en INFERENCE_DAEMON_ADDRESS (TCP en 127.0.0.1 por defecto, que
+    también sirve en Windows, o la ruta de un socket Unix o de una tubería con
+    nombre) y atiende a la aplicación, al procesamiento por lotes y a
+    cualquier otra herramienta mediante `InferenceClient`. Cada conexión
+    tiene su hilo; los lotes de segmentos entran en una única cola que un
+    solo hilo pasa por el modelo, en orden de llegada. Las peticiones
+    'health' y 'metrics' se responden al momento, aunque el modelo esté
+    ocupado.
+    
+    Los mensajes se serializan con pickle, así que las conexiones se
+    autentican con la clave de INFERENCE_DAEMON_KEY_FILE, legible solo por el
+    usuario que arranca el servidor.
+    """
+    
+    LATENCY_WINDOW = 1000  # Lotes recientes sobre los que se calculan los percentiles de latencia
+    
+    def __init__(self, model_manager: 'YOLOModelManager', address: str = None):
+        if address is None:
+            address = config.INFERENCE_DAEMON_ADDRESS
+        self.model_manager = model_manager
+        self.address = address
+        self.started = time.time()
+        self.warmup_seconds = None
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats = PipelineStageStats('inferencia')
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._requests = 0
+        self._errors = 0
+        self._clients = 0
+        self._pending_tiles = 0
+    
+    @staticmethod
+    def parse_address(address: str) -> Union[Tuple[str, int], str]:
+        """'host:puerto' es una dirección TCP; cualquier otra cadena, la ruta de un socket Unix o una tubería."""
+        host, separator, port = address.rpartition(':')
+        if separator and host and port.isdigit():
+            return host, int(port)
+        return address
+    
+    @staticmethod
+    def authkey(create: bool = False) -> Optional[bytes]:
+        """Clave compartida de las conexiones; con `create`, el servidor la genera si no existe."""
+        path = config.INFERENCE_DAEMON_KEY_FILE
+        try:
+            with open(path, 'rb') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            if not create:
+                return None
+        
+        import secrets
+        key = secrets.token_hex(32).encode('ascii')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        logger.info(f"🔑 Clave del servidor de inferencia creada en {path}")
+        return key
+    
+    def serve_forever(self):
+        """Calienta el modelo y atiende conexiones hasta recibir 'shutdown' (o Ctrl+C)."""
+        from multiprocessing import AuthenticationError
+        from multiprocessing.connection import Listener
+        
+        self._warm_up()
+        address = self.parse_address(self.address)
+        if isinstance(address, str) and not address.startswith('\\\\') and os.path.exists(address):
+            os.unlink(address)  # Socket de un servidor anterior que no se cerró limpiamente
+        listener = Listener(address, authkey=self.authkey(create=True))
+        worker = threading.Thread(target=self._inference_loop, name="servidor-inferencia", daemon=True)
+        worker.start()
+        logger.info(f"🛰️ Servidor de inferencia escuchando en {self.address} (PID {os.getpid()})")
+        
+        try:
+            while not self._stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    logger.warning("⚠️ Conexión rechazada: clave incorrecta")
+                    continue
+                if self._stopping.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._serve_client, args=(conn,),
+                                 name="cliente-inferencia", daemon=True).start()
+        finally:
+            # Con el candado, ningún lote puede encolarse ya detrás del centinela
+            with self._lock:
+                self._stopping.set()
+                self._jobs.put(None)
+            listener.close()
+            worker.join()
+            logger.info("🛑 Servidor de inferencia detenido")
+    
+    def stop(self):
+        """Pide al bucle de `serve_forever` que termine (una conexión vacía lo despierta del accept)."""
+        from multiprocessing.connection import Client
+        
+        self._stopping.set()
+        try:
+            Client(self.parse_address(self.address), authkey=self.authkey()).close()
+        except Exception:
+            pass
+    
+    def _warm_up(self):
+        """Primera inferencia de prueba: las peticiones reales no pagan la inicialización del backend."""
+        size = self.model_manager.input_size()
+        started = time.perf_counter()
+        self.model_manager.model([np.zeros((size, size, 3), dtype=np.uint8)], conf=0.5, verbose=False)
+        self.warmup_seconds = time.perf_counter() - started
+        logger.info(f"🔥 Modelo caliente ({self.warmup_seconds:.2f} s)")
+    
+    def _serve_client(self, conn):
+        """Atiende las peticiones de una conexión hasta que el cliente la cierra."""
+        with self._lock:
+            self._clients += 1
+        try:
+            while True:
+                request = conn.recv()
+                conn.send(self._handle(request))
+                if isinstance(request, dict) and request.get('op') == 'shutdown':
+                    self.stop()
+                    break
+        except (EOFError, OSError):
+            pass  # El cliente ha cerrado la conexión
+        finally:
+            conn.close()
+            with self._lock:
+                self._clients -= 1
+    
+    def _handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op') if isinstance(request, dict) else None
+        if op == 'predict':
+            return self._submit(request['sources'], float(request['conf']))
+        if op == 'health':
+            return self.health()
+        if op == 'metrics':
+            return self.metrics()
+        if op == 'shutdown':
+            logger.info("Parada solicitada por un cliente")
+            return {'ok': True}
+        return {'ok': False, 'error': f"Operación desconocida: {op}"}
+    
+    def _submit(self, sources: List[Union[np.ndarray, str]], confidence_threshold: float,
+                timeout: float = None) -> Dict[str, Any]:
+        """
+        Encola un lote y espera su respuesta como mucho `timeout` segundos.
+        
+        Si el servidor se está deteniendo o el lote no termina a tiempo, la
+        respuesta lleva 'unavailable' y el cliente sigue con el modelo en su
+        propio proceso.
+        """
+        if timeout is None:
+            timeout = config.INFERENCE_DAEMON_TIMEOUT_S
+        
+        job = {'sources': sources, 'conf': confidence_threshold, 'queued': time.perf_counter(),
+               'done': threading.Event(), 'response': None}
+        with self._lock:
+            if self._stopping.is_set():
+                return {'ok': False, 'unavailable': True, 'error': "el servidor de inferencia se está deteniendo"}
+            self._pending_tiles += len(sources)
+            self._jobs.put(job)
+            self._stats.sample_queue(self._jobs.qsize())
+        if not job['done'].wait(timeout):
+            return {'ok': False, 'unavailable': True, 'error': f"el lote no terminó en {timeout:.0f} s"}
+        return job['response']
+    
+    def _inference_loop(self):
+        """
+        Hilo del modelo: atiende los lotes encolados de uno en uno hasta recibir
+        None; los que quedan detrás se responden con error para no dejar a sus
+        clientes esperando.
+        """
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            
+            started = time.perf_counter()
+            try:
+                results = self.model_manager._predict(job['sources'], job['conf'])
+                response = {'ok': True,
+                            'boxes': [result.boxes.data.detach().cpu().numpy() for result in results]}
+            except Exception as e:
+                logger.error(f"Error en un lote de {len(job['sources'])} segmentos: {e}")
+                response = {'ok': False, 'error': str(e)}
+            finished = time.perf_counter()
+            
+            with self._lock:
+                self._requests += 1
+                self._errors += 0 if response['ok'] else 1
+                self._pending_tiles -= len(job['sources'])
+                self._stats.items += len(job['sources'])
+                self._stats.busy_seconds += finished - started
+                self._latencies.append(finished - job['queued'])
+            job['response'] = response
+            job['done'].set()
+        
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                continue
+            with self._lock:
+                self._pending_tiles -= len(job['sources'])
+            job['response'] = {'ok': False, 'unavailable': True,
+                               'error': "el servidor de inferencia se detuvo antes de atender el lote"}
+            job['done'].set()
+    
+    def health(self) -> Dict[str, Any]:
+        """Estado del servidor y del modelo que sirve (lo comprueban los clientes al conectar)."""
+        manager = self.model_manager
+        return {
+            'ok': True,
+            'status': 'stopping' if self._stopping.is_set() else 'ready',
+            'pid': os.getpid(),
+            'address': self.address,
+            'uptime_s': time.time() - self.started,
+            'weights_path': os.path.abspath(manager.weights_path),
+            'model_path': os.path.abspath(manager.model_path),
+            'requested_backend': config.INFERENCE_BACKEND,
+            'backend': manager.backend,
+            'device': manager.device,
+            'names': dict(manager.model.names),
+            'imgsz': manager.model.overrides.get('imgsz'),
+            'warmup_seconds': self.warmup_seconds
+        }
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Profundidad de la cola, peticiones atendidas, rendimiento y latencias (cola + inferencia) por lote."""
+        with self._lock:
+            latencies_ms = np.array(self._latencies) * 1000.0
+            summary = {
+                'ok': True,
+                'uptime_s': time.time() - self.started,
+                'clients': self._clients,
+                'queue_depth': self._jobs.qsize(),
+                'pending_tiles': self._pending_tiles,
+                'requests': self._requests,
+                'errors': self._errors,
+                'tiles': self._stats.items,
+                'busy_seconds': self._stats.busy_seconds,
+                'throughput_per_s': self._stats.as_dict()['throughput_per_s'],
+                'avg_queue_depth': self._stats.as_dict()['avg_queue_depth'],
+                'max_queue_depth': self._stats.max_queue_depth
+            }
+        if len(latencies_ms):
+            for percentile in RunMetrics.PERCENTILES:
+                summary[f'latency_p{percentile}_ms'] = float(np.percentile(latencies_ms, percentile))
+        return summary
+
+class InferenceClient:
+    """
+    Cliente del servidor de inferencia local, con la misma interfaz que el modelo YOLO.
+    
+    `client(segmentos, conf=...)` devuelve resultados de ultralytics y tiene
+    `names` y `overrides` como el modelo, así que YOLOModelManager lo usa en
+    su lugar sin más cambios. Si la conexión se pierde o el servidor no
+    responde a tiempo se lanza ConnectionError; los errores del propio modelo
+    llegan como RuntimeError.
+    """
+    
+    def __init__(self, conn, address: str):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.address = address
+        self.health = {}
+        self.names = {}
+        self.overrides = {}
+    
+    @staticmethod
+    def connect(address: str = None) -> Optional['InferenceClient']:
+        """Conecta con el servidor y comprueba su salud; None si no está en marcha o no responde."""
+        from multiprocessing import AuthenticationError
+        from multiprocessing.connection import Client
+        
+        if address is None:
+            address = config.INFERENCE_DAEMON_ADDRESS
+        authkey = InferenceDaemon.authkey()
+        if authkey is None:
+            return None  # Sin clave no se ha arrancado nunca un servidor con este usuario
+        
+        try:
+            conn = Client(InferenceDaemon.parse_address(address), authkey=authkey)
+        except (OSError, AuthenticationError):
+            return None
+        
+        client = InferenceClient(conn, address)
+        try:
+            client.health = client.request({'op': 'health'}, timeout=config.INFERENCE_DAEMON_CONNECT_TIMEOUT_S)
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"⚠️ El servidor de inferencia de {address} no responde: {e}")
+            client.close()
+            return None
+        client.names = client.health['names']
+        client.overrides = {'imgsz': client.health['imgsz']}
+        return client
+    
+    def request(self, message: Dict[str, Any], timeout: float = None) -> Dict[str, Any]:
+        """Envía una petición y espera su respuesta (una petición en vuelo por conexión)."""
+        if timeout is None:
+            timeout = config.INFERENCE_DAEMON_TIMEOUT_S
+        
+        with self._lock:
+            if self._conn is None:
+                raise ConnectionError(f"Conexión con el servidor de inferencia de {self.address} cerrada")
+            try:
+                self._conn.send(message)
+                if not self._conn.poll(timeout):
+                    raise TimeoutError(f"sin respuesta en {timeout:.0f} s")
+                response = self._conn.recv()
+            except (EOFError, OSError) as e:
+                # Una respuesta que llegue tarde desordenaría la conexión: no se reutiliza
+                self._conn.close()
+                self._conn = None
+                raise ConnectionError(f"Servidor de inferencia de {self.address} no disponible ({e})") from e
+        
+        if response.get('unavailable'):
+            # El servidor se detiene o está atascado: el cliente sigue en su propio proceso
+            self.close()
+            raise ConnectionError(f"Servidor de inferencia de {self.address} no disponible ({response['error']})")
+        if not response.get('ok'):
+            raise RuntimeError(f"Error del servidor de inferencia: {response.get('error')}")
+        return response
+    
+    def __call__(self, sources: List[Union[np.ndarray, str]], conf: float = 0.25, verbose: bool = False) -> list:
+        response = self.request({'op': 'predict', 'sources': list(sources), 'conf': conf})
+        return [YOLOModelManager.results_from_boxes(source, boxes, self.names)
+                for source, boxes in zip(sources, response['boxes'])]
+    
+    def metrics(self) -> Dict[str, Any]:
+        return self.request({'op': 'metrics'}, timeout=config.INFERENCE_DAEMON_CONNECT_TIMEOUT_S)
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class YOLOModelManager:
+    """Gestiona la carga y uso del modelo YOLO de forma optimizada."""
+    
+    def __init__(self):
+        self.model = None
+        self.model_path = None
+        self.weights_path = None
+        self.backend = 'torch'
+        self.device = None
+        self.last_merge_stats = None
+        self._merge_overlaps = False
+        self._image_writer = None
+        self._worker_pool = None
+        self.last_pipeline_stats = None
+        self.raw_detections = None
+        self._annotation_threshold = None
+        self.prediction_cache = None
+        self.model_fingerprint = None
+        self.last_cache_stats = None
+        self._background_segments = set()
+        self.last_tissue_stats = None
+        self._roi_segments = set()
+        self.last_roi_stats = None
+        self.last_roi_recall = None
+        self._checkpoint = None
+        self._metrics = None
+    
+    def find_model_path(self) -> Optional[str]:
+        """Busca el modelo YOLO en las rutas especificadas."""
+        for path in config.MODEL_PATHS:
+            if os.path.exists(path):
+                logger.info(f"Modelo encontrado en: {path}")
+                return path
+        
+        logger.error("No se encontró el modelo YOLO en ninguna ruta")
+        return None
+    
+    def load_model(self) -> bool:
+        """
+        Carga el modelo YOLO con configuración optimizada.
+        
+        Con USE_INFERENCE_DAEMON, si hay un servidor de inferencia local en
+        marcha con los mismos pesos y backend, se usa su modelo (ya cargado y
+        caliente); si no, el modelo se carga en este proceso.
+        """
+        try:
+            self.weights_path = self.find_model_path()
+            if not self.weights_path:
+                return False
+            
+            if not (config.USE_INFERENCE_DAEMON and self._connect_inference_daemon()):
+                self._load_local_model()
+            
+            if config.USE_PREDICTION_CACHE:
+                self._open_prediction_cache()
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error cargando modelo: {e}")
+            return False
+    
+    def _load_local_model(self):
+        """Carga el modelo en este proceso (exportándolo antes si el backend no es torch)."""
+        import torch
+        from ultralytics import YOLO
+        
+        self.model_path = self.weights_path
+        self.backend = 'torch'
+        if config.INFERENCE_BACKEND != 'torch':
+            try:
+                self.model_path = self.export_model(self.weights_path, config.INFERENCE_BACKEND)
+                self.backend = config.INFERENCE_BACKEND
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo preparar el backend {config.INFERENCE_BACKEND} ({e}): "
+                               f"se usa torch")
+        
+        logger.info(f"Cargando modelo YOLO ({self.backend})...")
+        self.model = YOLO(self.model_path, task='detect')
+        
+        # Configurar modelo para mejor rendimiento
+        if self.backend == 'torch' and torch.cuda.is_available():
+            self.model.to('cuda')
+            self.device = 'cuda'
+            logger.info("Modelo cargado en GPU")
+        else:
+            self.device = 'cpu'
+            logger.info("Modelo cargado en CPU")
+    
+    def _connect_inference_daemon(self) -> bool:
+        """Usa el modelo del servidor de inferencia local si está en marcha y sirve los mismos pesos y backend."""
+        client = InferenceClient.connect()
+        if client is None:
+            logger.info("Servidor de inferencia no disponible: el modelo se carga en este proceso")
+            return False
+        
+        health = client.health
+        if (os.path.normcase(health['weights_path']) != os.path.normcase(os.path.abspath(self.weights_path))
+                or health['requested_backend'] != config.INFERENCE_BACKEND):
+            logger.warning(f"⚠️ El servidor de inferencia de {client.address} sirve otro modelo "
+                           f"({health['weights_path']}, {health['requested_backend']}): "
+                           f"el modelo se carga en este proceso")
+            client.close()
+            return False
+        
+        self.model = client
+        self.model_path = health['model_path']
+        self.backend = health['backend']
+        self.device = health['device']
+        logger.info(f"🛰️ Usando el servidor de inferencia de {client.address} "
+                    f"(PID {health['pid']}, {self.backend}, {self.device})")
+        return True
+    
+    def uses_inference_daemon(self) -> bool:
+        """True si las predicciones las hace el servidor de inferencia local."""
+        return isinstance(self.model, InferenceClient)
+    
+    def input_size(self) -> int:
+        """Lado de entrada del modelo (imgsz) para el troceado en modo 'model'."""
+        if config.MODEL_INPUT_SIZE > 0:
+            return config.MODEL_INPUT_SIZE
+        imgsz = self.model.overrides.get('imgsz') if self.model is not None else None
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = max(imgsz)
+        return int(imgsz) if imgsz else config.EXPORT_IMGSZ
+    
+    def _open_prediction_cache(self):
+        """Abre la caché de predicciones; sin ella se infiere siempre."""
+        try:
+            self.model_fingerprint = PredictionCache.file_fingerprint(self.model_path
+                                                                     if os.path.isfile(self.model_path)
+                                                                     else self.weights_path)
+            self.prediction_cache = PredictionCache()
+            logger.info(f"🗃️ Caché de predicciones: {self.prediction_cache.cache_dir} "
+                        f"({self.prediction_cache.stats_summary()['size_mb']:.1f} MB)")
+        except Exception as e:
+            logger.warning(f"⚠️ Caché de predicciones no disponible ({e})")
+            self.prediction_cache = None
+    
+    def _cache_settings(self, confidence_threshold: float) -> str:
+        """Parte de la clave de caché que depende del modelo y de los ajustes de inferencia."""
+        import ultralytics
+        model_version = self.model_fingerprint
+        if not os.path.isfile(self.model_path):
+            # Modelos exportados a carpeta (OpenVINO): la fecha de exportación distingue recalibraciones
+            model_version += f"@{os.path.getmtime(self.model_path):.0f}"
+        return (f"{model_version}|{self.backend}|conf={confidence_threshold:.6g}|"
+                f"ultralytics={ultralytics.__version__}")
+    
+    @staticmethod
+    def exported_model_path(weights_path: str, backend: str) -> str:
+        """Ruta en la que ultralytics deja el modelo exportado, junto a los pesos."""
+        weights = Path(weights_path)
+        if backend == 'onnx':
+            return str(weights.with_suffix('.onnx'))
+        if backend == 'openvino':
+            return str(weights.parent / f"{weights.stem}_openvino_model")
+        if backend == 'openvino-int8':
+            return str(weights.parent / f"{weights.stem}_int8_openvino_model")
+        raise ValueError(f"Backend de inferencia no válido: {backend} "
+                         f"(opciones: torch, onnx, openvino, openvino-int8)")
+    
+    @staticmethod
+    def export_model(weights_path: str, backend: str, imgsz: int = None, force: bool = False,
+                     calibration_data: str = None) -> str:
+        """
+        Exporta `weights.pt` a ONNX u OpenVINO IR una sola vez y reutiliza la copia.
+        
+        La exportación queda junto a los pesos con un `.export.json` que guarda
+        los pesos y parámetros de origen; si alguno cambia se vuelve a exportar.
+        El eje de lote y el tamaño de entrada son dinámicos, así que el
+        letterbox y los lotes son los mismos que con torch.
+        
+        'openvino-int8' aplica cuantización estática post-entrenamiento (NNCF)
+        calibrada con el data.yaml de `build_calibration_dataset`.
+        """
+        import ultralytics
+        
+        if imgsz is None:
+            imgsz = config.EXPORT_IMGSZ
+        
+        int8 = backend == 'openvino-int8'
+        if int8 and calibration_data is None:
+            calibration_data = os.path.join(YOLOModelManager.calibration_dir(weights_path), "data.yaml")
+        
+        export_path = YOLOModelManager.exported_model_path(weights_path, backend)
+        info_path = export_path.rstrip('/\\') + '.export.json'
+        weights_stat = os.stat(weights_path)
+        export_info = {
+            'weights_size': weights_stat.st_size,
+            'weights_mtime': weights_stat.st_mtime,
+            'backend': backend,
+            'imgsz': imgsz,
+            'dynamic': True,
+            'ultralytics': ultralytics.__version__
+        }
+        if int8:
+            if not os.path.exists(calibration_data):
+                raise FileNotFoundError(f"Falta el conjunto de calibración INT8 ({calibration_data}); "
+                                        f"ejecuta quantize_model.py")
+            export_info['calibration_data'] = os.path.abspath(calibration_data)
+            export_info['calibration_mtime'] = os.stat(calibration_data).st_mtime
+        
+        if not force and os.path.exists(export_path) and os.path.exists(info_path):
+            with open(info_path, encoding='utf-8') as f:
+                if json.load(f) == export_info:
+                    logger.info(f"Modelo {backend} en caché: {export_path}")
+                    return export_path
+        
+        from ultralytics import YOLO
+        
+        logger.info(f"📦 Exportando {os.path.basename(weights_path)} a {backend} (imgsz={imgsz})...")
+        start_time = time.perf_counter()
+        if int8:
+            exported = YOLO(weights_path).export(format='openvino', imgsz=imgsz, dynamic=True, device='cpu',
+                                                 int8=True, data=calibration_data)
+        else:
+            exported = YOLO(weights_path).export(format=backend, imgsz=imgsz, dynamic=True, device='cpu')
+        if os.path.abspath(str(exported)) != os.path.abspath(export_path):
+            export_path = str(exported)
+            info_path = export_path.rstrip('/\\') + '.export.json'
+        
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(export_info, f, indent=2)
+        logger.info(f"✅ Exportado en {time.perf_counter() - start_time:.1f} s: {export_path}")
+        return export_path
+    
+    @staticmethod
+    def calibration_dir(weights_path: str) -> str:
+        """Carpeta, junto a los pesos, con los segmentos de calibración INT8 y su data.yaml."""
+        weights = Path(weights_path)
+        return str(weights.parent / f"{weights.stem}_int8_calibration")
+    
+    @staticmethod
+    def sample_slide_tiles(slide_paths: List[str], num_tiles: int,
+                           exclude: Dict[str, Set[int]] = None) -> Tuple[List[np.ndarray], Dict[str, List[int]]]:
+        """
+        Toma `num_tiles` segmentos repartidos entre todas las láminas y, dentro
+        de cada una, espaciados por toda la rejilla.
+        
+        Los índices de `exclude` (por lámina) no se toman, para que el conjunto
+        de evaluación no comparta segmentos con el de calibración. Si una
+        lámina no tiene bastantes segmentos, lo que falta se pide a las
+        siguientes. Devuelve los segmentos y los índices tomados de cada lámina.
+        """
+        if exclude is None:
+            exclude = {}
+        
+        tiles = []
+        taken = {}
+        for position, slide_path in enumerate(slide_paths):
+            quota = ceil((num_tiles - len(tiles)) / (len(slide_paths) - position))
+            if quota <= 0:
+                break
+            
+            slide, _ = ImageProcessor.open_slide(slide_path)
+            try:
+                segment_positions, _, _ = ImageProcessor.divide_image_optimized(slide)
+                excluded = exclude.get(slide_path, set())
+                available = [i for i in range(len(segment_positions)) if i not in excluded]
+                step = len(available) / quota
+                indices = [available[int(i * step)] for i in range(min(quota, len(available)))]
+                tiles.extend(np.ascontiguousarray(ImageProcessor.materialize_segment(segment_positions[i].source))
+                             for i in indices)
+                taken[slide_path] = indices
+            finally:
+                if isinstance(slide, SlideReader):
+                    slide.close()
+        
+        return tiles, taken
+    
+    @staticmethod
+    def build_calibration_dataset(weights_path: str, slide_paths: List[str],
+                                  num_tiles: int = None) -> Tuple[str, Dict[str, List[int]]]:
+        """
+        Escribe los segmentos de calibración INT8 y el data.yaml que lee ultralytics.
+        
+        Los segmentos salen de nuestras propias láminas; la cuantización
+        estática solo necesita las imágenes, no etiquetas. Devuelve la ruta del
+        data.yaml y los índices de segmento usados en cada lámina, que la
+        evaluación debe excluir.
+        """
+        if num_tiles is None:
+            num_tiles = config.INT8_CALIBRATION_TILES
+        
+        dataset_dir = Path(YOLOModelManager.calibration_dir(weights_path))
+        images_dir = dataset_dir / "images"
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        images_dir.mkdir(parents=True)
+        
+        tiles, indices = YOLOModelManager.sample_slide_tiles(slide_paths, num_tiles)
+        for index, tile in enumerate(tiles):
+            cv2.imwrite(str(images_dir / f"calib_{index:04d}.png"), tile)
+        
+        data_yaml = dataset_dir / "data.yaml"
+        data_yaml.write_text(
+            f"path: {dataset_dir.as_posix()}\ntrain: images\nval: images\nnames:\n  0: canal_havers\n",
+            encoding='utf-8'
+        )
+        logger.info(f"🎯 Conjunto de calibración: {len(tiles)} segmentos de {len(indices)} láminas → {dataset_dir}")
+        return str(data_yaml), indices
+    
+    @staticmethod
+    def quantization_report(weights_path: str, quantized_path: str, sources: List[np.ndarray],
+                            confidence_threshold: float = None) -> Dict[str, Any]:
+        """
+        Compara el modelo INT8 con el FP32 (torch) sobre los mismos segmentos.
+        
+        Incluye recuentos, cajas perdidas/sobrantes, IoU de las cajas
+        emparejadas (IoU >= 0.5) y el tiempo medio por segmento de cada modelo.
+        Los dos modelos se ejecutan en CPU, donde se usará el INT8, para que la
+        aceleración no compare con el FP32 en GPU.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        
+        from ultralytics import YOLO
+        
+        timings = {}
+        results = {}
+        for name, path in (('fp32', weights_path), ('int8', quantized_path)):
+            model = YOLO(path, task='detect')
+            model(sources[:1], conf=confidence_threshold, device='cpu', verbose=False)  # calentamiento
+            start_time = time.perf_counter()
+            results[name] = [model([source], conf=confidence_threshold, device='cpu', verbose=False)[0]
+                             for source in sources]
+            timings[name] = (time.perf_counter() - start_time) / max(1, len(sources))
+        
+        report = YOLOModelManager.compare_predictions(results['fp32'], results['int8'], match_iou=0.5)
+        report.update({
+            'confidence_threshold': confidence_threshold,
+            'fp32_seconds_per_tile': timings['fp32'],
+            'int8_seconds_per_tile': timings['int8'],
+            'speedup': timings['fp32'] / timings['int8'] if timings['int8'] > 0 else 0.0,
+            'count_ratio': (report['candidate_detections'] / report['reference_detections']
+                            if report['reference_detections'] else 1.0)
+        })
+        
+        logger.info(f"📊 INT8 vs FP32 ({report['tiles']} segmentos): "
+                    f"{report['candidate_detections']}/{report['reference_detections']} detecciones, "
+                    f"recall {report['recall']:.3f}, precisión {report['precision']:.3f}, "
+                    f"IoU medio {report['mean_iou']:.3f}, aceleración x{report['speedup']:.2f}")
+        return report
+    
+    @staticmethod
+    def compare_predictions(reference_results: list, candidate_results: list,
+                            match_iou: float = 0.5) -> Dict[str, Any]:
+        """
+        Compara dos listas de resultados de ultralytics sobre los mismos segmentos.
+        
+        Empareja las cajas de forma voraz (por confianza de la referencia) con
+        IoU >= `match_iou` y resume recuentos, cajas sin pareja, IoU y
+        diferencias de confianza de los pares.
+        """
+        from torchvision.ops import box_iou
+        
+        reference_count = candidate_count = mismatched_tiles = 0
+        matched_ious = []
+        confidence_diffs = []
+        
+        for reference, candidate in zip(reference_results, candidate_results):
+            ref_boxes = reference.boxes.xyxy.detach().cpu().float()
+            ref_conf = reference.boxes.conf.detach().cpu().float()
+            cand_boxes = candidate.boxes.xyxy.detach().cpu().float()
+            cand_conf = candidate.boxes.conf.detach().cpu().float()
+            
+            reference_count += len(ref_boxes)
+            candidate_count += len(cand_boxes)
+            mismatched_tiles += int(len(ref_boxes) != len(cand_boxes))
+            if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+                continue
+            
+            ious = box_iou(ref_boxes, cand_boxes).numpy()
+            used = np.zeros(len(cand_boxes), dtype=bool)
+            for ref_index in np.argsort(-ref_conf.numpy()):
+                row = np.where(used, -1.0, ious[ref_index])
+                best = int(row.argmax())
+                if row[best] >= match_iou:
+                    used[best] = True
+                    matched_ious.append(float(row[best]))
+                    confidence_diffs.append(abs(float(ref_conf[ref_index]) - float(cand_conf[best])))
+        
+        matched = len(matched_ious)
+        return {
+            'tiles': min(len(reference_results), len(candidate_results)),
+            'reference_detections': reference_count,
+            'candidate_detections': candidate_count,
+            'tiles_with_count_mismatch': mismatched_tiles,
+            'matched': matched,
+            'missed': reference_count - matched,
+            'extra': candidate_count - matched,
+            'recall': matched / reference_count if reference_count else 1.0,
+            'precision': matched / candidate_count if candidate_count else 1.0,
+            'mean_iou': float(np.mean(matched_ious)) if matched else 1.0,
+            'min_iou': float(np.min(matched_ious)) if matched else 1.0,
+            'max_confidence_diff': float(np.max(confidence_diffs)) if matched else 0.0
+        }
+    
+    def check_backend_parity(self, sources: List[Union[np.ndarray, str]],
+                             confidence_threshold: float = None) -> Dict[str, Any]:
+        """
+        Compara el backend cargado con el modelo torch original sobre los mismos segmentos.
+        
+        Pasa si todas las cajas tienen pareja (mismo recuento), IoU >=
+        PARITY_MIN_IOU y diferencia de confianza <= PARITY_MAX_CONF_DIFF.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        
+        if not self.model:
+            raise ValueError("Modelo no cargado")
+        
+        from ultralytics import YOLO
+        
+        reference_model = YOLO(self.weights_path)
+        reference_results = reference_model(sources, conf=confidence_threshold, verbose=False)
+        candidate_results = self._predict(sources, confidence_threshold)
+        
+        report = self.compare_predictions(reference_results, candidate_results, match_iou=config.PARITY_MIN_IOU)
+        report['backend'] = self.backend
+        report['passed'] = (report['missed'] == 0 and report['extra'] == 0 and
+                            report['max_confidence_diff'] <= config.PARITY_MAX_CONF_DIFF)
+        
+        status = "✅ Paridad correcta" if report['passed'] else "❌ Paridad fallida"
+        logger.info(f"{status} ({self.backend} vs torch, {report['tiles']} segmentos): "
+                    f"{report['candidate_detections']}/{report['reference_detections']} detecciones, "
+                    f"IoU mín {report['min_iou']:.4f}, Δconf máx {report['max_confidence_diff']:.2e}")
+        return report
+    
+    def process_all_segments_sequentially(self, segment_positions: List[SegmentTile],
+                                        confidence_threshold: float = None,
+                                        merge_overlaps: bool = None) -> np.ndarray:
+        """
+        FUNCIÓN CLAVE: Procesa TODOS los segmentos uno por uno en orden secuencial
+        para asegurar que no se pierda ninguno.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        
+        if not self.model:
+            raise ValueError("Modelo no cargado")
+        
+        self._start_detection_run(merge_overlaps)
+        segment_detections = []
+        total_segments = len(segment_positions)
+        
+        logger.info(f"🔄 PROCESAMIENTO SECUENCIAL: {total_segments} segmentos")
+        
+        # Ordenar por segment_id para mantener orden
+        sorted_positions = sorted(segment_positions, key=lambda x: x[2])
+        
+        # Procesar cada segmento individualmente
+        for i, tile in enumerate(sorted_positions):
+            if not self._segment_needs_inference(tile):
+                continue
+            
+            segment_start = time.perf_counter()
+            self._process_single_segment(tile, confidence_threshold, total_segments, segment_detections)
+            self._record_segment_latency(time.perf_counter() - segment_start)
+            
+            # Limpiar memoria cada 10 segmentos
+            if i % 10 == 0:
+                MemoryManager.clear_cache()
+        
+        detections = self._finalize_detections(segment_detections)
+        self._log_processing_summary(detections, total_segments)
+        return detections
+    
+    def process_all_segments_batched(self, segment_positions: List[SegmentTile],
+                                     confidence_threshold: float = None,
+                                     batch_size: int = None,
+                                     merge_overlaps: bool = None) -> np.ndarray:
+        """
+        Procesa los segmentos en lotes de `batch_size` por llamada al modelo.
+        
+        Mantiene la garantía del modo secuencial: si un lote falla se reprocesa
+        segmento a segmento, de forma que cada segmento tiene su resultado y su
+        imagen (anotada o vacía).
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        if batch_size is None:
+            batch_size = config.INFERENCE_BATCH_SIZE
+        batch_size = max(1, int(batch_size))
+        
+        if not self.model:
+            raise ValueError("Modelo no cargado")
+        
+        self._start_detection_run(merge_overlaps)
+        segment_detections = []
+        total_segments = len(segment_positions)
+        
+        logger.info(f"🔄 PROCESAMIENTO POR LOTES: {total_segments} segmentos, lotes de {batch_size}")
+        
+        # Ordenar por segment_id y descartar segmentos sin origen disponible
+        sorted_positions = sorted(segment_positions, key=lambda x: x[2])
+        available = [tile for tile in sorted_positions if self._segment_needs_inference(tile)]
+        
+        for batch_index, batch_start in enumerate(range(0, len(available), batch_size)):
+            batch = available[batch_start:batch_start + batch_size]
+            batch_start_time = time.perf_counter()
+            
+            try:
+                sources = [ImageProcessor.materialize_segment(tile.source) for tile in batch]
+                results = self._predict(sources, confidence_threshold)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{len(results)} resultados para {len(batch)} segmentos")
+            except Exception as e:
+                logger.error(f"❌ Error en lote {batch_index + 1} ({len(batch)} segmentos): {e}. "
+                             f"Reprocesando segmento a segmento")
+                for tile in batch:
+                    self._process_single_segment(tile, confidence_threshold, total_segments, segment_detections)
+                self._record_segment_latency(time.perf_counter() - batch_start_time, len(batch))
+                continue
+            
+            for tile, result in zip(batch, results):
+                try:
+                    self._handle_segment_result(result, tile, total_segments, segment_detections)
+                except Exception as e:
+                    logger.error(f"❌ Error procesando segmento {tile.segment_id}: {e}")
+                    self._create_empty_result_image(tile.segment_id)
+            self._record_segment_latency(time.perf_counter() - batch_start_time, len(batch))
+            
+            del results
+            MemoryManager.clear_cache()
+        
+        detections = self._finalize_detections(segment_detections)
+        self._log_processing_summary(detections, total_segments)
+        return detections
+    
+    def process_all_segments(self, segment_positions: List[SegmentTile],
+                             confidence_threshold: float = None,
+                             slide: Union[np.ndarray, SlideReader, None] = None,
+                             checkpoint: DetectionCheckpoint = None,
+                             metrics: RunMetrics = None) -> np.ndarray:
+        """
+        Procesa los segmentos con el modo configurado (pool de procesos, pipeline, lotes o secuencial).
+        
+        El modelo se ejecuta una sola vez con PREDICTION_FLOOR_THRESHOLD y las
+        predicciones completas quedan en `raw_detections`; se devuelven las que
+        superan `confidence_threshold`. Cualquier umbral más alto puede
+        aplicarse después con `apply_confidence_threshold` sin reinferir.
+        
+        Si se pasa `slide` y SKIP_BACKGROUND_TILES está activo, los segmentos
+        sin tejido no pasan por el modelo y se registran como vacíos. Con
+        `checkpoint`, cada segmento terminado se añade al punto de control y
+        los que ya estaban en él (al reanudar) no se vuelven a inferir; el
+        punto de control se cierra al terminar. Con `metrics` se miden la
+        máscara de tejido, la inferencia, las cajas, la anotación y la NMS
+        global, y la latencia de cada segmento inferido.
+        
+        Con COARSE_TO_FINE (y `slide`), una primera pasada sobre la vista
+        general reducida (`build_roi_map`) decide qué segmentos tienen
+        candidatos; los demás se omiten igual que los de fondo. Con
+        ROI_RECALL_REPORT se mide además lo que esa omisión ha perdido
+        (`roi_recall_report`).
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        floor_threshold = self.prediction_floor_threshold(confidence_threshold)
+        use_worker_pool = (config.USE_WORKER_POOL and self.device != 'cuda'
+                           and not self.uses_inference_daemon())
+        
+        self.last_tissue_stats = None
+        if slide is not None and config.SKIP_BACKGROUND_TILES:
+            with RunMetrics.timed(metrics, 'mascara_tejido'):
+                self._background_segments = ImageProcessor.find_background_segments(slide, segment_positions)
+            self.last_tissue_stats = {
+                'segments': len(segment_positions),
+                'background_segments': sorted(self._background_segments)
+            }
+        
+        self.last_roi_stats = None
+        self.last_roi_recall = None
+        if slide is not None and config.COARSE_TO_FINE:
+            tissue_tiles = [tile for tile in segment_positions if tile.segment_id not in self._background_segments]
+            with RunMetrics.timed(metrics, 'vista_general'):
+                roi = self.build_roi_map(slide, min(config.COARSE_CONFIDENCE_THRESHOLD, confidence_threshold),
+                                         segment_positions=tissue_tiles)
+                if roi is not None:
+                    self._roi_segments = (ImageProcessor.find_segments_outside_roi(roi, segment_positions)
+                                          - self._background_segments)
+            if roi is not None:
+                self._background_segments = self._background_segments | self._roi_segments
+                self.last_roi_stats = {
+                    'overview_scale': roi.overview_scale,
+                    'candidates': int(len(roi.candidates)),
+                    'tissue_segments': len(tissue_tiles),
+                    'inferred_segments': len(tissue_tiles) - len(self._roi_segments),
+                    'skipped_segments': sorted(self._roi_segments),
+                    'coarse_inferences': roi.inferences,
+                    'fine_inferences': len(tissue_tiles) - len(self._roi_segments)
+                }
+                logger.info(f"🎯 Vista general: {len(roi.candidates)} candidatos; se omiten {len(self._roi_segments)} "
+                            f"de {len(tissue_tiles)} segmentos con tejido")
+        
+        self._annotation_threshold = confidence_threshold
+        self._checkpoint = checkpoint
+        self._metrics = metrics
+        if checkpoint is not None:
+            checkpoint.drop_segments_without_image()
+        if metrics is not None:
+            metrics.count('segmentos', len(segment_positions))
+            metrics.count('segmentos_fondo', len(self._background_segments - self._roi_segments))
+            metrics.count('segmentos_fuera_roi', len(self._roi_segments))
+            metrics.count('segmentos_reanudados', len(self._completed_segments()))
+        try:
+            if use_worker_pool:
+                raw_detections = self.process_all_segments_multiprocess(segment_positions, floor_threshold)
+            else:
+                if config.USE_WORKER_POOL:
+                    logger.info("Servidor de inferencia activo: se ignora USE_WORKER_POOL"
+                                if self.uses_inference_daemon() else "GPU disponible: se ignora USE_WORKER_POOL")
+                if config.USE_STREAMING_PIPELINE:
+                    raw_detections = self.process_all_segments_pipelined(segment_positions, floor_threshold)
+                elif config.INFERENCE_BATCH_SIZE > 1:
+                    raw_detections = self.process_all_segments_batched(segment_positions, floor_threshold)
+                else:
+                    raw_detections = self.process_all_segments_sequentially(segment_positions, floor_threshold)
+        finally:
+            self._annotation_threshold = None
+            self._background_segments = set()
+            self._roi_segments = set()
+            self._checkpoint = None
+            self._metrics = None
+            if checkpoint is not None:
+                checkpoint.close()
+        
+        self.raw_detections = raw_detections
+        detections = self.apply_confidence_threshold(raw_detections, confidence_threshold)
+        if self.last_roi_stats is not None and config.ROI_RECALL_REPORT:
+            with RunMetrics.timed(metrics, 'recall_roi'):
+                self.last_roi_recall = self.roi_recall_report(segment_positions, detections, confidence_threshold)
+        if metrics is not None:
+            metrics.count('predicciones', len(raw_detections))
+            metrics.count('detecciones', len(detections))
+            for name, stats in (('pipeline', self.last_pipeline_stats), ('prediction_cache', self.last_cache_stats),
+                                ('roi', self.last_roi_stats), ('roi_recall', self.last_roi_recall)):
+                if stats is not None:
+                    metrics.extra[name] = stats
+        logger.info(f"🎚️ Umbral {confidence_threshold:.2f}: {len(detections)} de {len(raw_detections)} "
+                    f"predicciones (guardadas desde {floor_threshold:.2f})")
+        return detections
+    
+    @staticmethod
+    def prediction_floor_threshold(confidence_threshold: float = None) -> float:
+        """Umbral con el que se ejecuta el modelo: el suelo de predicciones, nunca por encima del umbral pedido."""
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        return min(config.PREDICTION_FLOOR_THRESHOLD, confidence_threshold)
+    
+    @staticmethod
+    def apply_confidence_threshold(detections: np.ndarray, confidence_threshold: float) -> np.ndarray:
+        """
+        Detecciones con confianza > `confidence_threshold`, en su orden original.
+        
+        Equivale a haber ejecutado el modelo con ese umbral: la NMS (por segmento
+        y la global) solo suprime cajas con una vecina de mayor confianza, así
+        que filtrar después conserva exactamente las mismas cajas. La
+        comparación es estricta, como en la NMS de ultralytics, para que una
+        caja con confianza igual al umbral tampoco se conserve.
+        """
+        return detections[detections['confidence'] > confidence_threshold]
+    
+    def process_all_segments_multiprocess(self, segment_positions: List[SegmentTile],
+                                          confidence_threshold: float = None,
+                                          merge_overlaps: bool = None,
+                                          num_workers: int = None) -> np.ndarray:
+        """
+        Procesa los segmentos en el pool de procesos de CPU (`InferenceWorkerPool`).
+        
+        Cada proceso escribe las imágenes anotadas de sus segmentos; aquí se
+        reúnen las detecciones en orden de segmento.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        if num_workers is None:
+            num_workers = config.INFERENCE_WORKERS
+        
+        if not self.model_path:
+            raise ValueError("Modelo no cargado")
+        
+        self._start_detection_run(merge_overlaps, async_writer=False)
+        total_segments = len(segment_positions)
+        
+        pool = self._get_worker_pool(num_workers)
+        logger.info(f"🔄 PROCESAMIENTO MULTIPROCESO: {total_segments} segmentos, {pool.num_workers} procesos")
+        
+        tissue_tiles = []
+        completed = self._completed_segments()
+        for tile in segment_positions:
+            if tile.segment_id in completed:
+                continue
+            if tile.segment_id in self._background_segments:
+                self._create_empty_result_image(tile.segment_id, self._skipped_segment_reason(tile.segment_id))
+            else:
+                tissue_tiles.append(tile)
+        
+        try:
+            with RunMetrics.timed(self._metrics, 'inferencia_pool'):
+                results = pool.run(tissue_tiles, confidence_threshold, self._annotation_threshold,
+                                   on_result=self._checkpoint_segment)
+        except Exception:
+            self.close_worker_pool()
+            raise
+        for seconds in pool.last_segment_seconds.values():
+            self._record_segment_latency(seconds)
+        
+        segment_detections = []
+        for tile in sorted(tissue_tiles, key=lambda x: x[2]):
+            detections, written, error = results.get(tile.segment_id, (None, False, "sin respuesta"))
+            if error is not None:
+                logger.error(f"❌ Error procesando segmento {tile.segment_id}: {error}")
+                self._create_empty_result_image(tile.segment_id)
+                continue
+            if len(detections) > 0:
+                segment_detections.append(detections)
+        
+        detections = self._finalize_detections(segment_detections)
+        self._log_processing_summary(detections, total_segments)
+        return detections
+    
+    def _get_worker_pool(self, num_workers: int = None) -> InferenceWorkerPool:
+        """Pool de procesos reutilizable entre láminas (se recrea si cambia el modelo o el tamaño)."""
+        pool = self._worker_pool
+        if pool is not None and (pool.model_path != self.model_path or
+                                 (num_workers and pool.num_workers != num_workers)):
+            self.close_worker_pool()
+            pool = None
+        if pool is None:
+            pool = InferenceWorkerPool(self.model_path, num_workers)
+            self._worker_pool = pool
+        return pool
+    
+    def close_worker_pool(self):
+        """Detiene los procesos de inferencia, si los hay."""
+        if self._worker_pool is not None:
+            self._worker_pool.close()
+            self._worker_pool = None
+    
+    def process_all_segments_pipelined(self, segment_positions: List[SegmentTile],
+                                       confidence_threshold: float = None,
+                                       batch_size: int = None,
+                                       merge_overlaps: bool = None) -> np.ndarray:
+        """
+        Procesa los segmentos con `DetectionPipeline`: extracción, inferencia por
+        lotes, post-proceso y escritura corren a la vez, unidas por colas acotadas.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        if batch_size is None:
+            batch_size = config.INFERENCE_BATCH_SIZE
+        
+        if not self.model:
+            raise ValueError("Modelo no cargado")
+        
+        # La etapa de escritura del pipeline sustituye al escritor asíncrono
+        self._start_detection_run(merge_overlaps, async_writer=False)
+        total_segments = len(segment_positions)
+        
+        logger.info(f"🔄 PROCESAMIENTO EN PIPELINE: {total_segments} segmentos, lotes de {batch_size}")
+        
+        pipeline = DetectionPipeline(self, confidence_threshold, batch_size)
+        segment_detections = pipeline.run(segment_positions)
+        self.last_pipeline_stats = pipeline.stats_summary()
+        
+        detections = self._finalize_detections(segment_detections)
+        self._log_processing_summary(detections, total_segments)
+        return detections
+    
+    def _completed_segments(self) -> Set[int]:
+        """Segmentos ya terminados según el punto de control de la pasada (al reanudar)."""
+        return set(self._checkpoint.completed) if self._checkpoint is not None else set()
+    
+    def _checkpoint_segment(self, segment_id: int, detections: np.ndarray):
+        """Añade un segmento terminado al punto de control, si hay uno activo."""
+        if self._checkpoint is not None:
+            self._checkpoint.append(segment_id, detections)
+    
+    def _skipped_segment_reason(self, segment_id: int) -> str:
+        """Texto de la imagen vacía de un segmento que no pasa por el modelo."""
+        return "No candidates (ROI)" if segment_id in self._roi_segments else "Background"
+    
+    def build_roi_map(self, slide: Union[np.ndarray, SlideReader], confidence_threshold: float = None,
+                      coarse_scale: float = None, segment_positions: List[SegmentTile] = None,
+                      max_inference_ratio: float = None) -> Optional[RoiMap]:
+        """
+        Pasada gruesa: ejecuta el modelo sobre una vista general reducida de la lámina.
+        
+        La vista general está a `coarse_scale` de la resolución con que el
+        modelo ve los segmentos de la pasada fina (`segment_positions`): el
+        modelo reduce cada segmento a su tamaño de entrada, así que en modo
+        rejilla esa resolución es imgsz / lado del segmento, no la nativa. Sin
+        segmentos se toma la resolución de inferencia (la nativa o la de
+        TARGET_MPP). La vista se trocea en segmentos del tamaño de entrada del
+        modelo, solapados un octavo para que ningún canal quede partido en
+        todos. Los candidatos, en coordenadas de la lámina y sin duplicados, se
+        acumulan en el mapa de densidad que selecciona los segmentos de la
+        pasada fina.
+        
+        Devuelve None, sin inferir nada, si la vista general necesitaría más de
+        `max_inference_ratio` veces las inferencias de `segment_positions`: la
+        pasada gruesa no ahorraría trabajo.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.COARSE_CONFIDENCE_THRESHOLD
+        if coarse_scale is None:
+            coarse_scale = config.COARSE_SCALE
+        if max_inference_ratio is None:
+            max_inference_ratio = config.COARSE_MAX_INFERENCE_RATIO
+        
+        start_time = time.perf_counter()
+        reader = ArraySlideReader(slide) if isinstance(slide, np.ndarray) else slide
+        tile_size = self.input_size()
+        fine_scale = self.fine_inference_scale(segment_positions, tile_size) if segment_positions else None
+        if fine_scale is None:
+            mpp = ImageProcessor.slide_mpp(reader)
+            fine_scale = mpp / config.TARGET_MPP if config.TARGET_MPP > 0 and mpp else 1.0
+        
+        # Tamaño de la vista general antes de leerla, para descartarla si no es más barata
+        max_side = max(reader.width, reader.height)
+        overview_side = max(1, int(round(max_side * min(1.0, fine_scale * coarse_scale))))
+        overview_width = max(1, round(reader.width * overview_side / max_side))
+        overview_height = max(1, round(reader.height * overview_side / max_side))
+        stride = max(1, tile_size - tile_size // 8)
+        tiles = [(x, y) for y in ImageProcessor._tile_starts(overview_height, tile_size, stride)
+                 for x in ImageProcessor._tile_starts(overview_width, tile_size, stride)]
+        if segment_positions and len(tiles) > max_inference_ratio * len(segment_positions):
+            logger.warning(f"⚠️ La vista general necesitaría {len(tiles)} inferencias frente a "
+                           f"{len(segment_positions)} del modo completo: se infieren todos los segmentos")
+            return None
+        
+        overview = reader.read_thumbnail(overview_side)
+        overview_scale = overview.shape[1] / reader.width
+        tiles = [(x, y) for y in ImageProcessor._tile_starts(overview.shape[0], tile_size, stride)
+                 for x in ImageProcessor._tile_starts(overview.shape[1], tile_size, stride)]
+        
+        candidates = [np.empty(0, dtype=DETECTION_DTYPE)]
+        batch_size = max(1, config.INFERENCE_BATCH_SIZE)
+        for batch_start in range(0, len(tiles), batch_size):
+            batch = tiles[batch_start:batch_start + batch_size]
+            sources = [overview[y:y + tile_size, x:x + tile_size] for x, y in batch]
+            for (x, y), result in zip(batch, self._predict(sources, confidence_threshold)):
+                candidates.append(self._calculate_centers_and_areas(result.boxes, x / overview_scale,
+                                                                    y / overview_scale, 0, overview_scale))
+        candidates = self.merge_overlapping_detections(np.concatenate(candidates))
+        
+        logger.info(f"🔭 Vista general {overview.shape[1]}x{overview.shape[0]} (escala {overview_scale:.3f}): "
+                    f"{len(tiles)} segmentos, {len(candidates)} candidatos en "
+                    f"{time.perf_counter() - start_time:.2f} s")
+        roi = ImageProcessor.roi_density_map(candidates, reader.width, reader.height, overview_scale)
+        return roi._replace(inferences=len(tiles))
+    
+    @staticmethod
+    def fine_inference_scale(segment_positions: List[SegmentTile], tile_size: int) -> Optional[float]:
+        """
+        Píxeles de red por píxel de lámina con que el modelo ve los segmentos
+        (mediana): la escala del segmento por la reducción a `tile_size`.
+        """
+        scales = []
+        for tile in segment_positions:
+            size = ImageProcessor.segment_source_size(tile.source)
+            if size:
+                scales.append(tile.scale * tile_size / max(size))
+        return float(np.median(scales)) if scales else None
+    
+    def roi_recall_report(self, segment_positions: List[SegmentTile], detections: np.ndarray,
+                          confidence_threshold: float = None) -> Dict[str, Any]:
+        """
+        Exhaustividad de la detección en dos pasadas frente al modo completo.
+        
+        Infiere los segmentos que la vista general dejó fuera (sin escribir
+        imágenes ni punto de control) y une sus detecciones a las de la pasada
+        con la NMS global, dando prioridad a las ya encontradas: las que
+        sobreviven son canales que el modo completo habría detectado y la
+        pasada en dos fases no. Los segmentos inferidos son los mismos en
+        ambos modos, así que sus detecciones coinciden.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        
+        skipped = set(self.last_roi_stats['skipped_segments'])
+        tiles = [tile for tile in segment_positions if tile.segment_id in skipped]
+        found = self.apply_confidence_threshold(detections, confidence_threshold)
+        floor_threshold = self.prediction_floor_threshold(confidence_threshold)
+        
+        extra = [np.empty(0, dtype=DETECTION_DTYPE)]
+        batch_size = max(1, config.INFERENCE_BATCH_SIZE)
+        for batch_start in range(0, len(tiles), batch_size):
+            batch = tiles[batch_start:batch_start + batch_size]
+            sources = [ImageProcessor.materialize_segment(tile.source) for tile in batch]
+            for tile, result in zip(batch, self._predict(sources, floor_threshold)):
+                extra.append(self._calculate_centers_and_areas(result.boxes, tile.start_x, tile.start_y,
+                                                               tile.segment_id, tile.scale))
+        missed = self.apply_confidence_threshold(np.concatenate(extra), confidence_threshold)
+        
+        if self._merge_overlaps and len(missed):
+            ranked = np.concatenate([found, missed])
+            ranked['confidence'][:len(found)] += 1.0  # Las ya encontradas ganan siempre la NMS
+            kept = self.merge_overlapping_detections(ranked)
+            missed = kept[np.isin(kept['segment_id'], list(skipped))]
+        
+        exhaustive = len(found) + len(missed)
+        segment_ids, counts = np.unique(missed['segment_id'].astype(np.int64), return_counts=True)
+        report = {
+            'confidence_threshold': confidence_threshold,
+            'recall': len(found) / exhaustive if exhaustive else 1.0,
+            'found_detections': int(len(found)),
+            'missed_detections': int(len(missed)),
+            'exhaustive_detections': int(exhaustive),
+            'inferred_segments': self.last_roi_stats['inferred_segments'],
+            'skipped_segments': len(skipped),
+            'coarse_inferences': self.last_roi_stats['coarse_inferences'],
+            'fine_inferences': self.last_roi_stats['fine_inferences'],
+            'exhaustive_inferences': self.last_roi_stats['tissue_segments'],
+            'missed_by_segment': {int(segment_id): int(count) for segment_id, count in zip(segment_ids, counts)}
+        }
+        logger.info(f"🎯 Exhaustividad frente al modo completo: {report['recall']:.1%} "
+                    f"({len(missed)} de {exhaustive} detecciones en {len(segment_ids)} de {len(skipped)} "
+                    f"segmentos omitidos); inferencias {report['coarse_inferences']} + "
+                    f"{report['fine_inferences']} frente a {report['exhaustive_inferences']}")
+        return report
+    
+    def _record_segment_latency(self, seconds: float, segments: int = 1):
+        """Registra la latencia de segmentos inferidos en las métricas activas, si las hay."""
+        if self._metrics is not None:
+            self._metrics.record_segment(seconds, segments)
+    
+    def _predict(self, sources: List[Union[np.ndarray, str]], confidence_threshold: float) -> list:
+        """
+        Ejecuta el modelo sobre una lista de segmentos (una llamada, un lote).
+        
+        Con la caché de predicciones activa, los segmentos ya vistos se
+        reconstruyen desde disco y solo los demás pasan por el modelo.
+        """
+        if self.prediction_cache is None:
+            with RunMetrics.timed(self._metrics, 'inferencia'):
+                return self._run_model(sources, confidence_threshold)
+        
+        with RunMetrics.timed(self._metrics, 'cache'):
+            settings = self._cache_settings(confidence_threshold)
+            keys = [PredictionCache.make_key(source, settings) for source in sources]
+            results = [self._cached_result(source, key) for source, key in zip(sources, keys)]
+        
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            with RunMetrics.timed(self._metrics, 'inferencia'):
+                predicted = self._run_model([sources[index] for index in missing], confidence_threshold)
+            for index, result in zip(missing, predicted):
+                results[index] = result
+                try:
+                    self.prediction_cache.put(keys[index], result.boxes.data.detach().cpu().numpy())
+                except OSError as e:
+                    logger.warning(f"⚠️ No se pudo escribir en la caché de predicciones: {e}")
+        return results
+    
+    def _run_model(self, sources: List[Union[np.ndarray, str]], confidence_threshold: float) -> list:
+        """Una llamada al modelo; si el servidor de inferencia deja de responder, se sigue en este proceso."""
+        if self.uses_inference_daemon():
+            try:
+                return self.model(sources, conf=confidence_threshold)
+            except ConnectionError as e:
+                logger.warning(f"⚠️ {e}: el modelo se carga en este proceso")
+                self.model.close()
+                self._load_local_model()
+        return self.model(sources, conf=confidence_threshold, verbose=False)
+    
+    def _cached_result(self, source: Union[np.ndarray, str], key: str) -> Optional['Results']:
+        """Resultado de ultralytics reconstruido desde la caché (None si no hay entrada)."""
+        boxes = self.prediction_cache.get(key)
+        if boxes is None:
+            return None
+        return self.results_from_boxes(source, boxes, self.model.names)
+    
+    @staticmethod
+    def results_from_boxes(source: Union[np.ndarray, str], boxes: np.ndarray, names: Dict[int, str]) -> 'Results':
+        """Resultado de ultralytics a partir de las cajas (x1, y1, x2, y2, conf, clase) de un segmento."""
+        import torch
+        from ultralytics.engine.results import Results
+        
+        image = cv2.imread(source) if isinstance(source, str) else source
+        return Results(orig_img=image, path=source if isinstance(source, str) else 'image0.jpg',
+                       names=names, boxes=torch.from_numpy(boxes))
+    
+    def _start_detection_run(self, merge_overlaps: bool = None, async_writer: bool = None):
+        """Prepara el estado de una pasada de detección sobre todos los segmentos."""
+        if merge_overlaps is None:
+            # Los segmentos pegados al borde del modo 'model' siempre se solapan con sus vecinos
+            merge_overlaps = config.SEGMENT_OVERLAP_PX > 0 or config.TILING_MODE == 'model'
+        if async_writer is None:
+            async_writer = config.ASYNC_IMAGE_WRITER
+        self._merge_overlaps = merge_overlaps
+        DirectoryManager.clean_result_directory(self._completed_segments())
+        self.last_merge_stats = None
+        self.last_pipeline_stats = None
+        self.last_cache_stats = None
+        if self.prediction_cache is not None:
+            self.prediction_cache.reset_stats()
+        if async_writer:
+            self._image_writer = AnnotatedImageWriter()
+    
+    def _segment_needs_inference(self, tile: SegmentTile) -> bool:
+        """
+        Comprueba que el segmento tiene tejido y que su origen existe; si no,
+        crea su imagen vacía para mantener la secuencia.
+        """
+        if self._checkpoint is not None and tile.segment_id in self._checkpoint.completed:
+            return False
+        if tile.segment_id in self._background_segments:
+            self._create_empty_result_image(tile.segment_id, self._skipped_segment_reason(tile.segment_id))
+            return False
+        if isinstance(tile.source, str) and not os.path.exists(tile.source):
+            logger.warning(f"⚠️ Segmento {tile.segment_id} no encontrado: {tile.source}")
+            # Crear imagen vacía para mantener secuencia
+            self._create_empty_result_image(tile.segment_id)
+            return False
+        return True
+    
+    def _process_single_segment(self, tile: SegmentTile, confidence_threshold: float,
+                                total_segments: int, segment_detections: List[np.ndarray]):
+        """Procesa un único segmento con YOLO; si falla, crea su imagen vacía."""
+        try:
+            # Procesar segmento individual con YOLO (vista en memoria o ruta en disco)
+            results = self._predict([ImageProcessor.materialize_segment(tile.source)], confidence_threshold)
+            self._handle_segment_result(results[0], tile, total_segments, segment_detections)
+            
+        except Exception as e:
+            logger.error(f"❌ Error procesando segmento {tile.segment_id}: {e}")
+            # Crear imagen vacía para mantener secuencia
+            self._create_empty_result_image(tile.segment_id)
+    
+    def _handle_segment_result(self, result, tile: SegmentTile, total_segments: int,
+                               segment_detections: List[np.ndarray]):
+        """Acumula las detecciones de un segmento y guarda su imagen anotada."""
+        start_x, start_y, segment_id = tile.start_x, tile.start_y, tile.segment_id
+        boxes = result.boxes
+        detection_count = 0
+        
+        # Procesar detecciones si existen
+        if boxes is not None and len(boxes) > 0:
+            with RunMetrics.timed(self._metrics, 'cajas'):
+                centers = self._calculate_centers_and_areas(boxes, start_x, start_y, segment_id, tile.scale)
+            segment_detections.append(centers)
+            detection_count = len(centers)
+        else:
+            centers = np.empty(0, dtype=DETECTION_DTYPE)
+        self._checkpoint_segment(segment_id, centers)
+        
+        # CRÍTICO: Guardar imagen SIEMPRE (con o sin detecciones)
+        self._save_annotated_image(result, segment_id)
+        
+        logger.info(f"✅ Segmento {segment_id:03d}/{total_segments}: {detection_count} detecciones - Imagen guardada")
+    
+    def _finalize_detections(self, segment_detections: List[np.ndarray]) -> np.ndarray:
+        """Une las detecciones de todos los segmentos y, con solape, aplica la NMS global."""
+        if self._checkpoint is not None and self._checkpoint.completed:
+            # Segmentos recuperados del punto de control, en el mismo orden que sin interrupción
+            segment_detections = self._checkpoint.completed_detections() + list(segment_detections)
+            detections = np.concatenate(segment_detections)
+            detections = detections[np.argsort(detections['segment_id'], kind='stable')]
+        elif segment_detections:
+            detections = np.concatenate(segment_detections)
+        else:
+            detections = np.empty(0, dtype=DETECTION_DTYPE)
+        
+        if not self._merge_overlaps:
+            return detections
+        
+        merge_start = time.perf_counter()
+        kept = self.merge_overlapping_detections(detections)
+        merge_seconds = time.perf_counter() - merge_start
+        if self._metrics is not None:
+            self._metrics.add_time('nms_global', merge_seconds)
+        
+        self.last_merge_stats = {
+            'input_detections': int(len(detections)),
+            'kept_detections': int(len(kept)),
+            'seconds': merge_seconds
+        }
+        logger.info(f"🧩 NMS global: {len(detections)} → {len(kept)} detecciones "
+                    f"({len(detections) - len(kept)} duplicados) en {merge_seconds * 1000:.1f} ms")
+        return kept
+    
+    def _log_processing_summary(self, detections: np.ndarray, total_segments: int):
+        """Verificación final: detecciones totales e imágenes guardadas."""
+        # Esperar a que el escritor en segundo plano termine antes de contar
+        if self._image_writer is not None:
+            failed_writes = self._image_writer.shutdown()
+            self._image_writer = None
+            if failed_writes:
+                logger.warning(f"⚠️ {failed_writes} imágenes anotadas no se pudieron escribir")
+        
+        saved_count = self._count_saved_results()
+        logger.info(f"📊 RESUMEN: {len(detections)} detecciones totales")
+        background = self._background_segments - self._roi_segments
+        if background:
+            logger.info(f"🧫 Segmentos de fondo sin inferencia: {len(background)} de {total_segments}")
+        if self._roi_segments:
+            logger.info(f"🎯 Segmentos sin candidatos en la vista general: {len(self._roi_segments)} de {total_segments}")
+        
+        if self.prediction_cache is not None:
+            self.last_cache_stats = self.prediction_cache.stats_summary()
+        if self.last_cache_stats and self.last_cache_stats['hits'] + self.last_cache_stats['misses'] > 0:
+            logger.info(f"🗃️ Caché de predicciones: {self.last_cache_stats['hits']} aciertos, "
+                        f"{self.last_cache_stats['misses']} fallos ({self.last_cache_stats['hit_rate']:.0%}), "
+                        f"{self.last_cache_stats['evictions']} desalojos, "
+                        f"{self.last_cache_stats['size_mb']:.1f} MB")
+        logger.info(f"📁 Imágenes guardadas: {saved_count} de {total_segments}")
+        
+        if saved_count != total_segments:
+            logger.warning(f"⚠️ FALTAN {total_segments - saved_count} IMÁGENES!")
+        else:
+            logger.info("✅ TODAS LAS IMÁGENES GUARDADAS CORRECTAMENTE")
+    
+    def _create_empty_result_image(self, segment_id: int, reason: str = "No data"):
+        """Crea una imagen vacía cuando un segmento falla o es fondo, para mantener la secuencia."""
+        try:
+            # Crear imagen negra de tamaño estándar
+            empty_img = np.zeros((948, 1258, 3), dtype=np.uint8)
+            
+            # Añadir texto indicando que no hay datos
+            cv2.putText(empty_img, f"Segment {segment_id}", (50, 50), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            cv2.putText(empty_img, reason, (50, 100), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            
+            # Guardar con numeración correcta
+            padded_id = str(segment_id).zfill(3)
+            output_path = os.path.join(config.OUTPUT_DIR, f"result_{padded_id}.png")
+            cv2.imwrite(output_path, empty_img)
+            
+            logger.info(f"🖼️ Imagen vacía creada para segmento {segment_id} ({reason})")
+            
+        except Exception as e:
+            logger.error(f"Error creando imagen vacía para segmento {segment_id}: {e}")
+    
+    def _calculate_centers_and_areas(self, boxes, start_x: int, start_y: int, segment_id: int,
+                                     scale: float = 1.0) -> np.ndarray:
+        """
+        Calcula centros globales, áreas elípticas y confianzas de las detecciones.
+        
+        Convierte `boxes.xyxy` y `boxes.conf` a NumPy una sola vez y opera sobre
+        todas las cajas a la vez. `scale` (píxeles de red por píxel de lámina)
+        devuelve las cajas de un segmento reescalado a píxeles de la lámina.
+        Devuelve un array estructurado DETECTION_DTYPE.
+        """
+        try:
+            xyxy = boxes.xyxy.detach().cpu().numpy().astype(np.float64, copy=False)
+            if scale != 1.0:
+                xyxy = xyxy / scale
+            confidences = boxes.conf.detach().cpu().numpy()
+            
+            widths = xyxy[:, 2] - xyxy[:, 0]
+            heights = xyxy[:, 3] - xyxy[:, 1]
+            
+            centers = np.empty(len(xyxy), dtype=DETECTION_DTYPE)
+            # Coordenadas globales del centro
+            centers['center_x'] = start_x + (xyxy[:, 0] + xyxy[:, 2]) / 2
+            centers['center_y'] = start_y + (xyxy[:, 1] + xyxy[:, 3]) / 2
+            centers['segment_id'] = segment_id
+            # Área elíptica (semiejes = mitad del ancho y del alto de la caja)
+            centers['ellipse_area'] = pi * (widths / 2) * (heights / 2)
+            centers['confidence'] = confidences
+            centers['width'] = widths
+            centers['height'] = heights
+            return centers
+            
+        except Exception as e:
+            logger.error(f"Error calculando centros en segmento {segment_id}: {e}")
+            return np.empty(0, dtype=DETECTION_DTYPE)
+    
+    @staticmethod
+    def merge_overlapping_detections(detections: np.ndarray, iou_threshold: float = None) -> np.ndarray:
+        """
+        NMS global vectorizada sobre todas las detecciones de la imagen.
+        
+        Se ejecuta en una sola llamada batched (torchvision.ops.nms) sobre las cajas
+        en coordenadas globales, eliminando los canales duplicados en las zonas de
+        solape. Devuelve las detecciones conservadas en su orden original.
+        """
+        if iou_threshold is None:
+            iou_threshold = config.MERGE_IOU_THRESHOLD
+        
+        if len(detections) == 0:
+            return detections
+        
+        import torch
+        from torchvision.ops import nms
+        
+        half_widths = detections['width'] / 2
+        half_heights = detections['height'] / 2
+        boxes = np.stack([detections['center_x'] - half_widths, detections['center_y'] - half_heights,
+                          detections['center_x'] + half_widths, detections['center_y'] + half_heights], axis=1)
+        
+        keep = nms(torch.from_numpy(boxes),
+                   torch.from_numpy(np.ascontiguousarray(detections['confidence'])),
+                   iou_threshold)
+        return detections[np.sort(keep.numpy())]
+    
+    def _save_annotated_image(self, result, segment_id: int):
+        """Guarda la imagen anotada, en segundo plano si el escritor asíncrono está activo."""
+        if self._image_writer is not None:
+            self._image_writer.submit(self._write_annotated_image_timed, result, segment_id,
+                                      self._annotation_threshold)
+        else:
+            self._write_annotated_image_timed(result, segment_id, self._annotation_threshold)
+    
+    def _write_annotated_image_timed(self, result, segment_id: int, min_confidence: float = None) -> bool:
+        """`_write_annotated_image` medido como etapa 'anotacion' de las métricas activas."""
+        with RunMetrics.timed(self._metrics, 'anotacion'):
+            return self._write_annotated_image(result, segment_id, min_confidence)
+    
+    @staticmethod
+    def _write_annotated_image(result, segment_id: int, min_confidence: float = None) -> bool:
+        """
+        Renderiza y guarda la imagen con anotaciones usando numeración con padding.
+        
+        Con `min_confidence` solo se dibujan las cajas que superan ese umbral.
+        """
+        try:
+            if min_confidence is not None and result.boxes is not None and len(result.boxes) > 0:
+                result = result[result.boxes.conf > min_confidence]
+            annotated_img = result.plot()
+            
+            # Usar padding de 3 dígitos para orden correcto
+            padded_id = str(segment_id).zfill(3)
+            output_path = os.path.join(config.OUTPUT_DIR, f"result_{padded_id}.png")
+            
+            # Asegurar que el directorio existe
+            os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+            
+            # Guardar imagen
+            success = cv2.imwrite(output_path, annotated_img)
+            
+            if not success:
+                logger.error(f"❌ Falló el guardado de result_{padded_id}.png")
+            return bool(success)
+            
+        except Exception as e:
+            logger.error(f"Error guardando imagen anotada para segmento {segment_id}: {e}")
+            return False
+    
+    def _count_saved_results(self) -> int:
+        """Cuenta cuántas imágenes result_XXX.png existen en segmented_results."""
+        try:
+            if not os.path.exists(config.OUTPUT_DIR):
+                return 0
+            
+            result_files = [f for f in os.listdir(config.OUTPUT_DIR) 
+                          if f.startswith('result_') and f.endswith('.png')]
+            return len(result_files)
+        except Exception as e:
+            logger.error(f"Error contando archivos de resultados: {e}")
+            return 0
+
+# ============================================================================
+# ANÁLISIS Y VISUALIZACIÓN OPTIMIZADOS
+# ============================================================================
+
+class MapBackground(NamedTuple):
+    """Fondo RGB reducido compartido por los mapas y tamaño de la lámina completa."""
+    rgb: np.ndarray
+    width: int
+    height: int
+
+class DataAnalyzer:
+    """Maneja el análisis de datos y generación de visualizaciones."""
+    
+    @staticmethod
+    def calculate_distance_matrix_optimized(centers_df: pd.DataFrame) -> float:
+        """Calcula la distancia media entre centros de forma optimizada."""
+        return DataAnalyzer.calculate_mean_distance(centers_df)['avg_distance']
+    
+    @staticmethod
+    def calculate_mean_distance(centers_df: pd.DataFrame, method: str = None) -> Dict[str, Any]:
+        """
+        Distancia media entre pares de centros (pares distintos con distancia > 0).
+        
+        `method`:
+            - 'exact': recorre la matriz por bloques sin superar DISTANCE_MEMORY_MB.
+            - 'sampled': estima la media con DISTANCE_SAMPLE_PAIRS pares aleatorios
+              e informa del error (semiancho del intervalo de confianza al 95%).
+            - 'auto': exacto hasta DISTANCE_EXACT_MAX_POINTS centros, muestreo por encima.
+        
+        Devuelve `avg_distance`, `distance_method`, `distance_error` (0 si es exacto)
+        y `distance_pairs` (pares usados en el cálculo).
+        """
+        if method is None:
+            method = config.DISTANCE_METHOD
+        
+        points = centers_df[['Center X', 'Center Y']].to_numpy(dtype=np.float64)
+        n_points = len(points)
+        
+        if n_points < 2:
+            return {'avg_distance': 0.0, 'distance_method': 'exact', 'distance_error': 0.0, 'distance_pairs': 0}
+        
+        if method == 'auto':
+            method = 'exact' if n_points <= config.DISTANCE_EXACT_MAX_POINTS else 'sampled'
+        
+        start_time = time.perf_counter()
+        if method == 'exact':
+            result = DataAnalyzer._mean_distance_blocked(points)
+        elif method == 'sampled':
+            result = DataAnalyzer._mean_distance_sampled(points)
+        else:
+            raise ValueError(f"Método de distancia no válido: {method}")
+        
+        logger.info(f"📐 Distancia media ({result['distance_method']}): {result['avg_distance']:.2f} px"
+                    f" ± {result['distance_error']:.2f} sobre {result['distance_pairs']:,} pares"
+                    f" en {time.perf_counter() - start_time:.2f} s")
+        return result
+    
+    @staticmethod
+    def _mean_distance_blocked(points: np.ndarray, memory_mb: float = None) -> Dict[str, Any]:
+        """Media exacta de la triangular superior calculada por bloques de tamaño fijo."""
+        if memory_mb is None:
+            memory_mb = config.DISTANCE_MEMORY_MB
+        
+        n_points = len(points)
+        # Tres matrices float64 de block x block viven a la vez (dx, dy y el triángulo diagonal)
+        block = int(np.sqrt(memory_mb * 1024 * 1024 / (3 * 8)))
+        block = max(1, min(block, n_points))
+        
+        x = points[:, 0]
+        y = points[:, 1]
+        total = 0.0
+        count = 0
+        
+        for row_start in range(0, n_points, block):
+            row_end = min(row_start + block, n_points)
+            row_x = x[row_start:row_end, np.newaxis]
+            row_y = y[row_start:row_end, np.newaxis]
+            
+            for col_start in range(row_start, n_points, block):
+                col_end = min(col_start + block, n_points)
+                dx = row_x - x[col_start:col_end]
+                dy = row_y - y[col_start:col_end]
+                np.multiply(dx, dx, out=dx)
+                np.multiply(dy, dy, out=dy)
+                np.add(dx, dy, out=dx)
+                distances = np.sqrt(dx, out=dx)
+                
+                if col_start == row_start:
+                    # Bloque diagonal: solo pares i < j (el resto a cero, no cuenta)
+                    distances = np.triu(distances, k=1)
+                
+                # Los pares a distancia 0 no suman ni cuentan
+                total += float(distances.sum())
+                count += int(np.count_nonzero(distances))
+        
+        return {
+            'avg_distance': total / count if count > 0 else 0.0,
+            'distance_method': 'exact',
+            'distance_error': 0.0,
+            'distance_pairs': count
+        }
+    
+    @staticmethod
+    def _mean_distance_sampled(points: np.ndarray, sample_pairs: int = None,
+                               seed: Optional[int] = None) -> Dict[str, Any]:
+        """Estimación por muestreo uniforme de pares con intervalo de confianza al 95%."""
+        if sample_pairs is None:
+            sample_pairs = config.DISTANCE_SAMPLE_PAIRS
+        if seed is None:
+            seed = config.DISTANCE_SAMPLE_SEED
+        
+        n_points = len(points)
+        rng = np.random.default_rng(seed)
+        
+        # Pares (i, j) con i != j, uniformes sobre todos los pares distintos
+        first = rng.integers(0, n_points, size=sample_pairs)
+        second = rng.integers(0, n_points - 1, size=sample_pairs)
+        second += second >= first
+        
+        distances = np.hypot(points[first, 0] - points[second, 0], points[first, 1] - points[second, 1])
+        distances = distances[distances > 0]
+        
+        if distances.size == 0:
+            return {'avg_distance': 0.0, 'distance_method': 'sampled', 'distance_error': 0.0, 'distance_pairs': 0}
+        
+        std_error = float(distances.std(ddof=1) / np.sqrt(distances.size)) if distances.size > 1 else 0.0
+        return {
+            'avg_distance': float(distances.mean()),
+            'distance_method': 'sampled',
+            'distance_error': 1.96 * std_error,
+            'distance_pairs': int(distances.size)
+        }
+    
+    @staticmethod
+    def generate_visualization_optimized(df: pd.DataFrame, image_path: str,
+                                         image: Union[np.ndarray, SlideReader, None] = None,
+                                         background: MapBackground = None,
+                                         distance_method: str = None) -> Dict[str, Any]:
+        """Genera visualizaciones optimizadas con mejor calidad.
+        
+        Si se pasa `image` (BGR ya decodificada, o un `SlideReader` del que se
+        toma la miniatura) se usa como fondo en lugar de volver a leer
+        `image_path` del disco. El fondo se reduce una sola vez a
+        MAP_MAX_SIDE y lo comparten ambos mapas; `background` permite
+        reutilizar uno ya cargado.
+        """
+        try:
+            import matplotlib
+            matplotlib.rcParams['font.size'] = 12
+            
+            if background is None:
+                background = DataAnalyzer.load_map_background(image_path, image)
+            
+            # Generar mapa de coordenadas
+            plot_path = DataAnalyzer._create_coordinates_plot(df, image_path, background=background)
+            
+            # Generar mapa de calor
+            heatmap_path = DataAnalyzer._create_heatmap(df, image_path, background=background)
+            
+            # Calcular estadísticas
+            stats = DataAnalyzer._calculate_statistics(df, distance_method)
+            
+            return {
+                'plot_path': plot_path,
+                'heatmap_path': heatmap_path,
+                **stats
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generando visualizaciones: {e}")
+            raise
+    
+    @staticmethod
+    def load_map_background(image_path: str, image: Union[np.ndarray, SlideReader, None] = None,
+                            max_side: int = None) -> MapBackground:
+        """
+        Fondo RGB reducido para los mapas y tamaño (ancho, alto) de la lámina completa.
+        
+        Usa la imagen en memoria, la miniatura de un `SlideReader` por ventanas
+        o, en último caso, decodifica `image_path` del disco.
+        """
+        if max_side is None:
+            max_side = config.MAP_MAX_SIDE
+        
+        if isinstance(image, SlideReader):
+            reader = image
+        else:
+            if image is None:
+                image = ImageProcessor.decode_image(image_path)
+            reader = ArraySlideReader(image)
+        
+        thumbnail = reader.read_thumbnail(max_side)
+        return MapBackground(np.ascontiguousarray(thumbnail[:, :, ::-1]), reader.width, reader.height)
+    
+    @staticmethod
+    def _colormap_lut(cmap_name: str) -> np.ndarray:
+        """Tabla RGB uint8 de 256 entradas del mapa de color de matplotlib (coincide con la colorbar)."""
+        import matplotlib
+        return (matplotlib.colormaps[cmap_name](np.linspace(0.0, 1.0, 256))[:, :3] * 255).astype(np.uint8)
+    
+    @staticmethod
+    def _faded_background(background: MapBackground, alpha: float) -> np.ndarray:
+        """Fondo mezclado sobre blanco con la opacidad indicada."""
+        white = np.full_like(background.rgb, 255)
+        return cv2.addWeighted(background.rgb, alpha, white, 1.0 - alpha, 0)
+    
+    @staticmethod
+    def rasterize_coordinates(df: pd.DataFrame, background: MapBackground,
+                              cmap_name: str = 'Reds') -> Tuple[np.ndarray, Tuple[float, float]]:
+        """
+        Dibuja los centros sobre el fondo, coloreados por área.
+        
+        Devuelve el raster RGB (tamaño del fondo) y el rango (mín, máx) de
+        áreas usado para la escala de color.
+        """
+        canvas = DataAnalyzer._faded_background(background, 0.7)
+        areas = df['Ellipse Area (pixels^2)'].to_numpy(dtype=np.float64)
+        if len(areas) == 0:
+            return canvas, (0.0, 1.0)
+        
+        area_min, area_max = float(areas.min()), float(areas.max())
+        span = area_max - area_min if area_max > area_min else 1.0
+        levels = np.clip(((areas - area_min) / span * 255).round(), 0, 255).astype(np.uint8)
+        colors = DataAnalyzer._colormap_lut(cmap_name)[levels]
+        
+        map_height, map_width = canvas.shape[:2]
+        xs = np.round(df['Center X'].to_numpy() * (map_width / background.width)).astype(np.int32)
+        ys = np.round(df['Center Y'].to_numpy() * (map_height / background.height)).astype(np.int32)
+        radius = max(2, int(round(max(map_width, map_height) * config.MAP_POINT_RADIUS_FRACTION)))
+        
+        overlay = canvas.copy()
+        for x, y, color in zip(xs.tolist(), ys.tolist(), colors.tolist()):
+            cv2.circle(overlay, (x, y), radius, color, -1, cv2.LINE_AA)
+            cv2.circle(overlay, (x, y), radius, (0, 0, 0), 1, cv2.LINE_AA)
+        
+        return cv2.addWeighted(overlay, 0.8, canvas, 0.2, 0), (area_min, area_max)
+    
+    @staticmethod
+    def rasterize_density(df: pd.DataFrame, background: MapBackground, bins: int = None,
+                          cmap_name: str = 'hot') -> Tuple[np.ndarray, Tuple[float, float]]:
+        """
+        Superpone el histograma 2D de centros, suavizado, sobre el fondo.
+        
+        Devuelve el raster RGB (tamaño del fondo) y el rango (0, máx) de
+        recuentos por celda usado para la escala de color.
+        """
+        if bins is None:
+            bins = config.HEATMAP_BINS
+        
+        canvas = DataAnalyzer._faded_background(background, 0.5)
+        if len(df) == 0:
+            return canvas, (0.0, 1.0)
+        
+        heatmap, xedges, yedges = np.histogram2d(df['Center X'], df['Center Y'], bins=bins)
+        heat_max = float(heatmap.max()) if heatmap.max() > 0 else 1.0
+        
+        # Región del raster cubierta por el histograma (extensión de los datos)
+        map_height, map_width = canvas.shape[:2]
+        scale_x = map_width / background.width
+        scale_y = map_height / background.height
+        x0 = int(np.clip(np.floor(xedges[0] * scale_x), 0, map_width - 1))
+        x1 = int(np.clip(np.ceil(xedges[-1] * scale_x), x0 + 1, map_width))
+        y0 = int(np.clip(np.floor(yedges[0] * scale_y), 0, map_height - 1))
+        y1 = int(np.clip(np.ceil(yedges[-1] * scale_y), y0 + 1, map_height))
+        
+        # Interpolación suave del histograma (filas = Y) hasta la región
+        density = cv2.resize(heatmap.T.astype(np.float32), (x1 - x0, y1 - y0), interpolation=cv2.INTER_CUBIC)
+        levels = np.clip(density / heat_max * 255, 0, 255).astype(np.uint8)
+        colored = DataAnalyzer._colormap_lut(cmap_name)[levels]
+        
+        region = canvas[y0:y1, x0:x1]
+        canvas[y0:y1, x0:x1] = cv2.addWeighted(colored, 0.7, region, 0.3, 0)
+        return canvas, (0.0, heat_max)
+    
+    @staticmethod
+    def _save_map_figure(raster: np.ndarray, width: int, height: int, value_range: Tuple[float, float],
+                         cmap_name: str, title: str, colorbar_label: str, filename: str):
+        """
+        Guarda el raster con ejes, título y colorbar de matplotlib.
+        
+        matplotlib solo dibuja el marco (ejes, rejilla, textos y colorbar) sobre
+        un lienzo transparente cuyo área de ejes mide exactamente lo mismo que
+        el raster; después se compone con OpenCV, sin remuestrear el raster.
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.colors import Normalize
+        from matplotlib.figure import Figure
+        
+        dpi = config.DPI
+        map_height, map_width = raster.shape[:2]
+        left, right, bottom, top = int(1.1 * dpi), int(1.6 * dpi), int(0.9 * dpi), int(0.7 * dpi)
+        fig_width = map_width + left + right
+        fig_height = map_height + bottom + top
+        
+        fig = Figure(figsize=(fig_width / dpi, fig_height / dpi), dpi=dpi)
+        FigureCanvasAgg(fig)
+        
+        fig.patch.set_alpha(0.0)
+        ax = fig.add_axes([left / fig_width, bottom / fig_height,
+                           map_width / fig_width, map_height / fig_height])
+        ax.patch.set_alpha(0.0)
+        ax.set_xlim(0, width)
+        ax.set_ylim(height, 0)
+        
+        ax.set_title(title, fontsize=16, fontweight='bold')
+        ax.set_xlabel('Coordenada X (píxeles)', fontsize=14)
+        ax.set_ylabel('Coordenada Y (píxeles)', fontsize=14)
+        ax.grid(True, alpha=0.3)
+        
+        cax = fig.add_axes([(left + map_width + int(0.2 * dpi)) / fig_width, bottom / fig_height,
+                            int(0.25 * dpi) / fig_width, map_height / fig_height])
+        mappable = ScalarMappable(norm=Normalize(*value_range), cmap=cmap_name)
+        cbar = fig.colorbar(mappable, cax=cax)
+        cbar.set_label(colorbar_label, fontsize=12)
+        
+        fig.canvas.draw()
+        frame = np.asarray(fig.canvas.buffer_rgba())
+        
+        # Lienzo blanco con el raster en el área de ejes y el marco encima
+        canvas = np.full((frame.shape[0], frame.shape[1], 3), 255, dtype=np.uint8)
+        canvas[top:top + map_height, left:left + map_width] = raster
+        alpha = frame[:, :, 3:4].astype(np.float32) / 255.0
+        composed = frame[:, :, :3] * alpha + canvas * (1.0 - alpha)
+        
+        if not cv2.imwrite(filename, cv2.cvtColor(composed.astype(np.uint8), cv2.COLOR_RGB2BGR)):
+            raise IOError(f"No se pudo escribir el mapa: {filename}")
+    
+    @staticmethod
+    def _create_coordinates_plot(df: pd.DataFrame, image_path: str,
+                                 image: Union[np.ndarray, SlideReader, None] = None,
+                                 background: MapBackground = None) -> str:
+        """Crea el mapa de coordenadas con mejor calidad."""
+        try:
+            if background is None:
+                background = DataAnalyzer.load_map_background(image_path, image)
+            
+            raster, value_range = DataAnalyzer.rasterize_coordinates(df, background)
+            
+            plot_filename = os.path.join(config.RESULTS_DIR, "mapa_coordenadas.png")
+            DataAnalyzer._save_map_figure(raster, background.width, background.height, value_range, 'Reds',
+                                          'Mapa de Coordenadas de Canales de Havers',
+                                          'Área del Canal (píxeles²)', plot_filename)
+            
+            logger.info(f"Mapa de coordenadas guardado: {plot_filename}")
+            return plot_filename
+            
+        except Exception as e:
+            logger.error(f"Error creando mapa de coordenadas: {e}")
+            raise
+    
+    @staticmethod
+    def _create_heatmap(df: pd.DataFrame, image_path: str,
+                        image: Union[np.ndarray, SlideReader, None] = None,
+                        background: MapBackground = None) -> str:
+        """Crea el mapa de calor con mejor calidad."""
+        try:
+            if background is None:
+                background = DataAnalyzer.load_map_background(image_path, image)
+            
+            raster, value_range = DataAnalyzer.rasterize_density(df, background)
+            
+            heatmap_filename = os.path.join(config.RESULTS_DIR, "mapa_calor.png")
+            DataAnalyzer._save_map_figure(raster, background.width, background.height, value_range, 'hot',
+                                          'Mapa de Densidad de Canales de Havers',
+                                          'Densidad de Canales', heatmap_filename)
+            
+            logger.info(f"Mapa de calor guardado: {heatmap_filename}")
+            return heatmap_filename
+            
+        except Exception as e:
+            logger.error(f"Error creando mapa de calor: {e}")
+            raise
+    
+    @staticmethod
+    def rescore_detections(raw_detections: np.ndarray, confidence_threshold: float, image_path: str,
+                           background: MapBackground = None,
+                           distance_method: str = None) -> Tuple[np.ndarray, pd.DataFrame, Dict[str, Any]]:
+        """
+        Aplica otro umbral de confianza a las predicciones guardadas y recalcula
+        recuentos, estadísticas y mapas sin volver a ejecutar el modelo.
+        
+        Devuelve las detecciones filtradas, su DataFrame y el mismo diccionario
+        que `generate_visualization_optimized` (vacío si no queda ninguna).
+        """
+        if distance_method is None:
+            distance_method = config.RESCORE_DISTANCE_METHOD
+        
+        start_time = time.perf_counter()
+        detections = YOLOModelManager.apply_confidence_threshold(raw_detections, confidence_threshold)
+        df = DataManager._add_area_category(DataManager.detections_to_dataframe(detections))
+        
+        if len(df) > 0:
+            viz_results = DataAnalyzer.generate_visualization_optimized(df, image_path, background=background,
+                                                                        distance_method=distance_method)
+        else:
+            viz_results = DataAnalyzer.empty_statistics()
+        
+        logger.info(f"🎚️ Umbral {confidence_threshold:.2f}: {len(detections)} de {len(raw_detections)} "
+                    f"predicciones, recalculado en {(time.perf_counter() - start_time) * 1000:.0f} ms")
+        return detections, df, viz_results
+    
+    @staticmethod
+    def empty_statistics() -> Dict[str, Any]:
+        """Resultados de visualización y estadísticas para una imagen sin detecciones."""
+        return {
+            'plot_path': None,
+            'heatmap_path': None,
+            'avg_area': 0,
+            'median_area': 0,
+            'std_area': 0,
+            'min_area': 0,
+            'max_area': 0,
+            'count': 0,
+            'avg_distance': 0,
+            'distance_method': 'exact',
+            'distance_error': 0,
+            'distance_pairs': 0
+        }
+    
+    @staticmethod
+    def _calculate_statistics(df: pd.DataFrame, distance_method: str = None) -> Dict[str, Any]:
+        """Calcula estadísticas mejoradas de los datos."""
+        stats = {
+            'avg_area': float(df['Ellipse Area (pixels^2)'].mean()),
+            'median_area': float(df['Ellipse Area (pixels^2)'].median()),
+            'std_area': float(df['Ellipse Area (pixels^2)'].std()),
+            'min_area': float(df['Ellipse Area (pixels^2)'].min()),
+            'max_area': float(df['Ellipse Area (pixels^2)'].max()),
+            'count': int(len(df))
+        }
+        stats.update(DataAnalyzer.calculate_mean_distance(df, distance_method))
+        return stats
+
+# ============================================================================
+# ESCRITORES DE RESULTADOS
+# ============================================================================
+
+class ResultsWriter:
+    """
+    Interfaz común de los formatos de salida de las detecciones.
+    
+    Cada escritor guarda la tabla de detecciones junto con los metadatos de
+    la ejecución (dimensiones de la lámina, modelo, umbrales...).
+    """
+    
+    name = ''
+    extension = ''
+    
+    def write(self, df: pd.DataFrame, path: str, metadata: Dict[str, Any]) -> str:
+        """Escribe la tabla y sus metadatos; devuelve la ruta escrita."""
+        raise NotImplementedError
+
+class ArrowResultsWriter(ResultsWriter):
+    """Base de los formatos columnares de pyarrow; los metadatos van en el esquema."""
+    
+    METADATA_KEY = b'havers_detection'
+    
+    def write(self, df: pd.DataFrame, path: str, metadata: Dict[str, Any]) -> str:
+        import pyarrow as pa
+        
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[self.METADATA_KEY] = json.dumps(metadata, default=str).encode('utf-8')
+        self._write_table(table.replace_schema_metadata(schema_metadata), path)
+        return path
+    
+    def _write_table(self, table, path: str):
+        raise NotImplementedError
+
+class ParquetResultsWriter(ArrowResultsWriter):
+    name = 'parquet'
+    extension = '.parquet'
+    
+    def _write_table(self, table, path: str):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression='zstd')
+
+class FeatherResultsWriter(ArrowResultsWriter):
+    name = 'feather'
+    extension = '.feather'
+    
+    def _write_table(self, table, path: str):
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression='zstd')
+
+class CsvResultsWriter(ResultsWriter):
+    """CSV sin dependencias extra; los metadatos se guardan en `<archivo>.meta.json`."""
+    
+    name = 'csv'
+    extension = '.csv'
+    
+    def write(self, df: pd.DataFrame, path: str, metadata: Dict[str, Any]) -> str:
+        df.to_csv(path, index=False)
+        with open(path + '.meta.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False, default=str)
+        return path
+
+RESULTS_WRITERS = {
+    writer.name: writer for writer in (ParquetResultsWriter, FeatherResultsWriter, CsvResultsWriter)
+}
+
+def get_results_writer(format_name: str = None) -> ResultsWriter:
+    """Escritor para el formato pedido; sin pyarrow, los formatos columnares pasan a CSV."""
+    if format_name is None:
+        format_name = config.RESULTS_FORMAT
+    
+    writer_class = RESULTS_WRITERS.get(format_name)
+    if writer_class is None:
+        raise ValueError(f"Formato de resultados no válido: {format_name} "
+                         f"(opciones: {', '.join(RESULTS_WRITERS)})")
+    
+    if issubclass(writer_class, ArrowResultsWriter):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning(f"⚠️ pyarrow no está instalado: se guarda en CSV en lugar de {format_name}")
+            writer_class = CsvResultsWriter
+    
+    return writer_class()
+
+# ============================================================================
+# GESTIÓN DE DATOS MEJORADA
+# ============================================================================
+
+class DataManager:
+    """Gestiona el guardado y carga de datos."""
+    
+    @staticmethod
+    def detections_to_dataframe(detections: np.ndarray) -> pd.DataFrame:
+        """Convierte el array estructurado de detecciones a las columnas de la aplicación."""
+        return pd.DataFrame({
+            'Center X': detections['center_x'].astype(np.float64),
+            'Center Y': detections['center_y'].astype(np.float64),
+            'Segment ID': detections['segment_id'].astype(np.int64),
+            'Ellipse Area (pixels^2)': detections['ellipse_area'].astype(np.float64),
+            'Confidence': detections['confidence'].astype(np.float64)
+        })
+    
+    @staticmethod
+    def build_run_metadata(image_path: str, width: int, height: int,
+                           model_manager: 'YOLOModelManager' = None,
+                           confidence_threshold: float = None,
+                           segment_count: int = None) -> Dict[str, Any]:
+        """Metadatos de la ejecución que acompañan a la tabla de detecciones."""
+        if confidence_threshold is None:
+            confidence_threshold = config.CONFIDENCE_THRESHOLD
+        if segment_count is None:
+            segment_count = config.NUM_SEGMENTS
+        
+        metadata = {
+            'slide_path': image_path,
+            'slide_width': int(width),
+            'slide_height': int(height),
+            'created': pd.Timestamp.now().isoformat(),
+            'confidence_threshold': confidence_threshold,
+            'prediction_floor_threshold': YOLOModelManager.prediction_floor_threshold(confidence_threshold),
+            'tiling_mode': config.TILING_MODE,
+            'num_segments': segment_count,
+            'segment_cols': config.SEGMENT_COLS,
+            'segment_overlap_px': config.SEGMENT_OVERLAP_PX,
+            'merge_iou_threshold': config.MERGE_IOU_THRESHOLD
+        }
+        if model_manager is not None:
+            metadata['model_path'] = model_manager.model_path
+            metadata['inference_backend'] = model_manager.backend
+            metadata['inference_daemon'] = (model_manager.model.address
+                                            if model_manager.uses_inference_daemon() else None)
+            metadata['merge_stats'] = model_manager.last_merge_stats
+            metadata['prediction_cache'] = model_manager.last_cache_stats
+            metadata['tissue_mask'] = model_manager.last_tissue_stats
+            metadata['roi'] = model_manager.last_roi_stats
+            metadata['roi_recall'] = model_manager.last_roi_recall
+        return metadata
+    
+    @staticmethod
+    def _add_area_category(df: pd.DataFrame) -> pd.DataFrame:
+        """Añade la categoría de tamaño (terciles del rango de áreas)."""
+        if len(df) > 0:
+            df['Area Category'] = pd.cut(df['Ellipse Area (pixels^2)'],
+                                         bins=3, labels=['Pequeño', 'Medio', 'Grande'])
+        return df
+    
+    @staticmethod
+    def save_results(detections: np.ndarray, metadata: Dict[str, Any] = None,
+                     format_name: str = None, file_stem: str = 'bounding_box_centers') -> Tuple[str, pd.DataFrame]:
+        """
+        Guarda las detecciones con el escritor configurado (RESULTS_FORMAT).
+        
+        Devuelve la ruta escrita y el DataFrame de detecciones.
+        """
+        if metadata is None:
+            metadata = {}
+        
+        try:
+            df = DataManager._add_area_category(DataManager.detections_to_dataframe(detections))
+            writer = get_results_writer(format_name)
+            
+            metadata = dict(metadata, detection_count=int(len(df)), results_format=writer.name)
+            data_path = os.path.join(config.DATA_DIR, file_stem + writer.extension)
+            
+            start_time = time.perf_counter()
+            writer.write(df, data_path, metadata)
+            logger.info(f"💾 Detecciones guardadas ({writer.name}): {data_path} "
+                        f"en {time.perf_counter() - start_time:.2f} s")
+            
+            return data_path, df
+            
+        except Exception as e:
+            logger.error(f"Error guardando detecciones: {e}")
+            raise
+    
+    @staticmethod
+    def save_raw_predictions(raw_detections: np.ndarray, metadata: Dict[str, Any] = None,
+                             format_name: str = None) -> str:
+        """
+        Guarda todas las predicciones desde PREDICTION_FLOOR_THRESHOLD (raw_predictions.*).
+        
+        Con la columna de confianza, cualquier umbral más alto se puede aplicar
+        más adelante sin volver a ejecutar el modelo.
+        """
+        data_path, _ = DataManager.save_results(raw_detections, metadata, format_name, file_stem='raw_predictions')
+        return data_path
+    
+    @staticmethod
+    def export_excel_in_background(detections: np.ndarray, metrics: RunMetrics = None) -> threading.Thread:
+        """
+        Genera el Excel en un hilo aparte que no bloquea la ejecución.
+        
+        El hilo no es daemon: si la aplicación se cierra antes de que termine,
+        el proceso espera a que el libro quede completo. Las rutas se fijan al
+        lanzarlo, así que cambiar después el directorio base no le afecta. Con
+        `metrics`, su tiempo se suma a la etapa 'excel' y, si las métricas ya
+        se habían guardado, el JSON se reescribe al terminar.
+        """
+        excel_path = DataManager.excel_output_path()
+        backup_dir = config.TECHNICAL_DIR
+        
+        def export():
+            try:
+                with RunMetrics.timed(metrics, 'excel'):
+                    DataManager.save_results_to_excel_enhanced(detections, excel_path, backup_dir)
+            except Exception:
+                pass  # save_results_to_excel_enhanced ya registra el error
+            if metrics is not None:
+                metrics.refresh()
+        
+        thread = threading.Thread(target=export, name="excel-export", daemon=False)
+        thread.start()
+        logger.info("📊 Exportación a Excel iniciada en segundo plano")
+        return thread
+    
+    @staticmethod
+    def excel_output_path() -> str:
+        """Ruta del libro Excel que genera `save_results_to_excel_enhanced`."""
+        return os.path.join(config.EXCEL_DIR, 'bounding_box_centers_enhanced.xlsx')
+    
+    @staticmethod
+    def save_results_to_excel_enhanced(detections: np.ndarray, excel_path: str = None,
+                                       backup_dir: str = None) -> Tuple[str, pd.DataFrame]:
+        """Guarda resultados en Excel con formato mejorado."""
+        if excel_path is None:
+            excel_path = DataManager.excel_output_path()
+        if backup_dir is None:
+            backup_dir = config.TECHNICAL_DIR
+        
+        try:
+            # Crear DataFrame con mejor estructura
+            df = DataManager.detections_to_dataframe(detections)
+            
+            # Añadir columnas calculadas
+            df = DataManager._add_area_category(df)
+            df['Detection Time'] = pd.Timestamp.now()
+            
+            # Ordenar por área descendente
+            df = df.sort_values('Ellipse Area (pixels^2)', ascending=False)
+            
+            # Crear writer con múltiples hojas
+            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+                # Hoja principal con datos
+                df.to_excel(writer, sheet_name='Detecciones', index=False)
+                
+                # Hoja con estadísticas
+                stats_df = pd.DataFrame({
+                    'Métrica': ['Total Canales', 'Área Promedio', 'Área Mediana', 
+                               'Desviación Estándar', 'Área Mínima', 'Área Máxima'],
+                    'Valor': [len(df), df['Ellipse Area (pixels^2)'].mean(),
+                             df['Ellipse Area (pixels^2)'].median(),
+                             df['Ellipse Area (pixels^2)'].std(),
+                             df['Ellipse Area (pixels^2)'].min(),
+                             df['Ellipse Area (pixels^2)'].max()]
+                })
+                stats_df.to_excel(writer, sheet_name='Estadísticas', index=False)
+            
+            # Crear copia de seguridad
+            backup_path = os.path.join(backup_dir, 'bounding_box_centers_backup.xlsx')
+            shutil.copy2(excel_path, backup_path)
+            
+            logger.info(f"Datos guardados en: {excel_path}")
+            logger.info(f"Copia de seguridad en: {backup_path}")
+            
+            return excel_path, df
+            
+        except Exception as e:
+            logger.error(f"Error guardando datos en Excel: {e}")
+            raise
@@ -1,145 +1,25 @@
+import time
+
+# Referencia del arranque: se mide hasta que la ventana principal es interactiva
+_STARTUP_START = time.perf_counter()
+
 import os
-import cv2
-import shutil
-import pandas as pd
 import numpy as np
-from math import ceil, pi
-from pathlib import Path
-from typing import List, Tuple, Optional, Dict, Any
-import logging
-from dataclasses import dataclass
-from ultralytics import YOLO
-import torch
+import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import Tk, Button, Text, Scrollbar, Frame, Label, filedialog, StringVar, messagebox, ttk
 from tkinter.filedialog import askopenfilename
-import matplotlib.pyplot as plt
-from concurrent.futures import ThreadPoolExecutor
-import gc
-import time
 import tkinter as tk
 from tkinter import ttk
 
-# ============================================================================
-# CONFIGURACIÓN GLOBAL Y CONSTANTES
-# ============================================================================
-
-@dataclass
-class Config:
-    """Configuración centralizada de la aplicación."""
-    # Directorios base
-    BASE_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\data\sample_results\detection_app"
-    TECHNICAL_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\docs\technical"
-    RECONSTRUCTED_IMAGES_DIR: str = r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\data\sample_images"
-    
-    # Configuración de modelo
-    MODEL_PATHS: List[str] = None
-    CONFIDENCE_THRESHOLD: float = 0.4
-    MAX_PIXELS: int = 178956970
-    NUM_SEGMENTS: int = 150
-    SEGMENT_COLS: int = 15
-    
-    # Configuración visual
-    BACKGROUND_COLOR: str = '#000000'
-    BUTTON_COLOR: str = '#BD0000'
-    BUTTON_HOVER_COLOR: str = '#333333'
-    TEXT_COLOR: str = 'white'
-    
-    # Configuración de visualización
-    FIGURE_SIZE: Tuple[int, int] = (16, 16)
-    DPI: int = 600
-    HEATMAP_BINS: int = 100
-    
-    def __post_init__(self):
-        if self.MODEL_PATHS is None:
-            self.MODEL_PATHS = [
-                r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\histology_bone_analyzer\models\weights.pt",
-                r"C:\Users\joanb\OneDrive\Escritorio\TFG\Workspace_tfg_2.0\workspace\runs\detect\train\weights\weights.pt"
-            ]
-        
-        # Crear rutas derivadas
-        self.IMAGES_SEGMENTED_DIR = os.path.join(self.BASE_DIR, "images_segmented")
-        self.OUTPUT_DIR = os.path.join(self.BASE_DIR, "segmented_results")
-        self.RESULTS_DIR = os.path.join(self.BASE_DIR, "results")
-        self.EXCEL_DIR = os.path.join(self.BASE_DIR, "excel")
-
-# Instancia global de configuración
-config = Config()
-
-# ============================================================================
-# CONFIGURACIÓN DE LOGGING
-# ============================================================================
-
-def setup_logging():
-    """Configura el sistema de logging para mejor seguimiento de errores."""
-    log_file = os.path.join(config.BASE_DIR, "detection_app.log")
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(funcName)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
-    )
-    return logging.getLogger(__name__)
+from detection_core import (
+    config, setup_logging, MemoryManager, DirectoryManager, SlideReader, ImageProcessor,
+    YOLOModelManager, DetectionCheckpoint, RunMetrics, DataAnalyzer, DataManager
+)
 
 logger = setup_logging()
 
-# ============================================================================
-# GESTIÓN DE MEMORIA Y RECURSOS
-# ============================================================================
-
-class MemoryManager:
-    """Gestiona la memoria de forma eficiente durante el procesamiento."""
-    
-    @staticmethod
-    def clear_cache():
-        """Limpia la caché de memoria."""
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-    
-    @staticmethod
-    def get_memory_usage():
-        """Obtiene el uso actual de memoria."""
-        try:
-            import psutil
-            process = psutil.Process(os.getpid())
-            return process.memory_info().rss / 1024 / 1024  # MB
-        except ImportError:
-            return 0.0
-
-# ============================================================================
-# GESTIÓN DE DIRECTORIOS
-# ============================================================================
-
-class DirectoryManager:
-    """Maneja la creación y gestión de directorios."""
-    
-    @staticmethod
-    def initialize_directories():
-        """Crea todas las carpetas necesarias si no existen."""
-        directories = [
-            config.BASE_DIR,
-            config.IMAGES_SEGMENTED_DIR,
-            config.OUTPUT_DIR,
-            config.RESULTS_DIR,
-            config.EXCEL_DIR,
-            config.TECHNICAL_DIR,
-            config.RECONSTRUCTED_IMAGES_DIR
-        ]
-        
-        for directory in directories:
-            Path(directory).mkdir(parents=True, exist_ok=True)
-            logger.info(f"Directorio verificado/creado: {directory}")
-    
-    @staticmethod
-    def clean_segment_directory():
-        """Limpia la carpeta de segmentos."""
-        if os.path.exists(config.IMAGES_SEGMENTED_DIR):
-            for file in os.listdir(config.IMAGES_SEGMENTED_DIR):
-                if file.startswith("segment_") and file.endswith(".png"):
-                    os.remove(os.path.join(config.IMAGES_SEGMENTED_DIR, file))
-
 # ============================================================================
 # INTERFAZ GRÁFICA MEJORADA
 # ============================================================================
@@ -251,569 +131,6 @@ class UIManager:
         
         return progress_window, progress_bar, status_label
 
-# ============================================================================
-# PROCESAMIENTO DE IMÁGENES OPTIMIZADO
-# ============================================================================
-
-class ImageProcessor:
-    """Maneja todo el procesamiento de imágenes de forma optimizada."""
-    
-    @staticmethod
-    def validate_image(image_path: str) -> bool:
-        """Valida que la imagen sea legible y tenga formato correcto."""
-        try:
-            # Verificar existencia
-            if not os.path.exists(image_path):
-                logger.error(f"Archivo no encontrado: {image_path}")
-                return False
-            
-            # Verificar formato
-            valid_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
-            if Path(image_path).suffix.lower() not in valid_extensions:
-                logger.error(f"Formato de imagen no soportado: {image_path}")
-                return False
-            
-            # Intentar cargar la imagen
-            img = cv2.imread(image_path)
-            if img is None:
-                logger.error(f"No se pudo cargar la imagen: {image_path}")
-                return False
-            
-            logger.info(f"Imagen validada correctamente: {image_path}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error validando imagen: {e}")
-            return False
-    
-    @staticmethod
-    def resize_image_if_needed(image_path: str, max_pixels: int = None) -> str:
-        """Redimensiona una imagen si excede el límite de píxeles."""
-        if max_pixels is None:
-            max_pixels = config.MAX_PIXELS
-        
-        logger.info(f"Verificando tamaño de imagen: {image_path}")
-        
-        try:
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError("No se pudo cargar la imagen")
-            
-            height, width = img.shape[:2]
-            pixels = height * width
-            logger.info(f"Tamaño original: {width}x{height} = {pixels:,} píxeles")
-            
-            if pixels <= max_pixels:
-                return image_path
-            
-            # Calcular nuevo tamaño
-            scale = (max_pixels / pixels) ** 0.5
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            logger.info(f"Redimensionando a: {new_width}x{new_height}")
-            
-            # Redimensionar con interpolación de alta calidad
-            resized = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-            
-            # Guardar versión redimensionada
-            path_obj = Path(image_path)
-            resized_path = str(path_obj.parent / f"{path_obj.stem}_resized{path_obj.suffix}")
-            cv2.imwrite(resized_path, resized)
-            
-            logger.info(f"Imagen redimensionada guardada en: {resized_path}")
-            
-            # Limpiar memoria
-            del img, resized
-            MemoryManager.clear_cache()
-            
-            return resized_path
-            
-        except Exception as e:
-            logger.error(f"Error redimensionando imagen: {e}")
-            raise
-    
-    @staticmethod
-    def divide_image_optimized(image_path: str, num_segments: int = None) -> Tuple[List[Tuple], int, int]:
-        """Divide una imagen en segmentos optimizando el uso de memoria."""
-        if num_segments is None:
-            num_segments = config.NUM_SEGMENTS
-        
-        # Limpiar directorio de segmentos
-        DirectoryManager.clean_segment_directory()
-        
-        logger.info(f"Dividiendo imagen: {image_path}")
-        
-        try:
-            # Cargar imagen con manejo de errores mejorado
-            image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-            if image is None:
-                # Método alternativo de carga
-                with open(image_path, 'rb') as f:
-                    img_bytes = f.read()
-                image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-                
-                if image is None:
-                    raise ValueError(f"No se pudo cargar la imagen: {image_path}")
-            
-            # Configurar división
-            cols = config.SEGMENT_COLS
-            rows = ceil(num_segments / cols)
-            segment_height = image.shape[0] // rows
-            segment_width = image.shape[1] // cols
-            
-            logger.info(f"Dividiendo en {rows}x{cols} segmentos ({segment_width}x{segment_height} cada uno)")
-            
-            # Dividir y guardar con progreso
-            segment_positions = []
-            total_segments = min(rows * cols, num_segments)
-            
-            for i in range(rows):
-                for j in range(cols):
-                    if len(segment_positions) >= total_segments:
-                        break
-                    
-                    # Calcular límites del segmento
-                    start_y = i * segment_height
-                    end_y = min(start_y + segment_height, image.shape[0])
-                    start_x = j * segment_width
-                    end_x = min(start_x + segment_width, image.shape[1])
-                    
-                    # Extraer segmento
-                    segment = image[start_y:end_y, start_x:end_x].copy()
-                    
-                    # Guardar segmento
-                    segment_id = len(segment_positions) + 1
-                    segment_filename = f"segment_{segment_id}.png"
-                    segment_path = os.path.join(config.IMAGES_SEGMENTED_DIR, segment_filename)
-                    
-                    cv2.imwrite(segment_path, segment, [cv2.IMWRITE_PNG_COMPRESSION, 1])
-                    
-                    segment_positions.append((start_x, start_y, segment_id))
-                    
-                    # Limpiar memoria del segmento
-                    del segment
-                
-                if len(segment_positions) >= total_segments:
-                    break
-            
-            # Limpiar memoria de la imagen original
-            del image
-            MemoryManager.clear_cache()
-            
-            logger.info(f"Segmentación completada: {len(segment_positions)} segmentos guardados")
-            return segment_positions, segment_width, segment_height
-            
-        except Exception as e:
-            logger.error(f"Error dividiendo imagen: {e}")
-            raise
-
-# ============================================================================
-# MODELO YOLO OPTIMIZADO
-# ============================================================================
-
-class YOLOModelManager:
-    """Gestiona la carga y uso del modelo YOLO de forma optimizada."""
-    
-    def __init__(self):
-        self.model = None
-        self.model_path = None
-    
-    def find_model_path(self) -> Optional[str]:
-        """Busca el modelo YOLO en las rutas especificadas."""
-        for path in config.MODEL_PATHS:
-            if os.path.exists(path):
-                logger.info(f"Modelo encontrado en: {path}")
-                return path
-        
-        logger.error("No se encontró el modelo YOLO en ninguna ruta")
-        return None
-    
-    def load_model(self) -> bool:
-        """Carga el modelo YOLO con configuración optimizada."""
-        try:
-            self.model_path = self.find_model_path()
-            if not self.model_path:
-                return False
-            
-            logger.info("Cargando modelo YOLO...")
-            self.model = YOLO(self.model_path)
-            
-            # Configurar modelo para mejor rendimiento
-            if torch.cuda.is_available():
-                self.model.to('cuda')
-                logger.info("Modelo cargado en GPU")
-            else:
-                logger.info("Modelo cargado en CPU")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error cargando modelo: {e}")
-            return False
-    
-    def process_all_segments_sequentially(self, segment_positions: List[Tuple], 
-                                        confidence_threshold: float = None) -> List[Tuple]:
-        """
-        FUNCIÓN CLAVE: Procesa TODOS los segmentos uno por uno en orden secuencial
-        para asegurar que no se pierda ninguno.
-        """
-        if confidence_threshold is None:
-            confidence_threshold = config.CONFIDENCE_THRESHOLD
-        
-        if not self.model:
-            raise ValueError("Modelo no cargado")
-        
-        box_centers_and_areas = []
-        total_segments = len(segment_positions)
-        
-        logger.info(f"🔄 PROCESAMIENTO SECUENCIAL: {total_segments} segmentos")
-        
-        # Ordenar por segment_id para mantener orden
-        sorted_positions = sorted(segment_positions, key=lambda x: x[2])
-        
-        # Procesar cada segmento individualmente
-        for i, (start_x, start_y, segment_id) in enumerate(sorted_positions):
-            segment_path = os.path.join(config.IMAGES_SEGMENTED_DIR, f"segment_{segment_id}.png")
-            
-            if not os.path.exists(segment_path):
-                logger.warning(f"⚠️ Segmento {segment_id} no encontrado: {segment_path}")
-                # Crear imagen vacía para mantener secuencia
-                self._create_empty_result_image(segment_id)
-                continue
-            
-            try:
-                # Procesar segmento individual con YOLO
-                results = self.model([segment_path], conf=confidence_threshold, verbose=False)
-                result = results[0]  # Solo un resultado
-                
-                boxes = result.boxes
-                detection_count = 0
-                
-                # Procesar detecciones si existen
-                if boxes is not None and len(boxes) > 0:
-                    centers = self._calculate_centers_and_areas(boxes, start_x, start_y, segment_id)
-                    box_centers_and_areas.extend(centers)
-                    detection_count = len(boxes)
-                
-                # CRÍTICO: Guardar imagen SIEMPRE (con o sin detecciones)
-                self._save_annotated_image(result, segment_id)
-                
-                logger.info(f"✅ Segmento {segment_id:03d}/{total_segments}: {detection_count} detecciones - Imagen guardada")
-                
-                # Limpiar memoria cada 10 segmentos
-                if i % 10 == 0:
-                    MemoryManager.clear_cache()
-                
-            except Exception as e:
-                logger.error(f"❌ Error procesando segmento {segment_id}: {e}")
-                # Crear imagen vacía para mantener secuencia
-                self._create_empty_result_image(segment_id)
-                continue
-        
-        # Verificación final
-        saved_count = self._count_saved_results()
-        logger.info(f"📊 RESUMEN: {len(box_centers_and_areas)} detecciones totales")
-        logger.info(f"📁 Imágenes guardadas: {saved_count} de {total_segments}")
-        
-        if saved_count != total_segments:
-            logger.warning(f"⚠️ FALTAN {total_segments - saved_count} IMÁGENES!")
-        else:
-            logger.info("✅ TODAS LAS IMÁGENES GUARDADAS CORRECTAMENTE")
-        
-        return box_centers_and_areas
-    
-    def _create_empty_result_image(self, segment_id: int):
-        """Crea una imagen vacía cuando un segmento falla para mantener la secuencia."""
-        try:
-            # Crear imagen negra de tamaño estándar
-            empty_img = np.zeros((948, 1258, 3), dtype=np.uint8)
-            
-            # Añadir texto indicando que no hay datos
-            cv2.putText(empty_img, f"Segment {segment_id}", (50, 50), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            cv2.putText(empty_img, "No data", (50, 100), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            
-            # Guardar con numeración correcta
-            padded_id = str(segment_id).zfill(3)
-            output_path = os.path.join(config.OUTPUT_DIR, f"result_{padded_id}.png")
-            cv2.imwrite(output_path, empty_img)
-            
-            logger.info(f"🖼️ Imagen vacía creada para segmento {segment_id}")
-            
-        except Exception as e:
-            logger.error(f"Error creando imagen vacía para segmento {segment_id}: {e}")
-    
-    def _calculate_centers_and_areas(self, boxes, start_x: int, start_y: int, segment_id: int) -> List[Tuple]:
-        """Calcula centros y áreas de las detecciones."""
-        centers = []
-        for box in boxes:
-            try:
-                xyxy = box.xyxy.clone().detach().cpu().view(1, 4)
-                width = float(xyxy[0, 2] - xyxy[0, 0])
-                height = float(xyxy[0, 3] - xyxy[0, 1])
-                
-                # Coordenadas globales del centro
-                cx = float(start_x + (xyxy[0, 0] + xyxy[0, 2]) / 2)
-                cy = float(start_y + (xyxy[0, 1] + xyxy[0, 3]) / 2)
-                
-                # Área elíptica
-                semi_major_axis = width / 2
-                semi_minor_axis = height / 2
-                ellipse_area = pi * semi_major_axis * semi_minor_axis
-                
-                centers.append((cx, cy, segment_id, float(ellipse_area)))
-                
-            except Exception as e:
-                logger.error(f"Error calculando centro para caja en segmento {segment_id}: {e}")
-                continue
-        
-        return centers
-    
-    def _save_annotated_image(self, result, segment_id: int):
-        """Guarda la imagen con anotaciones usando numeración con padding."""
-        try:
-            annotated_img = result.plot()
-            
-            # Usar padding de 3 dígitos para orden correcto
-            padded_id = str(segment_id).zfill(3)
-            output_path = os.path.join(config.OUTPUT_DIR, f"result_{padded_id}.png")
-            
-            # Asegurar que el directorio existe
-            os.makedirs(config.OUTPUT_DIR, exist_ok=True)
-            
-            # Guardar imagen
-            success = cv2.imwrite(output_path, annotated_img)
-            
-            if not success:
-                logger.error(f"❌ Falló el guardado de result_{padded_id}.png")
-            
-        except Exception as e:
-            logger.error(f"Error guardando imagen anotada para segmento {segment_id}: {e}")
-    
-    def _count_saved_results(self) -> int:
-        """Cuenta cuántas imágenes result_XXX.png existen en segmented_results."""
-        try:
-            if not os.path.exists(config.OUTPUT_DIR):
-                return 0
-            
-            result_files = [f for f in os.listdir(config.OUTPUT_DIR) 
-                          if f.startswith('result_') and f.endswith('.png')]
-            return len(result_files)
-        except Exception as e:
-            logger.error(f"Error contando archivos de resultados: {e}")
-            return 0
-
-# ============================================================================
-# ANÁLISIS Y VISUALIZACIÓN OPTIMIZADOS
-# ============================================================================
-
-class DataAnalyzer:
-    """Maneja el análisis de datos y generación de visualizaciones."""
-    
-    @staticmethod
-    def calculate_distance_matrix_optimized(centers_df: pd.DataFrame) -> float:
-        """Calcula la distancia media entre centros de forma optimizada."""
-        if len(centers_df) < 2:
-            return 0.0
-        
-        points = centers_df[['Center X', 'Center Y']].values
-        
-        # Usar broadcasting vectorizado para mayor eficiencia
-        diff = points[:, np.newaxis, :] - points[np.newaxis, :, :]
-        distances_matrix = np.sqrt(np.sum(diff**2, axis=2))
-        
-        # Tomar solo la matriz triangular superior (sin diagonal)
-        upper_triangle = np.triu(distances_matrix, k=1)
-        distances = upper_triangle[upper_triangle > 0]
-        
-        return float(np.mean(distances)) if len(distances) > 0 else 0.0
-    
-    @staticmethod
-    def generate_visualization_optimized(df: pd.DataFrame, image_path: str) -> Dict[str, Any]:
-        """Genera visualizaciones optimizadas con mejor calidad."""
-        try:
-            # Configurar matplotlib para mejor calidad
-            plt.rcParams['figure.dpi'] = config.DPI
-            plt.rcParams['savefig.dpi'] = config.DPI
-            plt.rcParams['font.size'] = 12
-            
-            # Generar mapa de coordenadas
-            plot_path = DataAnalyzer._create_coordinates_plot(df, image_path)
-            
-            # Generar mapa de calor
-            heatmap_path = DataAnalyzer._create_heatmap(df, image_path)
-            
-            # Calcular estadísticas
-            stats = DataAnalyzer._calculate_statistics(df)
-            
-            return {
-                'plot_path': plot_path,
-                'heatmap_path': heatmap_path,
-                **stats
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generando visualizaciones: {e}")
-            raise
-    
-    @staticmethod
-    def _create_coordinates_plot(df: pd.DataFrame, image_path: str) -> str:
-        """Crea el mapa de coordenadas con mejor calidad."""
-        fig, ax = plt.subplots(figsize=config.FIGURE_SIZE)
-        
-        try:
-            # Cargar y mostrar imagen de fondo
-            image = plt.imread(image_path)
-            ax.imshow(image, extent=[0, image.shape[1], image.shape[0], 0], alpha=0.7)
-            
-            # Crear scatter plot con colores basados en área
-            areas = df['Ellipse Area (pixels^2)']
-            scatter = ax.scatter(df['Center X'], df['Center Y'], 
-                               c=areas, cmap='Reds', marker='o', s=20, alpha=0.8, edgecolors='black', linewidths=0.5)
-            
-            # Configurar plot
-            ax.set_title('Mapa de Coordenadas de Canales de Havers', fontsize=16, fontweight='bold')
-            ax.set_xlabel('Coordenada X (píxeles)', fontsize=14)
-            ax.set_ylabel('Coordenada Y (píxeles)', fontsize=14)
-            ax.grid(True, alpha=0.3)
-            ax.invert_yaxis()
-            
-            # Añadir colorbar
-            cbar = plt.colorbar(scatter, ax=ax)
-            cbar.set_label('Área del Canal (píxeles²)', fontsize=12)
-            
-            # Guardar con alta calidad
-            plot_filename = os.path.join(config.RESULTS_DIR, "mapa_coordenadas.png")
-            plt.savefig(plot_filename, format='png', dpi=config.DPI, bbox_inches='tight', 
-                       facecolor='white', edgecolor='none')
-            plt.close(fig)
-            
-            logger.info(f"Mapa de coordenadas guardado: {plot_filename}")
-            return plot_filename
-            
-        except Exception as e:
-            plt.close(fig)
-            logger.error(f"Error creando mapa de coordenadas: {e}")
-            raise
-    
-    @staticmethod
-    def _create_heatmap(df: pd.DataFrame, image_path: str) -> str:
-        """Crea el mapa de calor con mejor calidad."""
-        fig, ax = plt.subplots(figsize=config.FIGURE_SIZE)
-        
-        try:
-            # Cargar imagen de fondo
-            image = plt.imread(image_path)
-            ax.imshow(image, extent=[0, image.shape[1], image.shape[0], 0], alpha=0.5)
-            
-            # Crear mapa de calor
-            heatmap, xedges, yedges = np.histogram2d(
-                df['Center X'], df['Center Y'], 
-                bins=config.HEATMAP_BINS
-            )
-            
-            extent = [xedges[0], xedges[-1], yedges[0], yedges[-1]]
-            
-            # Mostrar mapa de calor
-            im = ax.imshow(heatmap.T, extent=extent, origin='lower', 
-                          cmap='hot', alpha=0.7, interpolation='gaussian')
-            
-            # Configurar plot
-            ax.set_title('Mapa de Densidad de Canales de Havers', fontsize=16, fontweight='bold')
-            ax.set_xlabel('Coordenada X (píxeles)', fontsize=14)
-            ax.set_ylabel('Coordenada Y (píxeles)', fontsize=14)
-            ax.grid(True, alpha=0.3)
-            ax.invert_yaxis()
-            
-            # Añadir colorbar
-            cbar = plt.colorbar(im, ax=ax)
-            cbar.set_label('Densidad de Canales', fontsize=12)
-            
-            # Guardar con alta calidad
-            heatmap_filename = os.path.join(config.RESULTS_DIR, "mapa_calor.png")
-            plt.savefig(heatmap_filename, format='png', dpi=config.DPI, bbox_inches='tight',
-                       facecolor='white', edgecolor='none')
-            plt.close(fig)
-            
-            logger.info(f"Mapa de calor guardado: {heatmap_filename}")
-            return heatmap_filename
-            
-        except Exception as e:
-            plt.close(fig)
-            logger.error(f"Error creando mapa de calor: {e}")
-            raise
-    
-    @staticmethod
-    def _calculate_statistics(df: pd.DataFrame) -> Dict[str, float]:
-        """Calcula estadísticas mejoradas de los datos."""
-        return {
-            'avg_area': float(df['Ellipse Area (pixels^2)'].mean()),
-            'median_area': float(df['Ellipse Area (pixels^2)'].median()),
-            'std_area': float(df['Ellipse Area (pixels^2)'].std()),
-            'min_area': float(df['Ellipse Area (pixels^2)'].min()),
-            'max_area': float(df['Ellipse Area (pixels^2)'].max()),
-            'count': int(len(df)),
-            'avg_distance': DataAnalyzer.calculate_distance_matrix_optimized(df)
-        }
-
-# ============================================================================
-# GESTIÓN DE DATOS MEJORADA
-# ============================================================================
-
-class DataManager:
-    """Gestiona el guardado y carga de datos."""
-    
-    @staticmethod
-    def save_results_to_excel_enhanced(detections: List[Tuple]) -> Tuple[str, pd.DataFrame]:
-        """Guarda resultados en Excel con formato mejorado."""
-        try:
-            # Crear DataFrame con mejor estructura
-            df = pd.DataFrame(detections, columns=[
-                'Center X', 'Center Y', 'Segment ID', 'Ellipse Area (pixels^2)'
-            ])
-            
-            # Añadir columnas calculadas
-            df['Area Category'] = pd.cut(df['Ellipse Area (pixels^2)'], 
-                                       bins=3, labels=['Pequeño', 'Medio', 'Grande'])
-            df['Detection Time'] = pd.Timestamp.now()
-            
-            # Ordenar por área descendente
-            df = df.sort_values('Ellipse Area (pixels^2)', ascending=False)
-            
-            # Guardar en ubicación principal
-            excel_path = os.path.join(config.EXCEL_DIR, 'bounding_box_centers_enhanced.xlsx')
-            
-            # Crear writer con múltiples hojas
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                # Hoja principal con datos
-                df.to_excel(writer, sheet_name='Detecciones', index=False)
-                
-                # Hoja con estadísticas
-                stats_df = pd.DataFrame({
-                    'Métrica': ['Total Canales', 'Área Promedio', 'Área Mediana', 
-                               'Desviación Estándar', 'Área Mínima', 'Área Máxima'],
-                    'Valor': [len(df), df['Ellipse Area (pixels^2)'].mean(),
-                             df['Ellipse Area (pixels^2)'].median(),
-                             df['Ellipse Area (pixels^2)'].std(),
-                             df['Ellipse Area (pixels^2)'].min(),
-                             df['Ellipse Area (pixels^2)'].max()]
-                })
-                stats_df.to_excel(writer, sheet_name='Estadísticas', index=False)
-            
-            # Crear copia de seguridad
-            backup_path = os.path.join(config.TECHNICAL_DIR, 'bounding_box_centers_backup.xlsx')
-            shutil.copy2(excel_path, backup_path)
-            
-            logger.info(f"Datos guardados en: {excel_path}")
-            logger.info(f"Copia de seguridad en: {backup_path}")
-            
-            return excel_path, df
-            
-        except Exception as e:
-            logger.error(f"Error guardando datos en Excel: {e}")
-            raise
-
 # ============================================================================
 # APLICACIÓN PRINCIPAL MEJORADA
 # ============================================================================
@@ -827,6 +144,14 @@ class DetectionApp:
         self.progress_window = None
         self.current_results = None
         self._app_destroyed = False
+        self._rescore_generation = 0
+        # Un único hilo para los recálculos de umbral: escriben los mismos mapas y Excel
+        self._rescore_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rescore")
+        self._rescore_excel_export = None
+        self._results_tab = 0
+        self._model_thread = None
+        self._model_loaded = None  # None mientras se carga en segundo plano
+        self._info_label = None
         
     def initialize(self):
         """Inicializa la aplicación."""
@@ -841,10 +166,8 @@ class DetectionApp:
             # Configurar protocolo de cierre
             self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
             
-            # Cargar modelo
-            if not self.model_manager.load_model():
-                messagebox.showerror("Error", "No se pudo cargar el modelo YOLO.\nVerifica que el archivo de modelo esté disponible.")
-                return False
+            # El modelo se carga en segundo plano; la pantalla principal no lo espera
+            self._start_model_loading()
             
             logger.info("Aplicación inicializada correctamente")
             return True
@@ -853,10 +176,54 @@ class DetectionApp:
             logger.error(f"Error inicializando aplicación: {e}")
             return False
     
+    def _start_model_loading(self):
+        """Carga el modelo (y torch/ultralytics) en un hilo aparte mientras la ventana ya responde."""
+        def load_in_background():
+            loaded = self.model_manager.load_model()
+            self._model_loaded = loaded
+            if loaded and self.model_manager.device != 'cuda':
+                logger.warning("CUDA no disponible, usando CPU (procesamiento más lento)")
+            if self._is_app_valid():
+                self.root.after(0, self._on_model_loaded)
+        
+        self._model_thread = threading.Thread(target=load_in_background, name="carga-modelo", daemon=True)
+        self._model_thread.start()
+    
+    def _on_model_loaded(self):
+        """Actualiza la información de la pantalla principal al terminar la carga del modelo."""
+        if not self._is_app_valid():
+            return
+        
+        try:
+            if self._info_label is not None and self._info_label.winfo_exists():
+                self._info_label.config(text=self._system_info_text())
+        except:
+            pass
+        
+        if not self._model_loaded:
+            messagebox.showerror("Error", "No se pudo cargar el modelo YOLO.\nVerifica que el archivo de modelo esté disponible.")
+    
+    def _wait_for_model(self) -> bool:
+        """Espera a que termine la carga del modelo en segundo plano; devuelve si se cargó."""
+        if self._model_thread is not None:
+            self._model_thread.join()
+        return bool(self._model_loaded)
+    
+    def _log_startup_time(self):
+        """Registra el tiempo hasta la ventana principal interactiva frente a STARTUP_BUDGET_S."""
+        elapsed = time.perf_counter() - _STARTUP_START
+        if elapsed > config.STARTUP_BUDGET_S:
+            logger.warning(f"⚠️ Ventana principal lista en {elapsed:.2f} s, por encima del presupuesto "
+                           f"de {config.STARTUP_BUDGET_S:.1f} s")
+        else:
+            logger.info(f"⏱️ Ventana principal lista en {elapsed:.2f} s (presupuesto {config.STARTUP_BUDGET_S:.1f} s)")
+    
     def _on_closing(self):
         """Maneja el cierre de la aplicación de forma segura."""
         try:
             self._app_destroyed = True
+            self.model_manager.close_worker_pool()
+            self._rescore_executor.shutdown(wait=False, cancel_futures=True)
             if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
                 try:
                     if self.progress_window.winfo_exists():
@@ -911,18 +278,12 @@ class DetectionApp:
         info_frame = Frame(main_frame, bg=config.BACKGROUND_COLOR)
         info_frame.pack(pady=20)
         
-        info_text = f"""
-🔬 Modelo YOLO cargado: {os.path.basename(self.model_manager.model_path)}
-💾 Uso de memoria: {MemoryManager.get_memory_usage():.1f} MB
-🖥️ GPU disponible: {'Sí' if torch.cuda.is_available() else 'No'}
-📊 Configuración: {config.NUM_SEGMENTS} segmentos, confianza {config.CONFIDENCE_THRESHOLD}
-        """
-        
-        info_label = Label(info_frame, text=info_text, 
+        info_label = Label(info_frame, text=self._system_info_text(), 
                           font=("Helvetica", 11), 
                           fg=config.TEXT_COLOR, bg=config.BACKGROUND_COLOR,
                           justify="left")
         info_label.pack()
+        self._info_label = info_label
         
         # Botón principal
         load_button = Button(main_frame, text="Seleccionar Imagen Histológica", 
@@ -937,6 +298,27 @@ class DetectionApp:
             UIManager.configure_button(results_button)
             results_button.pack(pady=10)
     
+    def _system_info_text(self) -> str:
+        """Información del sistema de la pantalla principal (el modelo puede estar cargándose aún)."""
+        if self._model_loaded is None:
+            model_line = "⏳ Cargando modelo YOLO en segundo plano..."
+            gpu_line = "🖥️ GPU disponible: comprobando..."
+        elif self._model_loaded:
+            model_line = f"🔬 Modelo YOLO cargado: {os.path.basename(self.model_manager.model_path)}"
+            if self.model_manager.uses_inference_daemon():
+                model_line += " (servidor de inferencia local)"
+            gpu_line = f"🖥️ GPU disponible: {'Sí' if self.model_manager.device == 'cuda' else 'No'}"
+        else:
+            model_line = "❌ No se pudo cargar el modelo YOLO"
+            gpu_line = "🖥️ GPU disponible: desconocido"
+        
+        return f"""
+{model_line}
+💾 Uso de memoria: {MemoryManager.get_memory_usage():.1f} MB
+{gpu_line}
+📊 Configuración: {f'{config.NUM_SEGMENTS} segmentos' if config.TILING_MODE == 'grid' else f'segmentos de {self.model_manager.input_size()} px'}, confianza {config.CONFIDENCE_THRESHOLD}
+        """
+    
     def select_and_process_image(self):
         """Selecciona y procesa una imagen con interfaz mejorada."""
         if not self._is_app_valid():
@@ -991,6 +373,9 @@ class DetectionApp:
             
         # Función de procesamiento en hilo separado
         def process_in_background():
+            slide = None
+            # Tiempos por etapa, latencia por segmento y pico de memoria de la pasada
+            metrics = RunMetrics(image_path)
             try:
                 # Verificar que la aplicación sigue válida
                 if not self._is_app_valid():
@@ -1005,7 +390,23 @@ class DetectionApp:
                     except:
                         pass
                 
-                processed_path = ImageProcessor.resize_image_if_needed(image_path)
+                # Decodificación única (o lector por ventanas para TIFF grandes):
+                # el mismo objeto pasa a todas las etapas
+                with metrics.stage('lectura'):
+                    slide, processed_path = ImageProcessor.open_slide(image_path, metrics)
+                
+                # La lámina se lee mientras termina la carga del modelo, si aún no ha acabado
+                if self._model_loaded is None:
+                    if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
+                        try:
+                            if self.progress_window.winfo_exists():
+                                status_label.config(text="Esperando a que termine la carga del modelo...")
+                                self.progress_window.update()
+                        except:
+                            pass
+                with metrics.stage('espera_modelo'):
+                    if not self._wait_for_model():
+                        raise ValueError("No se pudo cargar el modelo YOLO")
                 
                 # Paso 2: Segmentar imagen
                 if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
@@ -1016,21 +417,34 @@ class DetectionApp:
                     except:
                         pass
                 
-                segment_positions, width, height = ImageProcessor.divide_image_optimized(processed_path)
+                with metrics.stage('segmentacion'):
+                    segment_positions, width, height = ImageProcessor.divide_image_optimized(
+                        slide, tile_size=self.model_manager.input_size())
                 
                 # Paso 3: Procesar con YOLO - USANDO LA NUEVA FUNCIÓN SECUENCIAL
                 if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
                     try:
                         if self.progress_window.winfo_exists():
-                            status_label.config(text="Ejecutando análisis con IA (secuencial)...")
+                            status_label.config(text=f"Ejecutando análisis con IA (lotes de {config.INFERENCE_BATCH_SIZE})...")
                             self.progress_window.update()
                     except:
                         pass
                 
-                # CAMBIO CLAVE: Usar el nuevo método secuencial
-                detections = self.model_manager.process_all_segments_sequentially(segment_positions)
+                # Pool de procesos, pipeline por etapas, lotes o secuencial según la configuración;
+                # los segmentos sin tejido se omiten y las predicciones desde
+                # PREDICTION_FLOOR_THRESHOLD quedan en raw_detections. Cada segmento
+                # terminado se guarda en el punto de control; si la misma lámina se
+                # interrumpió antes, se continúa desde él
+                confidence_threshold = config.CONFIDENCE_THRESHOLD
+                checkpoint = DetectionCheckpoint.for_run(image_path, segment_positions, self.model_manager,
+                                                         confidence_threshold)
+                with metrics.stage('deteccion'):
+                    detections = self.model_manager.process_all_segments(segment_positions, confidence_threshold,
+                                                                         slide=slide, checkpoint=checkpoint,
+                                                                         metrics=metrics)
+                raw_detections = self.model_manager.raw_detections
                 
-                if not detections:
+                if len(detections) == 0:
                     logger.warning("No se detectaron canales de Havers en la imagen")
                     # No lanzar error, puede ser normal
                 
@@ -1043,12 +457,33 @@ class DetectionApp:
                     except:
                         pass
                 
-                if detections:
-                    excel_path, df = DataManager.save_results_to_excel_enhanced(detections)
+                slide_width, slide_height = ImageProcessor.slide_size(slide)
+                metadata = DataManager.build_run_metadata(image_path, slide_width, slide_height,
+                                                          self.model_manager, confidence_threshold,
+                                                          len(segment_positions))
+                with metrics.stage('guardado'):
+                    if len(raw_detections) > len(detections):
+                        DataManager.save_raw_predictions(raw_detections, metadata)
+                    if len(detections) > 0:
+                        data_path, df = DataManager.save_results(detections, metadata)
+                # Pasada completa y guardada: el punto de control solo sirve para reanudar interrupciones
+                if checkpoint is not None:
+                    checkpoint.discard()
+                
+                if len(detections) > 0:
+                    # El Excel se genera en segundo plano y no retrasa los resultados
+                    if config.EXPORT_EXCEL:
+                        excel_export = DataManager.export_excel_in_background(detections, metrics)
+                        excel_path = DataManager.excel_output_path()
+                    else:
+                        excel_export = None
+                        excel_path = None
                 else:
                     # Crear DataFrame vacío para casos sin detecciones
-                    df = pd.DataFrame(columns=['Center X', 'Center Y', 'Segment ID', 'Ellipse Area (pixels^2)'])
+                    df = DataManager.detections_to_dataframe(detections)
+                    data_path = None
                     excel_path = None
+                    excel_export = None
                 
                 # Paso 5: Generar visualizaciones (solo si hay detecciones)
                 if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
@@ -1059,29 +494,41 @@ class DetectionApp:
                     except:
                         pass
                 
+                # El fondo de los mapas se carga una vez y se reutiliza al cambiar el umbral
+                with metrics.stage('fondo_mapas'):
+                    map_background = DataAnalyzer.load_map_background(processed_path, slide)
                 if len(df) > 0:
-                    viz_results = DataAnalyzer.generate_visualization_optimized(df, processed_path)
+                    with metrics.stage('mapas'):
+                        viz_results = DataAnalyzer.generate_visualization_optimized(df, processed_path,
+                                                                                    background=map_background)
                 else:
-                    viz_results = {
-                        'plot_path': None,
-                        'heatmap_path': None,
-                        'avg_area': 0,
-                        'median_area': 0,
-                        'std_area': 0,
-                        'min_area': 0,
-                        'max_area': 0,
-                        'count': 0,
-                        'avg_distance': 0
-                    }
+                    viz_results = DataAnalyzer.empty_statistics()
+                
+                if isinstance(slide, SlideReader):
+                    slide.close()
+                
+                metrics.finish()
+                metrics.log_summary()
+                if config.SAVE_RUN_METRICS:
+                    metrics_path = metrics.save()
+                    logger.info(f"⏱️ Métricas guardadas en: {metrics_path}")
                 
                 # Combinar resultados
                 self.current_results = {
+                    'data_path': data_path,
                     'excel_path': excel_path,
+                    'excel_export': excel_export,
                     'processed_image_path': processed_path,
                     'original_image_path': image_path,
                     'dataframe': df,
+                    'raw_detections': raw_detections,
+                    'confidence_threshold': confidence_threshold,
+                    'metadata': metadata,
+                    'map_background': map_background,
+                    'num_segments': len(segment_positions),
                     **viz_results
                 }
+                self._results_tab = 0
                 
                 # Cerrar ventana de progreso de forma segura
                 if self.progress_window and hasattr(self.progress_window, 'winfo_exists'):
@@ -1108,6 +555,10 @@ class DetectionApp:
                     finally:
                         self.progress_window = None
                 
+                if isinstance(slide, SlideReader):
+                    slide.close()
+                metrics.finish()
+                
                 logger.error(f"Error en procesamiento: {e}")
                 
                 # Mostrar error solo si la aplicación sigue válida
@@ -1115,7 +566,6 @@ class DetectionApp:
                     self.root.after(100, lambda: self._show_error_and_return(str(e)))
         
         # Ejecutar en hilo separado para no bloquear la UI
-        import threading
         thread = threading.Thread(target=process_in_background)
         thread.daemon = True
         thread.start()
@@ -1149,6 +599,11 @@ class DetectionApp:
         # Pestaña 3: Acciones
         self._create_actions_tab(notebook)
         
+        # Mantener la pestaña activa al redibujar tras cambiar el umbral
+        notebook.select(self._results_tab)
+        notebook.bind("<<NotebookTabChanged>>",
+                      lambda event: setattr(self, '_results_tab', notebook.index(notebook.select())))
+        
         # Botón para volver
         back_button = Button(self.root, text="← Volver al Inicio", 
                            command=self.show_main_screen)
@@ -1166,17 +621,25 @@ class DetectionApp:
                      fg=config.TEXT_COLOR, bg=config.BACKGROUND_COLOR)
         title.pack(pady=20)
         
+        # Umbral de confianza ajustable sobre las predicciones ya calculadas
+        if self.current_results.get('raw_detections') is not None:
+            self._create_threshold_control(summary_frame)
+        
         # Métricas principales
         metrics_frame = Frame(summary_frame, bg=config.BACKGROUND_COLOR)
         metrics_frame.pack(fill="x", padx=20, pady=10)
         
         results = self.current_results
         
+        distance_text = f"{results['avg_distance']:.1f} px"
+        if results.get('distance_method') == 'sampled':
+            distance_text = f"{results['avg_distance']:.1f} ± {results['distance_error']:.1f} px"
+        
         # Crear tarjetas de métricas
         metrics = [
             ("Canales Detectados", f"{results['count']:,}", "🔬"),
             ("Área Promedio", f"{results['avg_area']:.1f} px²", "📏"),
-            ("Distancia Media", f"{results['avg_distance']:.1f} px", "📐"),
+            ("Distancia Media", distance_text, "📐"),
             ("Desv. Estándar", f"{results['std_area']:.1f} px²", "📊")
         ]
         
@@ -1189,8 +652,13 @@ class DetectionApp:
         💾 Tamaño Procesado: {os.path.getsize(results['processed_image_path']) / (1024*1024):.1f} MB
         """
         
+        if results.get('data_path'):
+            file_info += f"\n💾 Datos Guardados: {os.path.basename(results['data_path'])}"
+        
         if results.get('excel_path'):
-            file_info += f"\n📊 Excel Generado: {os.path.basename(results['excel_path'])}"
+            excel_export = results.get('excel_export')
+            excel_state = "generándose..." if excel_export and excel_export.is_alive() else "generado"
+            file_info += f"\n📊 Excel ({excel_state}): {os.path.basename(results['excel_path'])}"
         
         if results['count'] > 0:
             file_info += f"\n🎯 Rango de Áreas: {results['min_area']:.1f} - {results['max_area']:.1f} px²"
@@ -1201,6 +669,102 @@ class DetectionApp:
                           justify="left")
         info_label.pack(pady=20)
     
+    def _create_threshold_control(self, parent):
+        """Control del umbral de confianza: recuento inmediato al moverlo, recálculo completo al soltarlo."""
+        results = self.current_results
+        raw_confidences = results['raw_detections']['confidence']
+        floor_threshold = YOLOModelManager.prediction_floor_threshold(results['confidence_threshold'])
+        
+        control_frame = Frame(parent, bg=config.BACKGROUND_COLOR)
+        control_frame.pack(fill="x", padx=20)
+        
+        Label(control_frame, text="🎚️ Umbral de confianza:", font=("Helvetica", 11),
+              fg=config.TEXT_COLOR, bg=config.BACKGROUND_COLOR).pack(side="left")
+        
+        threshold_var = tk.DoubleVar(value=results['confidence_threshold'])
+        count_label = Label(control_frame, font=("Helvetica", 11),
+                            fg=config.TEXT_COLOR, bg=config.BACKGROUND_COLOR)
+        
+        def update_count(value=None):
+            threshold = threshold_var.get()
+            count = int(np.count_nonzero(raw_confidences > threshold))
+            count_label.config(text=f"{count:,} canales con confianza > {threshold:.2f}")
+        
+        scale = tk.Scale(control_frame, variable=threshold_var, from_=floor_threshold, to=1.0,
+                         resolution=0.01, orient="horizontal", length=300, command=update_count,
+                         bg=config.BACKGROUND_COLOR, fg=config.TEXT_COLOR, highlightthickness=0,
+                         troughcolor='#1a1a1a', activebackground=config.BUTTON_COLOR)
+        scale.pack(side="left", padx=10)
+        count_label.pack(side="left")
+        update_count()
+        
+        # Las estadísticas y los mapas se recalculan al soltar el control
+        scale.bind("<ButtonRelease-1>", lambda event: self._apply_confidence_threshold(threshold_var.get()))
+        scale.bind("<KeyRelease>", lambda event: self._apply_confidence_threshold(threshold_var.get()))
+    
+    def _apply_confidence_threshold(self, threshold: float):
+        """
+        Recalcula recuentos, estadísticas, mapas y datos guardados con otro umbral, sin reinferir.
+        
+        Los recálculos se ejecutan de uno en uno en `_rescore_executor`; los que
+        ya no corresponden al último umbral pedido se descartan antes de
+        escribir ningún archivo.
+        """
+        results = self.current_results
+        if not results or abs(threshold - results['confidence_threshold']) < 1e-9:
+            return
+        
+        self._rescore_generation += 1
+        generation = self._rescore_generation
+        
+        def is_current() -> bool:
+            return generation == self._rescore_generation and not self._app_destroyed
+        
+        def rescore_in_background():
+            try:
+                # Si mientras esperaba turno se pidió otro umbral, este ya no hace falta
+                if not is_current():
+                    return
+                detections, df, viz_results = DataAnalyzer.rescore_detections(
+                    results['raw_detections'], threshold, results['processed_image_path'],
+                    background=results['map_background'])
+                
+                # Solo se guarda el resultado del último umbral pedido
+                if not is_current():
+                    return
+                
+                metadata = dict(results['metadata'], confidence_threshold=threshold)
+                data_path, excel_path, excel_export = None, None, None
+                if len(detections) > 0:
+                    data_path, _ = DataManager.save_results(detections, metadata)
+                    if config.EXPORT_EXCEL:
+                        # El Excel y su copia en TECHNICAL_DIR no admiten dos exportaciones a la vez
+                        for previous in (results.get('excel_export'), self._rescore_excel_export):
+                            if previous is not None:
+                                previous.join()
+                        if not is_current():
+                            return
+                        excel_export = DataManager.export_excel_in_background(detections)
+                        excel_path = DataManager.excel_output_path()
+                        self._rescore_excel_export = excel_export
+                
+                rescored = dict(results, dataframe=df, confidence_threshold=threshold, metadata=metadata,
+                                data_path=data_path, excel_path=excel_path, excel_export=excel_export,
+                                **viz_results)
+                
+                def show_rescored():
+                    if is_current() and self._is_app_valid():
+                        self.current_results = rescored
+                        self.show_results_screen()
+                
+                if self._is_app_valid():
+                    self.root.after(0, show_rescored)
+                    
+            except Exception as e:
+                logger.error(f"Error recalculando con umbral {threshold:.2f}: {e}")
+        
+        self._rescore_executor.submit(rescore_in_background)
+    
     def _create_metric_card(self, parent, icon, label, value, index):
         """Crea una tarjeta de métrica."""
         card = Frame(parent, bg='#1a1a1a', relief="raised", bd=2)
@@ -1292,7 +856,7 @@ ANÁLISIS DE DISTRIBUCIÓN ESPACIAL
         segment_counts = df['Segment ID'].value_counts().sort_index()
         
         report += f"""
-Segmentos con detecciones: {len(segment_counts)} de {config.NUM_SEGMENTS}
+Segmentos con detecciones: {len(segment_counts)} de {self.current_results.get('num_segments', config.NUM_SEGMENTS)}
 Promedio de canales por segmento: {segment_counts.mean():.1f}
 Segmento con más canales: {segment_counts.idxmax()} ({segment_counts.max()} canales)
 Segmento con menos canales: {segment_counts.idxmin()} ({segment_counts.min()} canales)
@@ -1314,12 +878,13 @@ MÉTRICAS DE CALIDAD
 ------------------
 Coeficiente de variación: {(area_stats['std'] / area_stats['mean']) * 100:.1f}%
 Distancia media entre canales: {self.current_results['avg_distance']:.2f} px
+Método de cálculo de distancia: {self.current_results.get('distance_method', 'exact')} (± {self.current_results.get('distance_error', 0):.2f} px IC 95%, {self.current_results.get('distance_pairs', 0):,} pares)
 
 INFORMACIÓN TÉCNICA
 ------------------
 Tiempo de procesamiento: {time.strftime('%Y-%m-%d %H:%M:%S')}
-Umbral de confianza usado: {config.CONFIDENCE_THRESHOLD}
-Número de segmentos procesados: {config.NUM_SEGMENTS}
+Umbral de confianza usado: {self.current_results.get('confidence_threshold', config.CONFIDENCE_THRESHOLD)}
+Número de segmentos procesados: {self.current_results.get('num_segments', config.NUM_SEGMENTS)}
 Modelo utilizado: {os.path.basename(self.model_manager.model_path)}
 
 =================================================================
@@ -1346,7 +911,7 @@ Modelo utilizado: {os.path.basename(self.model_manager.model_path)}
         
         # Botones condicionalmente disponibles
         if self.current_results.get('excel_path'):
-            buttons.append(("📊 Abrir Excel con Datos", lambda: self._open_file(self.current_results['excel_path'])))
+            buttons.append(("📊 Abrir Excel con Datos", self._open_excel))
         
         if self.current_results.get('plot_path'):
             buttons.append(("🗺️ Ver Mapa de Coordenadas", lambda: self._open_file(self.current_results['plot_path'])))
@@ -1394,6 +959,16 @@ Modelo utilizado: {os.path.basename(self.model_manager.model_path)}
             logger.error(f"Error abriendo archivo {file_path}: {e}")
             messagebox.showerror("Error", f"No se pudo abrir el archivo: {e}")
     
+    def _open_excel(self):
+        """Abre el Excel de resultados, avisando si la exportación sigue en curso."""
+        excel_export = self.current_results.get('excel_export')
+        if excel_export is not None and excel_export.is_alive():
+            messagebox.showinfo("Excel en preparación",
+                                "El Excel todavía se está generando en segundo plano. "
+                                "Inténtalo de nuevo en unos segundos.")
+            return
+        self._open_file(self.current_results['excel_path'])
+    
     def run(self):
         """Ejecuta la aplicación principal."""
         if not self.initialize():
@@ -1402,6 +977,7 @@ Modelo utilizado: {os.path.basename(self.model_manager.model_path)}
         try:
             self.show_main_screen()
             if self._is_app_valid():
+                self.root.after_idle(self._log_startup_time)
                 self.root.mainloop()
         except Exception as e:
             logger.error(f"Error ejecutando aplicación: {e}")
@@ -1418,10 +994,6 @@ def main():
     """Función principal del programa mejorada."""
     app = None
     try:
-        # Verificar dependencias críticas
-        if not torch.cuda.is_available():
-            logger.warning("CUDA no disponible, usando CPU (procesamiento más lento)")
-        
         # Crear y ejecutar aplicación
         app = DetectionApp()
         app.run()
@@ -0,0 +1,91 @@
+"""
+Servidor de inferencia local: mantiene el modelo de canales de Havers cargado y caliente.
+
+Mientras está en marcha, la aplicación (improved_detection_app.py), el
+procesamiento por lotes (batch_detection.py) y cualquier otra herramienta que
+use YOLOModelManager le envían los lotes de segmentos en lugar de cargar el
+modelo en cada ejecución. Si no está en marcha, o sirve otros pesos u otro
+backend, cargan el modelo en su propio proceso como siempre.
+
+Ejemplos:
+    python inference_daemon.py
+    python inference_daemon.py --model weights.pt --backend openvino --address 127.0.0.1:47615
+    python inference_daemon.py --status
+    python inference_daemon.py --stop
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import List
+
+from detection_core import config, setup_logging, YOLOModelManager, InferenceDaemon, InferenceClient
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Servidor de inferencia local que mantiene el modelo YOLO cargado entre ejecuciones."
+    )
+    parser.add_argument('--address', default=config.INFERENCE_DAEMON_ADDRESS,
+                        help="'host:puerto', ruta de un socket Unix o tubería con nombre")
+    parser.add_argument('--model', help="Ruta de weights.pt (por defecto, config.MODEL_PATHS)")
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino', 'openvino-int8'],
+                        default=config.INFERENCE_BACKEND,
+                        help="Backend de inferencia (los clientes deben pedir el mismo)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Usar también la caché de predicciones en el servidor (los clientes ya la usan)")
+    parser.add_argument('--status', action='store_true',
+                        help="Mostrar la salud y las métricas del servidor en marcha y salir")
+    parser.add_argument('--stop', action='store_true',
+                        help="Detener el servidor en marcha")
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    """Punto de entrada del servidor; devuelve el código de salida."""
+    args = build_parser().parse_args(argv)
+    config.INFERENCE_DAEMON_ADDRESS = args.address
+    
+    running = InferenceClient.connect()
+    if args.status or args.stop:
+        if running is None:
+            print(f"No hay ningún servidor de inferencia en {args.address}", file=sys.stderr)
+            return 1
+        if args.stop:
+            running.request({'op': 'shutdown'})
+            print(f"Servidor de inferencia de {args.address} detenido (PID {running.health['pid']})")
+        else:
+            health = {key: value for key, value in running.health.items() if key != 'names'}
+            print(json.dumps({'health': health, 'metrics': running.metrics()}, indent=2))
+        running.close()
+        return 0
+    
+    if running is not None:
+        print(f"Ya hay un servidor de inferencia en {args.address} (PID {running.health['pid']})",
+              file=sys.stderr)
+        running.close()
+        return 1
+    
+    if args.model:
+        config.MODEL_PATHS = [args.model]
+    config.INFERENCE_BACKEND = args.backend
+    config.USE_PREDICTION_CACHE = args.cache
+    config.USE_INFERENCE_DAEMON = False  # El servidor carga su propio modelo
+    
+    model_manager = YOLOModelManager()
+    weights_path = model_manager.find_model_path()
+    if not weights_path:
+        return 1
+    
+    logger = setup_logging(os.path.join(os.path.dirname(os.path.abspath(weights_path)), "inference_daemon.log"))
+    if not model_manager.load_model():
+        logger.error("No se pudo cargar el modelo YOLO")
+        return 1
+    
+    try:
+        InferenceDaemon(model_manager).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""Configuración común de las pruebas de la aplicación de detección."""
+
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Los módulos de la aplicación se importan desde su carpeta, como al ejecutarla
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection_core import config, DETECTION_DTYPE  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def restore_config():
+    """Cada prueba parte de la configuración por defecto, aunque la modifique."""
+    saved = copy.deepcopy(config.__dict__)
+    yield config
+    config.__dict__.clear()
+    config.__dict__.update(saved)
+
+def make_detections(rows) -> np.ndarray:
+    """Array DETECTION_DTYPE a partir de tuplas (center_x, center_y, segment_id, confidence, width, height)."""
+    detections = np.zeros(len(rows), dtype=DETECTION_DTYPE)
+    for index, (center_x, center_y, segment_id, confidence, width, height) in enumerate(rows):
+        detections[index]['center_x'] = center_x
+        detections[index]['center_y'] = center_y
+        detections[index]['segment_id'] = segment_id
+        detections[index]['ellipse_area'] = np.pi * (width / 2) * (height / 2)
+        detections[index]['confidence'] = confidence
+        detections[index]['width'] = width
+        detections[index]['height'] = height
+    return detections
@@ -0,0 +1,32 @@
+"""Pruebas de las estadísticas de distancias entre canales."""
+
+import numpy as np
+import pytest
+
+from detection_core import DataAnalyzer
+
+pdist = pytest.importorskip('scipy.spatial.distance').pdist
+
+@pytest.mark.parametrize("n_points, memory_mb", [
+    (2, 1.0),
+    (7, 1.0),
+    (500, 0.01),  # Bloques de 20 puntos: varias filas y columnas de bloques, con bloque final incompleto
+    (1000, 64.0),  # Un único bloque
+])
+def test_mean_distance_blocked_matches_pdist(n_points, memory_mb):
+    points = np.random.default_rng(n_points).uniform(0, 10000, size=(n_points, 2))
+    expected = pdist(points)
+    
+    result = DataAnalyzer._mean_distance_blocked(points, memory_mb=memory_mb)
+    
+    assert result['distance_pairs'] == len(expected)
+    assert result['avg_distance'] == pytest.approx(expected.mean(), rel=1e-9)
+    assert result['distance_method'] == 'exact'
+
+def test_mean_distance_blocked_ignores_coincident_points():
+    points = np.array([[0.0, 0.0], [0.0, 0.0], [3.0, 4.0]])
+    
+    result = DataAnalyzer._mean_distance_blocked(points, memory_mb=1.0)
+    
+    assert result['distance_pairs'] == 2
+    assert result['avg_distance'] == pytest.approx(5.0)
@@ -0,0 +1,47 @@
+"""Pruebas de la muestra de segmentos para calibrar y evaluar la cuantización INT8."""
+
+import cv2
+import numpy as np
+
+from detection_core import config, YOLOModelManager
+
+def write_slides(directory, count: int):
+    paths = []
+    for index in range(count):
+        path = str(directory / f"lamina_{index}.png")
+        cv2.imwrite(path, np.random.default_rng(index).integers(0, 256, size=(300, 400, 3), dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+def test_evaluation_tiles_are_disjoint_from_calibration_and_use_every_slide(tmp_path):
+    config.set_base_dir(str(tmp_path))
+    config.TILING_MODE = 'grid'
+    config.NUM_SEGMENTS = 12
+    config.SEGMENT_COLS = 4
+    slides = write_slides(tmp_path, 3)
+    
+    calibration, calibration_indices = YOLOModelManager.sample_slide_tiles(slides, 15)
+    evaluation, evaluation_indices = YOLOModelManager.sample_slide_tiles(
+        slides, 9, exclude={path: set(indices) for path, indices in calibration_indices.items()}
+    )
+    
+    assert len(calibration) == 15 and len(evaluation) == 9
+    assert sorted(evaluation_indices) == sorted(slides)
+    for path in slides:
+        assert len(evaluation_indices[path]) == 3
+        assert not set(evaluation_indices[path]) & set(calibration_indices[path])
+
+def test_sample_slide_tiles_stops_at_available_tiles(tmp_path):
+    config.set_base_dir(str(tmp_path))
+    config.TILING_MODE = 'grid'
+    config.NUM_SEGMENTS = 12
+    config.SEGMENT_COLS = 4
+    slides = write_slides(tmp_path, 2)
+    
+    _, calibration_indices = YOLOModelManager.sample_slide_tiles(slides, 20)
+    # Solo quedan 4 segmentos sin usar de los 24
+    evaluation, _ = YOLOModelManager.sample_slide_tiles(
+        slides, 10, exclude={path: set(indices) for path, indices in calibration_indices.items()}
+    )
+    
+    assert len(evaluation) == 4
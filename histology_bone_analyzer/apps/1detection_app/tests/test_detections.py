@@ -0,0 +1,134 @@
+"""Pruebas de la fusión de detecciones entre segmentos, de la pasada gruesa y del cambio de umbral sin reinferir."""
+
+import numpy as np
+import pytest
+
+from detection_core import config, YOLOModelManager, SegmentTile, TileWindow, ArraySlideReader
+from conftest import make_detections
+
+def sort_detections(detections: np.ndarray) -> np.ndarray:
+    return np.sort(detections, order=['segment_id', 'center_x', 'center_y', 'confidence'])
+
+# ============================================================================
+# NMS GLOBAL
+# ============================================================================
+
+def test_merge_overlapping_detections_keeps_best_box_from_two_tiles():
+    # Segmentos 0 (x 0-640) y 1 (x 600-1240): el canal de x=620 lo ven los dos
+    detections = make_detections([
+        (200.0, 300.0, 0, 0.90, 40.0, 40.0),
+        (620.0, 300.0, 0, 0.60, 38.0, 40.0),  # Cortado por el borde del segmento 0
+        (622.0, 301.0, 1, 0.85, 40.0, 42.0),  # El mismo canal, completo en el segmento 1
+        (900.0, 100.0, 1, 0.70, 30.0, 30.0),
+        (660.0, 300.0, 1, 0.50, 40.0, 40.0),  # Vecino que apenas solapa: se conserva
+    ])
+    
+    merged = YOLOModelManager.merge_overlapping_detections(detections, iou_threshold=0.45)
+    
+    np.testing.assert_array_equal(merged, detections[[0, 2, 3, 4]])
+
+def test_merge_overlapping_detections_without_overlap_keeps_all():
+    detections = make_detections([(100.0 * i, 100.0, i % 2, 0.5, 20.0, 20.0) for i in range(1, 6)])
+    
+    np.testing.assert_array_equal(YOLOModelManager.merge_overlapping_detections(detections), detections)
+    assert len(YOLOModelManager.merge_overlapping_detections(detections[:0])) == 0
+
+# ============================================================================
+# PASADA GRUESA
+# ============================================================================
+
+def test_fine_inference_scale_follows_model_input_not_native_resolution():
+    slide = np.zeros((2000, 2000, 3), dtype=np.uint8)
+    # Rejilla de 1000 px: el modelo (640) ve cada segmento a 0.64 de la resolución nativa
+    grid = [SegmentTile(x, y, i, slide[y:y + 1000, x:x + 1000])
+            for i, (x, y) in enumerate([(0, 0), (1000, 0), (0, 1000), (1000, 1000)])]
+    # Ventana ya reducida a la mitad al leerla (TARGET_MPP)
+    window = TileWindow(ArraySlideReader(slide), 0, 0, 1280, 1280, output_size=(640, 640))
+    
+    assert YOLOModelManager.fine_inference_scale(grid, 640) == pytest.approx(0.64)
+    assert YOLOModelManager.fine_inference_scale([SegmentTile(0, 0, 0, window, 0.5)], 640) == pytest.approx(0.5)
+
+def test_build_roi_map_skips_overview_that_is_not_cheaper(tmp_path):
+    config.set_base_dir(str(tmp_path))
+    config.MODEL_INPUT_SIZE = 640
+    slide = np.zeros((1000, 1000, 3), dtype=np.uint8)
+    grid = [SegmentTile(x, y, i, slide[y:y + 500, x:x + 500])
+            for i, (x, y) in enumerate([(0, 0), (500, 0), (0, 500), (500, 500)])]
+    manager = YOLOModelManager()  # Sin modelo: la vista general no debe llegar a inferirse
+    
+    # Segmentos de 500 px ampliados a 640: la vista general (1 segmento) no baja de 1/4 de las inferencias
+    assert manager.build_roi_map(slide, 0.1, segment_positions=grid, max_inference_ratio=0.2) is None
+
+# ============================================================================
+# UMBRAL DE CONFIANZA SIN REINFERIR
+# ============================================================================
+
+@pytest.fixture(scope='module')
+def random_weights(tmp_path_factory):
+    """
+    Pesos YOLOv8n aleatorios con confianzas variadas (no se descarga nada).
+    
+    Recién inicializada, la red apaga las activaciones y todas las cajas salen
+    con la misma confianza; se calibran las BatchNorm con unas pasadas en modo
+    entrenamiento y el sesgo de clase deja unas decenas de cajas por segmento.
+    """
+    torch = pytest.importorskip('torch')
+    ultralytics = pytest.importorskip('ultralytics')
+    torch.manual_seed(0)
+    model = ultralytics.YOLO('yolov8n.yaml')
+    network = model.model
+    for module in network.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.momentum = None
+    network.train()
+    with torch.no_grad():
+        network(torch.rand(2, 3, 256, 256))
+    for branch in network.model[-1].cv3:
+        branch[-1].bias.data.fill_(-25.0)
+    network.eval()
+    
+    path = str(tmp_path_factory.mktemp('model') / 'weights.pt')
+    model.save(path)
+    return path
+
+@pytest.fixture
+def model_manager(random_weights, tmp_path):
+    config.set_base_dir(str(tmp_path))
+    config.MODEL_PATHS = [random_weights]
+    config.INFERENCE_BACKEND = 'torch'
+    config.USE_INFERENCE_DAEMON = False
+    config.USE_PREDICTION_CACHE = False
+    config.USE_WORKER_POOL = False
+    config.USE_STREAMING_PIPELINE = False
+    config.INFERENCE_BATCH_SIZE = 1
+    for directory in (config.OUTPUT_DIR, config.DATA_DIR):
+        (tmp_path / directory).mkdir(parents=True, exist_ok=True)
+    
+    manager = YOLOModelManager()
+    assert manager.load_model()
+    yield manager
+    manager.close_worker_pool()
+
+def test_apply_confidence_threshold_matches_rerun_at_higher_threshold(model_manager):
+    rng = np.random.default_rng(0)
+    slide = rng.integers(0, 256, size=(640, 1200, 3), dtype=np.uint8)
+    # Dos segmentos que se solapan 80 px, para que actúe también la NMS global
+    tiles = [SegmentTile(0, 0, 0, slide[:, :640]), SegmentTile(560, 0, 1, slide[:, 560:])]
+    
+    # Por debajo de max_det (300) por segmento, que recortaría las predicciones
+    low_threshold = config.PREDICTION_FLOOR_THRESHOLD = 1e-4
+    model_manager.process_all_segments(tiles, low_threshold)
+    raw = model_manager.raw_detections
+    assert 10 < len(raw) < 300
+    
+    # Umbrales iguales a la confianza de una predicción: el caso límite de la comparación
+    for high_threshold in np.quantile(raw['confidence'], [0.25, 0.5, 0.75], method='lower'):
+        high_threshold = float(high_threshold)
+        rescored = YOLOModelManager.apply_confidence_threshold(raw, high_threshold)
+        assert 0 < len(rescored) < len(raw)
+        
+        config.PREDICTION_FLOOR_THRESHOLD = high_threshold
+        rerun = model_manager.process_all_segments(tiles, high_threshold)
+        
+        assert len(rerun) == len(rescored)
+        np.testing.assert_allclose(sort_detections(rerun).tolist(), sort_detections(rescored).tolist(), rtol=1e-5)
@@ -0,0 +1,60 @@
+"""Pruebas del troceado de la lámina y de la máscara de tejido."""
+
+import numpy as np
+import pytest
+
+from detection_core import ImageProcessor, SegmentTile
+
+@pytest.mark.parametrize("length, region, stride, expected", [
+    (500, 640, 640, [0]),
+    (640, 640, 640, [0]),
+    (641, 640, 640, [0, 1]),
+    (1280, 640, 640, [0, 640]),
+    (1281, 640, 640, [0, 640, 641]),
+    (1000, 640, 560, [0, 360]),
+])
+def test_tile_starts_covers_axis_with_last_tile_on_edge(length, region, stride, expected):
+    starts = ImageProcessor._tile_starts(length, region, stride)
+    
+    assert starts == expected
+    assert starts[-1] + region >= length
+    assert all(b - a <= stride for a, b in zip(starts, starts[1:]))
+
+def grid_tiles(slide: np.ndarray, rows: int, cols: int):
+    """Segmentos en rejilla como vistas de la lámina."""
+    height, width = slide.shape[:2]
+    tile_height, tile_width = height // rows, width // cols
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            x, y = col * tile_width, row * tile_height
+            tiles.append(SegmentTile(x, y, row * cols + col, slide[y:y + tile_height, x:x + tile_width]))
+    return tiles
+
+@pytest.fixture
+def slide_with_tissue_corner():
+    """Portaobjetos blanco con tejido rosado solo en el segmento superior izquierdo."""
+    slide = np.full((800, 800, 3), 245, dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    slide[50:350, 50:350] = (180, 120, 200) + rng.integers(-10, 10, (300, 300, 3))
+    return slide
+
+def test_find_background_segments_skips_tiles_without_tissue(slide_with_tissue_corner):
+    tiles = grid_tiles(slide_with_tissue_corner, 2, 2)
+    
+    background = ImageProcessor.find_background_segments(slide_with_tissue_corner, tiles)
+    
+    assert background == {1, 2, 3}
+
+def test_find_background_segments_keeps_all_when_every_tile_is_background(slide_with_tissue_corner):
+    tiles = grid_tiles(slide_with_tissue_corner, 2, 2)
+    
+    # Ningún segmento alcanza la fracción pedida: se asume que la máscara ha fallado
+    background = ImageProcessor.find_background_segments(slide_with_tissue_corner, tiles, min_fraction=1.01)
+    
+    assert background == set()
+
+def test_find_background_segments_uniform_slide_is_all_tissue():
+    slide = np.full((600, 600, 3), 245, dtype=np.uint8)
+    
+    assert ImageProcessor.find_background_segments(slide, grid_tiles(slide, 3, 3)) == set()
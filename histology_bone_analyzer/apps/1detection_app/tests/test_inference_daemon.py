@@ -0,0 +1,51 @@
+"""Pruebas del reparto de lotes del servidor de inferencia durante la parada."""
+
+import threading
+
+import numpy as np
+
+from detection_core import InferenceDaemon
+
+class FailingModelManager:
+    """Sustituto del gestor del modelo: no debe llegar a usarse."""
+    
+    def _predict(self, sources, confidence_threshold):
+        raise AssertionError("el lote no debía llegar al modelo")
+
+def tiles(n: int):
+    return [np.zeros((8, 8, 3), dtype=np.uint8) for _ in range(n)]
+
+def test_submit_after_stop_is_rejected_without_queueing():
+    daemon = InferenceDaemon(FailingModelManager(), address='127.0.0.1:0')
+    daemon._stopping.set()
+    
+    response = daemon._submit(tiles(2), 0.25, timeout=5.0)
+    
+    assert response['ok'] is False and response['unavailable'] is True
+    assert daemon._jobs.empty()
+    assert daemon._pending_tiles == 0
+
+def test_jobs_queued_behind_sentinel_are_released():
+    daemon = InferenceDaemon(FailingModelManager(), address='127.0.0.1:0')
+    daemon._jobs.put(None)
+    responses = []
+    # Un lote que entró en la cola después del centinela
+    client = threading.Thread(target=lambda: responses.append(daemon._submit(tiles(3), 0.25, timeout=5.0)))
+    client.start()
+    while daemon._jobs.qsize() < 2:
+        pass
+    
+    daemon._inference_loop()
+    client.join(timeout=5.0)
+    
+    assert not client.is_alive()
+    assert responses[0]['ok'] is False and responses[0]['unavailable'] is True
+    assert daemon._pending_tiles == 0
+
+def test_submit_gives_up_after_timeout():
+    daemon = InferenceDaemon(FailingModelManager(), address='127.0.0.1:0')
+    
+    # Sin hilo del modelo, el lote nunca termina
+    response = daemon._submit(tiles(1), 0.25, timeout=0.05)
+    
+    assert response['ok'] is False and response['unavailable'] is True
@@ -0,0 +1,137 @@
+"""Pruebas de la caché de predicciones y del punto de control de la detección."""
+
+import json
+import os
+
+import numpy as np
+
+from detection_core import PredictionCache, DetectionCheckpoint, DETECTION_DTYPE
+from conftest import make_detections
+
+# ============================================================================
+# CACHÉ DE PREDICCIONES
+# ============================================================================
+
+def boxes(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(0, 640, size=(n, 6)).astype(np.float32)
+
+def test_prediction_cache_put_get_roundtrip(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_mb=10)
+    tile = np.zeros((64, 64, 3), dtype=np.uint8)
+    key = PredictionCache.make_key(tile, 'model|conf=0.25')
+    stored = boxes(5)
+    
+    assert cache.get(key) is None
+    cache.put(key, stored)
+    
+    np.testing.assert_array_equal(cache.get(key), stored)
+    # Otra instancia sobre la misma carpeta ve la entrada persistida
+    np.testing.assert_array_equal(PredictionCache(str(tmp_path), max_mb=10).get(key), stored)
+    assert cache.stats_summary()['hits'] == 1
+    assert cache.stats_summary()['misses'] == 1
+    assert cache.stats_summary()['writes'] == 1
+
+def test_prediction_cache_key_depends_on_pixels_and_settings():
+    tile = np.zeros((64, 64, 3), dtype=np.uint8)
+    other = tile.copy()
+    other[0, 0, 0] = 1
+    
+    key = PredictionCache.make_key(tile, 'a')
+    assert PredictionCache.make_key(tile.copy(), 'a') == key
+    assert PredictionCache.make_key(other, 'a') != key
+    assert PredictionCache.make_key(tile, 'b') != key
+
+def test_prediction_cache_evicts_least_recently_used(tmp_path):
+    entry_bytes = len(boxes(100).tobytes()) + 128  # Datos más cabecera .npy
+    cache = PredictionCache(str(tmp_path), max_mb=3.5 * entry_bytes / (1024 * 1024))
+    keys = [PredictionCache.make_key(np.full((8, 8), i, dtype=np.uint8), '') for i in range(4)]
+    
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, boxes(100, seed=i))
+        os.utime(cache._entry_path(key), (1000 + i, 1000 + i))
+    # Un acierto renueva la entrada más antigua
+    assert cache.get(keys[0]) is not None
+    
+    cache.put(keys[3], boxes(100, seed=3))
+    
+    assert cache.stats_summary()['evictions'] >= 1
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[3]) is not None
+    assert cache.stats_summary()['size_mb'] * 1024 * 1024 <= cache.max_bytes
+
+# ============================================================================
+# PUNTO DE CONTROL
+# ============================================================================
+
+RUN_KEY = {'slide_path': '/laminas/lamina1.tif', 'segments': 6, 'inference_threshold': 0.05}
+
+def segment_detections(segment_id: int) -> np.ndarray:
+    return make_detections([(100.0 * segment_id + i, 50.0, segment_id, 0.5, 20.0, 30.0) for i in range(segment_id)])
+
+def assert_completed(checkpoint: DetectionCheckpoint, segment_ids):
+    assert sorted(checkpoint.completed) == list(segment_ids)
+    for segment_id in segment_ids:
+        np.testing.assert_array_equal(checkpoint.completed[segment_id], segment_detections(segment_id))
+
+def test_checkpoint_resume_truncates_torn_line(tmp_path):
+    path = str(tmp_path / DetectionCheckpoint.FILENAME)
+    checkpoint = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    for segment_id in range(3):
+        checkpoint.append(segment_id, segment_detections(segment_id))
+    checkpoint.close()
+    
+    # Interrupción a mitad de la escritura del segmento 3
+    torn = '{"segment_id": 3, "detections": [[300.0, 50'
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(torn)
+    
+    resumed = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    assert_completed(resumed, range(3))
+    for segment_id in range(3, 6):
+        resumed.append(segment_id, segment_detections(segment_id))
+    resumed.close()
+    
+    # El resto de la línea cortada no queda pegado a la del segmento 3
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['segment_id'] for line in list(f)[1:]] == list(range(6))
+    assert_completed(DetectionCheckpoint(path, RUN_KEY, resume=True), range(6))
+
+def test_checkpoint_skips_corrupt_line_and_keeps_later_segments(tmp_path):
+    path = str(tmp_path / DetectionCheckpoint.FILENAME)
+    checkpoint = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    checkpoint.append(0, segment_detections(0))
+    checkpoint._file.write('no es json\n')
+    checkpoint.append(2, segment_detections(2))
+    checkpoint.close()
+    
+    assert_completed(DetectionCheckpoint(path, RUN_KEY, resume=True), [0, 2])
+
+def test_checkpoint_of_other_run_starts_from_scratch(tmp_path):
+    path = str(tmp_path / DetectionCheckpoint.FILENAME)
+    checkpoint = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    checkpoint.append(1, segment_detections(1))
+    checkpoint.close()
+    
+    other = DetectionCheckpoint(path, dict(RUN_KEY, inference_threshold=0.1), resume=True)
+    
+    assert other.completed == {}
+    other.close()
+    assert DetectionCheckpoint(path, RUN_KEY, resume=True).completed == {}
+
+def test_checkpoint_discard_removes_file(tmp_path):
+    path = str(tmp_path / DetectionCheckpoint.FILENAME)
+    checkpoint = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    checkpoint.append(0, np.empty(0, dtype=DETECTION_DTYPE))
+    
+    checkpoint.discard()
+    
+    assert not os.path.exists(path)
+
+def test_checkpoint_without_resume_overwrites(tmp_path):
+    path = str(tmp_path / DetectionCheckpoint.FILENAME)
+    checkpoint = DetectionCheckpoint(path, RUN_KEY, resume=True)
+    checkpoint.append(1, segment_detections(1))
+    checkpoint.close()
+    
+    assert DetectionCheckpoint(path, RUN_KEY, resume=False).completed == {}